@@ -1,17 +1,21 @@
-from src.app import app
-from src.ir_service.file_crawler import (
-    load_virtual_file_system,
-    update_virtual_file_system,
-    save_virtual_file_system,
-)
+import os
 
 if __name__ == "__main__":
-    load_virtual_file_system()
-    update_virtual_file_system()
-    save_virtual_file_system()
+    # Imported here: the indexing pipeline's worker processes import this
+    # file as __mp_main__ and must not load the app (and CLIP) with it
+    from src.app import app, start_background_services
+
+    use_reloader = True
+
+    # With the reloader on, this script runs twice: once as the file-watching
+    # parent and once as the child that serves requests. Only the child starts
+    # the model / crawl / watcher work.
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
+
     app.run(
         host="127.0.0.1",
         port=5000,
         debug=True,
-        use_reloader=True
+        use_reloader=use_reloader
     )
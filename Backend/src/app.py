@@ -1,68 +1,232 @@
 import json
-from flask import Flask, request, jsonify, Response
+import time
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
-from PIL import Image
-import io
+from functools import partial
 from collections import defaultdict
+from collections.abc import Mapping
 
 from src.ir_service.embeddings import (
     display_document_ids_in_vector_db,
-    retrieve_closest_doc
+    retrieve_closest_docs_batch,
+    retrieve_hybrid,
+    clip_model,
+    get_search_indexes,
+    warm_up
 )
 from src.ir_service.file_crawler import (
     load_virtual_file_system,
     update_virtual_file_system,
     save_virtual_file_system,
-    get_vfs
+    get_vfs,
+    crawl_lock
 )
+from src.ir_service.lexical_index import retrieve_keyword
+from src.ir_service.search_batcher import search_batcher
+from src.ir_service.metrics import metrics, server_timing
+from src.ir_service.config import TIMING_HEADER
+from src.ir_service.jobs import jobs
+from src.ir_service.startup import startup
+from src.ir_service.watcher import start_watcher
 
 app = Flask(__name__)
 CORS(app, origins="*")
 
+@app.before_request
+def _start_timing():
+    g.request_started = time.perf_counter()
+    g.timing_token = metrics.start_request()
+
+@app.after_request
+def _record_timing(response):
+    """Per-route latency histogram, and the stage breakdown as a Server-Timing header when enabled."""
+    if "timing_token" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    timings = metrics.end_request(g.timing_token)
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.observe("fre_http_request_duration_seconds", elapsed, method=request.method, route=route, status=response.status_code)
+    if TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
+
+@app.get("/metrics")
+def get_metrics():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.get("/")
 def ping():
     return jsonify(status="ok")
 
+def _refresh(job, full_scan: bool | None) -> dict:
+    with crawl_lock:
+        load_virtual_file_system()
+        stats = update_virtual_file_system(full_scan=full_scan, progress=job.update)
+        job.update("saving")
+        save_virtual_file_system()
+    return stats
+
+def _initial_crawl(job) -> dict:
+    with startup.phase("initial_crawl"):
+        return _refresh(job, None)
+
+def start_background_services():
+    """
+    Everything slow happens off the request path: the saved VFS is loaded
+    (searches work right away on the existing index), CLIP is loaded and the
+    index opened in the background, and the first crawl runs as a refresh job.
+    """
+    with startup.phase("vfs"):
+        load_virtual_file_system()
+    warm_up()
+    jobs.submit("refresh", _initial_crawl)
+    start_watcher()
+
+@app.get("/ready")
+def ready():
+    """
+    200 once CLIP is loaded and an index is open, 503 before that. `/` only
+    says the process is up. Reports the timings of the startup phases.
+    """
+    try:
+        index_open = bool(get_search_indexes())
+    except FileNotFoundError:
+        index_open = False
+
+    is_ready = clip_model.loaded and index_open
+    return jsonify({
+        "ready": is_ready,
+        "model_loaded": clip_model.loaded,
+        "index_open": index_open,
+        **startup.report()
+    }), 200 if is_ready else 503
+
 @app.get("/refresh")
 def setup():
-    load_virtual_file_system()
-    update_virtual_file_system()
-    save_virtual_file_system()
-    
+    # ?full=1 re-stats every file, catching in-place edits the incremental scan skips
+    full_scan = request.args.get("full", "0") in ("1", "true") or None
+
+    # Runs in the background; searches keep using the previous index and VFS until it finishes
+    job = jobs.submit("refresh", lambda job: _refresh(job, full_scan))
+
     return jsonify({
-        "status": "ok",
-        "message": "File System updated and stored successfully!"
-    })
+        "status": "accepted",
+        "job_id": job.id,
+        "message": "File System update started."
+    }), 202
+
+@app.get("/refresh/<string:job_id>")
+def refresh_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job.to_dict())
 
 @app.get("/docs")
 def get_all_docs():
     docs = display_document_ids_in_vector_db()
     return jsonify(docs)
 
+def _format_results(result: list[tuple[int, float]], vfs_by_docId: Mapping[str, dict]) -> dict[float, list[dict]]:
+    """Group (doc_id, score) hits by score, highest first, with each document's metadata."""
+    res = defaultdict(list)
+    with metrics.timer("http.format"):
+        output = []
+        for id, score in result:
+            output.append((id, score))
+        output.sort(key=lambda x: x[1], reverse=True)
+
+        for id, score in output:
+            # One store lookup per hit
+            metadata = vfs_by_docId.get(str(id))
+            if metadata is None:
+                # Hidden by the index until the VFS lists it; kept as a safeguard
+                continue
+            res[score].append({
+                "filename": metadata["filename"],
+                "path": metadata["path"],
+                "extension": metadata["extension"],
+                "size": metadata["size"],
+                "last_modified": metadata["last_modified"],
+            })
+    return res
+
+def _json_response(res) -> Response:
+    with metrics.timer("http.serialize"):
+        json_data = json.dumps(res, indent=4, sort_keys=False)
+    return Response(json_data, mimetype='application/json')
+
+# ?mode= of /search: CLIP only, BM25 only (no model involved), or both fused.
+# Semantic searches of concurrent requests are micro-batched. Query strings
+# from clients are always text, never paths of files on the server.
+_SEARCH_MODES = {
+    "semantic": partial(search_batcher.retrieve_closest_doc, allow_paths=False),
+    "keyword": retrieve_keyword,
+    "hybrid": retrieve_hybrid,
+}
+
 @app.get("/search/<string:query>")
 def search_docs(query):
+    mode = request.args.get("mode", "semantic")
+    if mode not in _SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(_SEARCH_MODES)}"}), 400
+
     vfs_by_docId, _ = get_vfs()
 
-    res = defaultdict(list)
+    result = _SEARCH_MODES[mode](query, k=6)
+    res = _format_results(result, vfs_by_docId)
 
-    result = retrieve_closest_doc(query, k=6)
-    output = []
-    for id, score in result:
-        output.append((id, score))
-    output.sort(key=lambda x: x[1], reverse=True)
-    
-    for id, score in output:
-        res[score].append({
-            "filename": vfs_by_docId[str(id)]["filename"],
-            "path": vfs_by_docId[str(id)]["path"],
-            "extension": vfs_by_docId[str(id)]["extension"],
-            "size": vfs_by_docId[str(id)]["size"],
-            "last_modified": vfs_by_docId[str(id)]["last_modified"],
-        })
+    return _json_response(res)
 
-    json_data = json.dumps(res, indent=4, sort_keys=False)
+@app.post("/search/batch")
+def search_batch():
+    """
+    Many queries in one request: a JSON body {"queries": [...], "k": 6}, or a
+    multipart form with "queries" fields and / or "images" files. Returns one
+    result object per query (texts first, then images), shaped like /search,
+    or {"error": ...} for a query that could not be searched (e.g. an
+    unreadable image).
+    """
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        queries = body.get("queries", [])
+        k = body.get("k", 6)
+    else:
+        queries = request.form.getlist("queries")
+        k = request.form.get("k", 6)
+        queries += [image_file.read() for image_file in request.files.getlist("images")]
 
-    return Response(json_data, mimetype='application/json')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "No queries provided"}), 400
+    if not all(isinstance(q, (str, bytes)) and q for q in queries):
+        return jsonify({"error": "Queries must be non-empty strings or images"}), 400
+
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+    if k < 1:
+        return jsonify({"error": "k must be at least 1"}), 400
+
+    vfs_by_docId, _ = get_vfs()
+    try:
+        results = retrieve_closest_docs_batch(queries, k=k, allow_paths=False)
+    except ValueError:
+        # An unreadable image: search the queries one by one so that only it fails
+        results = []
+        for query in queries:
+            try:
+                results.append(retrieve_closest_docs_batch([query], k=k, allow_paths=False)[0])
+            except ValueError as e:
+                results.append(e)
+    res = [
+        {"error": str(result)} if isinstance(result, ValueError) else _format_results(result, vfs_by_docId)
+        for result in results
+    ]
+
+    return _json_response(res)
 
 @app.post("/search-by-image")
 def search_by_image():
@@ -75,29 +239,14 @@ def search_by_image():
     
     try:
         image_bytes = image_file.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
         
         vfs_by_docId, _ = get_vfs()
-        result = retrieve_closest_doc(img, k=6)
+        result = search_batcher.retrieve_closest_doc(image_bytes, k=6, allow_paths=False)
         print(result)
         
-        res = defaultdict(list)
-        output = []
-        for id, score in result:
-            output.append((id, score))
-        output.sort(key=lambda x: x[1], reverse=True)
+        res = _format_results(result, vfs_by_docId)
         
-        for id, score in output:
-            res[score].append({
-            "filename": vfs_by_docId[str(id)]["filename"],
-            "path": vfs_by_docId[str(id)]["path"],
-            "extension": vfs_by_docId[str(id)]["extension"],
-            "size": vfs_by_docId[str(id)]["size"],
-            "last_modified": vfs_by_docId[str(id)]["last_modified"],
-        })
-        
-        json_data = json.dumps(res, indent=4, sort_keys=False)
-        return Response(json_data, mimetype='application/json')
+        return _json_response(res)
     
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
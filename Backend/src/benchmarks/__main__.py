@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from src.benchmarks.corpus import FORMATS, generate_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Metrics shown by `compare`, as paths into one size's results
+_COMPARED = [
+    ("indexing", "docs_per_s"),
+    ("indexing", "vectors_per_s"),
+    ("indexing", "peak_rss_bytes"),
+    ("indexing", "index_bytes"),
+    ("indexing", "noop_refresh_s"),
+]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args) -> dict:
+    """
+    For every corpus size: generate (or reuse) the corpus, then index and
+    query it in a separate process with its own working directory, so each
+    size starts from an empty index and reports its own peak RSS.
+    """
+    workdir = os.path.abspath(args.workdir)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sizes": [],
+    }
+
+    for size in args.sizes:
+        corpus_root = os.path.join(workdir, f"corpus-{size}-s{args.seed}")
+        generate_corpus(
+            corpus_root, size, tuple(args.formats), args.sentences_per_doc,
+            args.words_per_sentence, args.images_per_doc, args.image_size, args.seed
+        )
+
+        run_dir = os.path.join(workdir, f"run-{size}")
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir)
+        out = os.path.join(run_dir, "result.json")
+
+        print(f"Benchmarking {size} documents in '{run_dir}'")
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")]))}
+        subprocess.run(
+            [sys.executable, "-m", "src.benchmarks.measure", corpus_root, "--out", out,
+             "--queries", str(args.queries), "--k", str(args.k), "--seed", str(args.seed),
+             "--concurrency", *map(str, args.concurrency)],
+            cwd=run_dir, env=env, check=True,
+        )
+        with open(out, "r") as f:
+            results["sizes"].append(json.load(f))
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Wrote {args.out}")
+    return results
+
+
+def _metrics(size_result: dict) -> dict[str, float]:
+    metrics = {f"{section}.{name}": size_result[section][name] for section, name in _COMPARED}
+    for target, summary in size_result["latency"].items():
+        for name in ("p50_ms", "p95_ms", "p99_ms"):
+            metrics[f"latency.{target}.{name}"] = summary.get(name)
+    for target, summary in size_result.get("concurrency", {}).items():
+        for name in ("qps", "p50_ms", "p99_ms"):
+            metrics[f"concurrency.{target}.{name}"] = summary.get(name)
+    for name, value in size_result["recall"].items():
+        if "recall@" in name:
+            metrics[f"recall.{name}"] = value
+    return metrics
+
+
+def compare(baseline_path: str, candidate_path: str):
+    """Print every metric of two result files side by side, per corpus size."""
+    with open(baseline_path, "r") as f:
+        baseline = {r["documents"]: r for r in json.load(f)["sizes"]}
+    with open(candidate_path, "r") as f:
+        candidate = {r["documents"]: r for r in json.load(f)["sizes"]}
+
+    for size in sorted(baseline.keys() & candidate.keys()):
+        print(f"\n{size} documents")
+        old, new = _metrics(baseline[size]), _metrics(candidate[size])
+        for name in (name for name in old if name in new):
+            a, b = old[name], new[name]
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a:+.1%}" if a else ""
+            print(f"  {name:<60} {a:>14.4g} {b:>14.4g} {change:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexing / search benchmarks on synthetic corpora")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="benchmark one or more corpus sizes")
+    run_cmd.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    run_cmd.add_argument("--workdir", default="benchmark_runs")
+    run_cmd.add_argument("--out", default="benchmark_results.json")
+    run_cmd.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    run_cmd.add_argument("--sentences-per-doc", type=int, default=40)
+    run_cmd.add_argument("--words-per-sentence", type=int, default=12)
+    run_cmd.add_argument("--images-per-doc", type=float, default=1.0)
+    run_cmd.add_argument("--image-size", type=int, default=256)
+    run_cmd.add_argument("--queries", type=int, default=200)
+    run_cmd.add_argument("--k", type=int, default=10)
+    run_cmd.add_argument("--seed", type=int, default=0)
+    run_cmd.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="parallel callers for the throughput test")
+
+    compare_cmd = sub.add_parser("compare", help="compare two result files")
+    compare_cmd.add_argument("baseline")
+    compare_cmd.add_argument("candidate")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmarks(args)
+    else:
+        compare(args.baseline, args.candidate)
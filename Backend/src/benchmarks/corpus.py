@@ -0,0 +1,188 @@
+import io
+import os
+import json
+import argparse
+import fitz
+import numpy as np
+from docx import Document
+from docx.shared import Inches
+from PIL import Image, ImageDraw
+
+# Synthetic corpora for the benchmarks. Everything is drawn from one seeded
+# generator, so the same parameters always produce the same files.
+
+FORMATS = ("txt", "pdf", "docx", "png")
+
+_SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+
+# Sentences per PDF page / DOCX paragraph
+_PAGE_SENTENCES = 25
+
+
+def _vocabulary(rng: np.random.Generator, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES, rng.integers(2, 4))))
+    return sorted(words)
+
+
+def _sentence(rng: np.random.Generator, topic: list[str], common: list[str], words_per_sentence: int) -> str:
+    n = max(3, int(rng.normal(words_per_sentence, words_per_sentence / 4)))
+    # Mostly the document's topic words, so queries have a best document
+    words = [topic[rng.integers(len(topic))] if rng.random() < 0.6 else common[rng.integers(len(common))] for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def _image(rng: np.random.Generator, size: int) -> bytes:
+    """A PNG of random coloured shapes."""
+    image = Image.new("RGB", (size, size), tuple(int(c) for c in rng.integers(0, 256, 3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.integers(3, 9)):
+        x0, y0 = rng.integers(0, size, 2)
+        x1, y1 = (x0, y0) + rng.integers(size // 8, size // 2, 2)
+        colour = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.rectangle((int(x0), int(y0), int(x1), int(y1)), fill=colour)
+        else:
+            draw.ellipse((int(x0), int(y0), int(x1), int(y1)), fill=colour)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _write_pdf(path: str, sentences: list[str], images: list[bytes]):
+    doc = fitz.open()
+    for i in range(0, len(sentences), _PAGE_SENTENCES):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), " ".join(sentences[i:i + _PAGE_SENTENCES]), fontsize=9)
+    for image in images:
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(50, 50, 350, 350), stream=image)
+    doc.save(path)
+    doc.close()
+
+
+def _write_docx(path: str, sentences: list[str], images: list[bytes]):
+    doc = Document()
+    for i in range(0, len(sentences), _PAGE_SENTENCES):
+        doc.add_paragraph(" ".join(sentences[i:i + _PAGE_SENTENCES]))
+    for image in images:
+        doc.add_picture(io.BytesIO(image), width=Inches(2.5))
+    doc.save(path)
+
+
+def generate_corpus(
+    root: str,
+    num_docs: int,
+    formats: tuple[str, ...] = FORMATS,
+    sentences_per_doc: int = 40,
+    words_per_sentence: int = 12,
+    images_per_doc: float = 1.0,
+    image_size: int = 256,
+    seed: int = 0,
+    reuse: bool = True,
+) -> dict:
+    """
+    Write `num_docs` files under `root`, cycling through `formats`. Text
+    documents get about `sentences_per_doc` sentences, PDF / DOCX files
+    additionally a Poisson(`images_per_doc`) number of `image_size` images.
+    Also writes `corpus.json` (not indexed) with the parameters, the files and
+    sample queries: a phrase from every text document and every PNG file.
+    Returns that description. With `reuse`, a corpus already generated under
+    `root` with the same parameters is kept as is.
+    """
+    if unknown := set(formats) - set(FORMATS):
+        raise ValueError(f"Unknown formats: {', '.join(sorted(unknown))}")
+
+    params = {
+        "num_docs": num_docs,
+        "formats": list(formats),
+        "sentences_per_doc": sentences_per_doc,
+        "words_per_sentence": words_per_sentence,
+        "images_per_doc": images_per_doc,
+        "image_size": image_size,
+        "seed": seed,
+    }
+    description_path = os.path.join(root, "corpus.json")
+    if reuse and os.path.exists(description_path):
+        with open(description_path, "r") as f:
+            corpus = json.load(f)
+        if corpus["params"] == params:
+            return corpus
+
+    rng = np.random.default_rng(seed)
+    vocabulary = _vocabulary(rng, 5000)
+    common = vocabulary[:500]
+    num_topics = max(1, num_docs // 10)
+    topics = [list(rng.choice(vocabulary[500:], 40, replace=False)) for _ in range(num_topics)]
+
+    os.makedirs(root, exist_ok=True)
+    documents, queries = [], []
+    for i in range(num_docs):
+        fmt = formats[i % len(formats)]
+        path = os.path.join(root, f"doc{i:06d}.{fmt}")
+        topic = topics[rng.integers(num_topics)]
+
+        sentences, images = [], []
+        if fmt != "png":
+            count = max(1, int(rng.normal(sentences_per_doc, sentences_per_doc / 2)))
+            sentences = [_sentence(rng, topic, common, words_per_sentence) for _ in range(count)]
+        if fmt in ("pdf", "docx"):
+            images = [_image(rng, image_size) for _ in range(rng.poisson(images_per_doc))]
+
+        if fmt == "txt":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(" ".join(sentences))
+        elif fmt == "pdf":
+            _write_pdf(path, sentences, images)
+        elif fmt == "docx":
+            _write_docx(path, sentences, images)
+        else:
+            with open(path, "wb") as f:
+                f.write(_image(rng, image_size))
+
+        if sentences:
+            words = sentences[rng.integers(len(sentences))].rstrip(".").split()
+            start = rng.integers(max(1, len(words) - 6))
+            queries.append({"text": " ".join(words[start:start + 6]).lower(), "path": path})
+        if fmt == "png":
+            queries.append({"image": path, "path": path})
+
+        documents.append({
+            "path": path,
+            "format": fmt,
+            "sentences": len(sentences),
+            "images": len(images) + (fmt == "png"),
+            "bytes": os.path.getsize(path),
+        })
+
+    corpus = {
+        "params": params,
+        "bytes": sum(d["bytes"] for d in documents),
+        "sentences": sum(d["sentences"] for d in documents),
+        "images": sum(d["images"] for d in documents),
+        "documents": documents,
+        "queries": queries,
+    }
+    with open(description_path, "w") as f:
+        json.dump(corpus, f, indent=4)
+    print(f"Generated {num_docs} documents ({corpus['bytes'] / 2**20:.1f} MiB) under '{root}'")
+    return corpus
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus for the benchmarks")
+    parser.add_argument("root")
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--sentences-per-doc", type=int, default=40)
+    parser.add_argument("--words-per-sentence", type=int, default=12)
+    parser.add_argument("--images-per-doc", type=float, default=1.0)
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_corpus(
+        args.root, args.docs, tuple(args.formats), args.sentences_per_doc,
+        args.words_per_sentence, args.images_per_doc, args.image_size, args.seed
+    )
@@ -0,0 +1,261 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import numpy as np
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app import app
+from src.ir_service import config, embeddings, file_crawler
+from src.ir_service.index_layout import is_vector_partition
+from src.ir_service.index_store import get_search_indexes, get_search_snapshot
+from src.ir_service.index_tools import export_vectors
+from src.ir_service.search_batcher import SearchBatcher
+from src.ir_service.vector_store import get_exact_store
+
+# Runs inside a fresh working directory (see `python -m src.benchmarks`):
+# the index, VFS and stores are all created relative to it.
+
+INDEX_PATH = "faiss_index.idx"
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak resident set size of this process, when the platform reports it."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def _file_bytes(*patterns: str) -> int:
+    return sum(os.path.getsize(path) for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Milliseconds: count, mean and p50 / p95 / p99 of `latencies` (seconds)."""
+    ms = 1000 * np.asarray(latencies)
+    if len(ms) == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
+
+
+def measure_indexing(corpus_root: str) -> dict:
+    """
+    Index `corpus_root` from scratch through `update_virtual_file_system`,
+    then refresh it again without changes. Reports throughput, peak RSS and
+    the size of what was written.
+    """
+    root = os.path.join(corpus_root, "")
+    start = time.perf_counter()
+    file_crawler.load_virtual_file_system()
+    stats = file_crawler.update_virtual_file_system(root, full_scan=True)
+    file_crawler.save_virtual_file_system()
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    file_crawler.update_virtual_file_system(root, full_scan=True)
+    refresh = time.perf_counter() - start
+
+    indexes = get_search_indexes(INDEX_PATH)
+    vectors = sum(index.ntotal for partition, index in indexes.items() if is_vector_partition(partition))
+    stem = os.path.splitext(INDEX_PATH)[0]
+    return {
+        "seconds": round(elapsed, 3),
+        "documents": stats["documents"],
+        "vectors": vectors,
+        "docs_per_s": round(stats["documents"] / elapsed, 3),
+        "vectors_per_s": round(vectors / elapsed, 3),
+        "noop_refresh_s": round(refresh, 3),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "index_bytes": _file_bytes(f"{stem}.*.idx", f"{stem}.exact.*"),
+        "lexical_bytes": _file_bytes("lexical_index.db*"),
+        "vfs_bytes": _file_bytes("virtual_file_system.db*"),
+        "crawl_stats": stats,
+    }
+
+
+def _queries(corpus: dict, num_queries: int, seed: int) -> tuple[list[str], list]:
+    """A seeded sample of the corpus' text queries, and its image queries (as bytes)."""
+    rng = np.random.default_rng(seed)
+    texts = sorted({q["text"] for q in corpus["queries"] if "text" in q})
+    texts = [texts[i] for i in rng.permutation(len(texts))[:num_queries]]
+
+    images = []
+    for q in corpus["queries"]:
+        if "image" in q and len(images) < max(1, num_queries // 4):
+            with open(q["image"], "rb") as f:
+                images.append(f.read())
+    return texts, images
+
+
+def measure_latency(texts: list[str], k: int, batch_size: int = 16) -> dict:
+    """
+    p50 / p95 / p99 latency of `retrieve_closest_doc` (encoding included,
+    then with the query embedding precomputed) and of the Flask search routes.
+    The query embedding cache is cleared before every pass so that each
+    query is encoded once per pass.
+    """
+    for i in range(3):
+        embeddings.retrieve_closest_doc(f"warm up {i}", INDEX_PATH, k)
+
+    def timed(run, items) -> dict:
+        embeddings.query_cache.clear()
+        latencies = []
+        for item in items:
+            start = time.perf_counter()
+            run(item)
+            latencies.append(time.perf_counter() - start)
+        return summarize(latencies)
+
+    q_emb, is_image = embeddings.encode_queries(texts)
+    client = app.test_client()
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    results = {
+        "retrieve_closest_doc": timed(lambda q: embeddings.retrieve_closest_doc(q, INDEX_PATH, k), texts),
+        "vector_search": timed(
+            lambda row: embeddings._search_documents(q_emb[row:row + 1], bool(is_image[row]), INDEX_PATH, k),
+            range(len(texts)),
+        ),
+    }
+    for mode in ("semantic", "keyword", "hybrid"):
+        results[f"GET /search?mode={mode}"] = timed(
+            lambda q: client.get(f"/search/{quote(q, safe='')}?mode={mode}").get_data(), texts
+        )
+    results[f"POST /search/batch ({batch_size} queries)"] = timed(
+        lambda batch: client.post("/search/batch", json={"queries": batch, "k": k}).get_data(), batches
+    )
+    return results
+
+
+def measure_concurrency(texts: list[str], k: int, concurrency: list[int]) -> dict:
+    """
+    Throughput (queries / s) and p50 / p95 / p99 latency of `retrieve_closest_doc`
+    under `concurrency` parallel callers, each call searched on its own
+    ("direct") and through a `SearchBatcher` with the configured wait window
+    and batch size ("batched").
+    """
+    batcher = SearchBatcher()
+    searches = {
+        "direct": embeddings.retrieve_closest_doc,
+        "batched": batcher.retrieve_closest_doc if batcher.enabled else None,
+    }
+
+    def call(run, query) -> float:
+        start = time.perf_counter()
+        run(query, INDEX_PATH, k)
+        return time.perf_counter() - start
+
+    results = {}
+    for threads in concurrency:
+        for name, run in searches.items():
+            if run is None:
+                continue
+            embeddings.query_cache.clear()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                start = time.perf_counter()
+                latencies = list(pool.map(lambda q: call(run, q), texts))
+                elapsed = time.perf_counter() - start
+            results[f"{name}@{threads}"] = {"qps": round(len(texts) / elapsed, 3), **summarize(latencies)}
+    return results
+
+
+def _exact_vectors() -> tuple[np.ndarray, np.ndarray]:
+    """Every stored (ids, full-precision vectors) pair of the published index."""
+    exported = [export_vectors(index) for partition, index in get_search_indexes(INDEX_PATH).items() if is_vector_partition(partition)]
+    ids = np.concatenate([i for i, _ in exported])
+    vectors = np.concatenate([v for _, v in exported])
+
+    store = get_exact_store(INDEX_PATH)
+    if store is not None:
+        exact, found = store.lookup(ids)
+        vectors = np.where(found[:, None], exact, vectors)
+    return ids, vectors
+
+
+def measure_recall(queries: list, ks: list[int]) -> dict:
+    """
+    Document-level recall@k of the search path as configured
+    (`_search_documents_batch`, approximate when the index layout is) and
+    of two-stage search over COARSE_CANDIDATES (100 when it is off) candidate
+    documents, against an exact brute-force ranking of every stored vector
+    with the same document scoring.
+    """
+    ids, vectors = _exact_vectors()
+    _, tombstones = get_search_snapshot(INDEX_PATH)
+    q_emb, is_image = embeddings.encode_queries(queries)
+    k_max = max(ks)
+
+    exact = [
+        [doc_id for doc_id, _ in embeddings._rank_documents(vectors @ q_emb[row], ids, bool(is_image[row]), k_max, tombstones=tombstones)]
+        for row in range(len(queries))
+    ]
+    searches = {
+        "search": embeddings._search_documents_batch(q_emb, is_image, INDEX_PATH, k_max),
+        "two_stage": embeddings._search_documents_batch(q_emb, is_image, INDEX_PATH, k_max, candidates=config.COARSE_CANDIDATES or 100),
+    }
+
+    results = {}
+    for name, found in searches.items():
+        for k in ks:
+            hits = [len(set(t[:k]) & {doc_id for doc_id, _ in f[:k]}) / max(1, len(t[:k])) for t, f in zip(exact, found)]
+            results[f"{name}_recall@{k}"] = round(float(np.mean(hits)), 4)
+    results["queries"] = len(queries)
+    return results
+
+
+def _settings() -> dict:
+    return {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+
+def run(corpus_root: str, num_queries: int = 200, k: int = 10, seed: int = 0, concurrency: tuple[int, ...] = (1, 8, 32)) -> dict:
+    """Index the corpus under `corpus_root`, then measure latency, throughput under load and recall."""
+    with open(os.path.join(corpus_root, "corpus.json"), "r") as f:
+        corpus = json.load(f)
+
+    indexing = measure_indexing(corpus_root)
+    texts, images = _queries(corpus, num_queries, seed)
+    return {
+        "documents": corpus["params"]["num_docs"],
+        "corpus": {key: corpus[key] for key in ("params", "bytes", "sentences", "images")},
+        "settings": _settings(),
+        "python": platform.python_version(),
+        "indexing": indexing,
+        "latency": measure_latency(texts, k),
+        "concurrency": measure_concurrency(texts, k, list(concurrency)),
+        "recall": measure_recall(texts + images, sorted({1, 5, k})),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark one corpus in the current directory")
+    parser.add_argument("corpus")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    result = run(args.corpus, args.queries, args.k, args.seed, tuple(args.concurrency))
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=4)
@@ -0,0 +1,164 @@
+import os
+import re
+import argparse
+import importlib.util
+
+from src.ir_service.config import CHUNK_TOKENS, CHUNK_OVERLAP, CHUNK_MIN_TOKENS
+
+# Kept free of torch / CLIP model imports: chunking runs in the pipeline's
+# parser processes. CLIP's BPE tokenizer is loaded straight from its source
+# file, which only needs ftfy / regex.
+
+# CLIP's text context is 77 tokens, including the start / end tokens
+CLIP_CONTEXT_TOKENS = 77
+
+# Rough stand-in for the BPE tokenizer when the clip package is missing
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _clip_tokenizer():
+    """CLIP's SimpleTokenizer, without importing the `clip` package (and torch)."""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        try:
+            spec = importlib.util.find_spec("clip")
+            if spec is not None and spec.submodule_search_locations:
+                path = os.path.join(list(spec.submodule_search_locations)[0], "simple_tokenizer.py")
+                module_spec = importlib.util.spec_from_file_location("_clip_simple_tokenizer", path)
+                module = importlib.util.module_from_spec(module_spec)
+                module_spec.loader.exec_module(module)
+                _tokenizer = module.SimpleTokenizer()
+        except Exception as e:
+            print(f"Warning: CLIP tokenizer unavailable ({e}); approximating token counts")
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Number of CLIP BPE tokens in `text`, without the start / end tokens."""
+    tokenizer = _clip_tokenizer()
+    if tokenizer is None:
+        return len(_APPROX_TOKEN.findall(text))
+    return len(tokenizer.encode(text))
+
+
+def chunking_signature(max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP, min_tokens: int = CHUNK_MIN_TOKENS) -> str:
+    """Identifies the chunking settings; stored text vectors are only valid for the same settings."""
+    if max_tokens <= 0:
+        return "sentences"
+    return f"w{max_tokens}-o{overlap}-m{min_tokens}"
+
+
+def _split_long(sentence: str, max_tokens: int) -> list[tuple[str, int]]:
+    """Cut a sentence longer than `max_tokens` at word boundaries instead of letting CLIP truncate it."""
+    pieces = []
+    words, total = [], 0
+    for word in sentence.split():
+        # A single over-long "word" (URL, table row) is still cut by CLIP
+        n = min(count_tokens(word), max_tokens)
+        if words and total + n > max_tokens:
+            pieces.append((" ".join(words), total))
+            words, total = [], 0
+        words.append(word)
+        total += n
+    if words:
+        pieces.append((" ".join(words), total))
+    return pieces
+
+
+def pack_sentences(
+    sentences: list[str],
+    max_tokens: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP,
+    min_tokens: int = CHUNK_MIN_TOKENS,
+) -> list[str]:
+    """
+    Pack consecutive sentences into chunks of at most `max_tokens` CLIP
+    tokens, one vector each. Sentences longer than that are split at word
+    boundaries. Each chunk repeats up to `overlap` tokens of trailing
+    sentences from the previous one. A final chunk shorter than `min_tokens`
+    is extended backwards with earlier sentences. `max_tokens` <= 0 keeps
+    one chunk per sentence.
+    """
+    if max_tokens <= 0:
+        return list(sentences)
+
+    units: list[tuple[str, int]] = []
+    for sentence in sentences:
+        n = count_tokens(sentence)
+        if n == 0:
+            continue
+        units.extend(_split_long(sentence, max_tokens) if n > max_tokens else [(sentence, n)])
+
+    windows: list[tuple[int, int, int]] = []
+    start = 0
+    while start < len(units):
+        end, total = start, 0
+        while end < len(units) and total + units[end][1] <= max_tokens:
+            total += units[end][1]
+            end += 1
+        windows.append((start, end, total))
+        if end >= len(units):
+            break
+
+        # Carry trailing sentences over, always moving forward by at least one
+        next_start, carried = end, 0
+        while next_start - 1 > start and carried + units[next_start - 1][1] <= overlap:
+            next_start -= 1
+            carried += units[next_start][1]
+        start = next_start
+
+    if len(windows) > 1 and windows[-1][2] < min_tokens:
+        start, end, total = windows[-1]
+        while start > 0 and total < min_tokens and total + units[start - 1][1] <= max_tokens:
+            start -= 1
+            total += units[start][1]
+        windows[-1] = (start, end, total)
+
+    return [" ".join(text for text, _ in units[start:end]) for start, end, _ in windows]
+
+
+def report(root: str, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP, min_tokens: int = CHUNK_MIN_TOKENS) -> dict[str, int]:
+    """Print text vectors per document under `root`: one per sentence vs. packed chunks."""
+    # Imported here: document_parser depends on this module
+    from src.ir_service.document_parser import SUPPORTED_EXTENSIONS, read_content, split_sentences
+
+    totals = {"documents": 0, "sentences": 0, "chunks": 0}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] not in SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                text, _ = read_content(path)
+            except Exception as e:
+                print(f"{path}: {e}")
+                continue
+
+            sentences = split_sentences(text) if text.strip() else []
+            chunks = pack_sentences(sentences, max_tokens, overlap, min_tokens)
+            print(f"{path}: {len(sentences)} sentence vectors -> {len(chunks)} chunk vectors")
+            totals["documents"] += 1
+            totals["sentences"] += len(sentences)
+            totals["chunks"] += len(chunks)
+
+    if totals["documents"]:
+        print(
+            f"{totals['documents']} documents: {totals['sentences'] / totals['documents']:.1f} -> "
+            f"{totals['chunks'] / totals['documents']:.1f} text vectors per document "
+            f"({totals['chunks'] / max(totals['sentences'], 1):.0%})"
+        )
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare text vectors per document with and without sentence packing")
+    parser.add_argument("root", nargs="?", default="../data/")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS or CLIP_CONTEXT_TOKENS - 2)
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--min-tokens", type=int, default=CHUNK_MIN_TOKENS)
+    args = parser.parse_args()
+    report(args.root, args.max_tokens, args.overlap, args.min_tokens)
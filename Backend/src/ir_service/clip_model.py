@@ -0,0 +1,44 @@
+import threading
+
+from src.ir_service.startup import startup
+
+
+class ClipModel:
+    """
+    CLIP, loaded on first use instead of at import time.
+
+    torch and clip are only imported by `load`, so importing the search
+    modules stays cheap. Thread-safe: concurrent callers wait for a single load.
+    """
+
+    def __init__(self, name: str = "ViT-B/32"):
+        self.name = name
+        self.torch = None
+        self.clip = None
+        self.device = None
+        self.preprocess = None
+        self.model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> "ClipModel":
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    with startup.phase("model"):
+                        import torch
+                        import clip
+
+                        device = "cuda" if torch.cuda.is_available() else "cpu"
+                        model, preprocess = clip.load(self.name, device=device)
+                        model.eval()
+
+                        self.torch, self.clip, self.device = torch, clip, device
+                        self.preprocess = preprocess
+                        # Assigned last: `loaded` means everything is set
+                        self.model = model
+                    print(f"Loaded CLIP {self.name} on {self.device}")
+        return self
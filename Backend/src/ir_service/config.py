@@ -0,0 +1,128 @@
+import os
+
+# Settings for the indexing / search engine. Each one can be overridden with
+# an environment variable of the same name prefixed with "FRE_".
+
+
+def _env(name: str, default, cast=str):
+    value = os.environ.get(f"FRE_{name}")
+    return default if value is None else cast(value)
+
+
+# FAISS index layout, as a faiss.index_factory string:
+# "Flat" (exact), "HNSW32", "IVF4096,Flat", "IVF4096,PQ64", ...
+INDEX_FACTORY: str = _env("INDEX_FACTORY", "Flat")
+
+# Default search-time knobs for approximate indexes
+NPROBE: int = _env("NPROBE", 16, int)
+EF_SEARCH: int = _env("EF_SEARCH", 64, int)
+
+# Number of stored vectors sampled to train IVF / PQ indexes
+TRAIN_SAMPLE_SIZE: int = _env("TRAIN_SAMPLE_SIZE", 100_000, int)
+
+# How vectors are stored inside the FAISS index: "float32", "float16",
+# "sq8" (8-bit scalar quantization) or "pq<m>" (product quantization, e.g. "pq64")
+VECTOR_STORAGE: str = _env("VECTOR_STORAGE", "float32")
+
+# With compressed storage, how many candidates are re-scored against the
+# exact on-disk vectors (0 disables re-ranking)
+RERANK_K: int = _env("RERANK_K", 300, int)
+
+# Query embedding cache: max entries, time-to-live in seconds (0 = never
+# expires) and an optional .npz file that keeps the cache across restarts
+QUERY_CACHE_SIZE: int = _env("QUERY_CACHE_SIZE", 1024, int)
+QUERY_CACHE_TTL: float = _env("QUERY_CACHE_TTL", 3600, float)
+QUERY_CACHE_PATH: str = _env("QUERY_CACHE_PATH", "")
+
+# Content-addressed embedding store used to skip re-encoding unchanged,
+# renamed or duplicated files ("" disables it)
+CONTENT_STORE_DIR: str = _env("CONTENT_STORE_DIR", "embedding_store")
+
+# Incremental crawler: file caching directory listings between runs ("" keeps
+# them in memory only), threads used to list / stat, and how often (seconds) a
+# full scan re-stats every file to catch in-place edits (0 = always)
+SCAN_CACHE_PATH: str = _env("SCAN_CACHE_PATH", "scan_cache.json")
+SCAN_WORKERS: int = _env("SCAN_WORKERS", 8, int)
+FULL_SCAN_INTERVAL: float = _env("FULL_SCAN_INTERVAL", 3600, float)
+
+# File watcher: on/off, seconds a path must be quiet before it is re-indexed,
+# minimum seconds between two indexing runs and max files per run
+WATCH_ENABLED: int = _env("WATCH_ENABLED", 1, int)
+WATCH_DEBOUNCE: float = _env("WATCH_DEBOUNCE", 2.0, float)
+WATCH_MIN_INTERVAL: float = _env("WATCH_MIN_INTERVAL", 5.0, float)
+WATCH_MAX_BATCH: int = _env("WATCH_MAX_BATCH", 64, int)
+
+# Document extraction: embedded images (PDF / DOCX) whose shorter side is
+# below MIN_IMAGE_SIZE pixels are skipped as decorative; extractors yield at
+# most EXTRACT_BATCH_SIZE pages / images at a time. PDF / DOCX files are
+# parsed as several tasks: text of at most PDF_TASK_PAGES pages each, and
+# images in groups of EXTRACT_BATCH_SIZE
+MIN_IMAGE_SIZE: int = _env("MIN_IMAGE_SIZE", 32, int)
+EXTRACT_BATCH_SIZE: int = _env("EXTRACT_BATCH_SIZE", 16, int)
+PDF_TASK_PAGES: int = _env("PDF_TASK_PAGES", 64, int)
+
+# CLIP inference backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime,
+# exported from the PyTorch model on first use and cached in
+# ENCODER_CACHE_DIR). ENCODER_QUANTIZE=1 runs int8 dynamically quantized
+# towers; ENCODER_THREADS sets intra-op threads (0 = library default). An
+# ONNX backend whose embeddings fall below ENCODER_COS_TOLERANCE cosine
+# similarity to PyTorch is not used.
+ENCODER_BACKEND: str = _env("ENCODER_BACKEND", "torch")
+ENCODER_QUANTIZE: int = _env("ENCODER_QUANTIZE", 0, int)
+ENCODER_THREADS: int = _env("ENCODER_THREADS", 0, int)
+ENCODER_CACHE_DIR: str = _env("ENCODER_CACHE_DIR", "encoder_cache")
+ENCODER_COS_TOLERANCE: float = _env("ENCODER_COS_TOLERANCE", 0.98, float)
+
+# SQLite database holding the virtual file system (document metadata and
+# doc ids); a legacy virtual_file_system.json is imported into it once
+VFS_DB_PATH: str = _env("VFS_DB_PATH", "virtual_file_system.db")
+
+# Deleted documents are only tombstoned (filtered out at search time); a
+# background compaction physically removes them once their vectors exceed
+# this fraction of the index
+COMPACT_THRESHOLD: float = _env("COMPACT_THRESHOLD", 0.2, float)
+
+# The index is split into this many shards by doc_id % INDEX_SHARDS (per
+# modality); a crawl only rewrites the shards it touched, and queries search
+# the shards in parallel on SEARCH_THREADS threads (0 = one per CPU core)
+INDEX_SHARDS: int = _env("INDEX_SHARDS", 4, int)
+SEARCH_THREADS: int = _env("SEARCH_THREADS", 0, int)
+
+# Two-stage search: queries first rank documents on their centroids (one
+# mean vector per document and modality), then re-score only the vectors of
+# the COARSE_CANDIDATES best documents. Approximate, so off by default (0 =
+# always search every vector); check `index_tools recall --candidates` first
+COARSE_CANDIDATES: int = _env("COARSE_CANDIDATES", 0, int)
+
+# BM25 inverted index over the crawled text and file names ("" disables
+# it), used by keyword and hybrid search. Hybrid search runs the vector search
+# only over the LEXICAL_CANDIDATES best keyword hits and fuses both rankings
+# with reciprocal rank fusion (score = sum of 1 / (RRF_K + rank))
+LEXICAL_DB_PATH: str = _env("LEXICAL_DB_PATH", "lexical_index.db")
+BM25_K1: float = _env("BM25_K1", 1.2, float)
+BM25_B: float = _env("BM25_B", 0.75, float)
+LEXICAL_CANDIDATES: int = _env("LEXICAL_CANDIDATES", 1000, int)
+RRF_K: int = _env("RRF_K", 60, int)
+
+# Text chunking: consecutive sentences are packed into chunks of at most
+# CHUNK_TOKENS CLIP tokens (75 + start / end tokens fill CLIP's 77-token
+# context), repeating up to CHUNK_OVERLAP tokens of the previous chunk; a
+# last chunk under CHUNK_MIN_TOKENS is extended backwards. 0 (the default)
+# keeps one vector per sentence. Changing these re-encodes every document on
+# the next refresh, so packing is opt-in for existing indexes.
+CHUNK_TOKENS: int = _env("CHUNK_TOKENS", 0, int)
+CHUNK_OVERLAP: int = _env("CHUNK_OVERLAP", 0, int)
+CHUNK_MIN_TOKENS: int = _env("CHUNK_MIN_TOKENS", 8, int)
+
+# Counters / histograms of indexing and search stages, served at /metrics in
+# the Prometheus text format. TIMING_HEADER=1 adds a Server-Timing header with
+# the per-stage breakdown to every response.
+METRICS_ENABLED: int = _env("METRICS_ENABLED", 1, int)
+TIMING_HEADER: int = _env("TIMING_HEADER", 0, int)
+
+# Concurrent semantic searches (/search, /search-by-image) are micro-batched:
+# the oldest waiting query holds its batch open for up to SEARCH_BATCH_WAIT_MS
+# milliseconds, and at most SEARCH_BATCH_SIZE queries are encoded and searched
+# together (1 = no batching, every request searches on its own thread)
+SEARCH_BATCH_WAIT_MS: float = _env("SEARCH_BATCH_WAIT_MS", 2.0, float)
+SEARCH_BATCH_SIZE: int = _env("SEARCH_BATCH_SIZE", 32, int)
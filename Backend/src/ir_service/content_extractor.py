@@ -3,10 +3,11 @@ from src.ir_service.embeddings import (
     embed_text,
     embed_image
 )
-from PIL import Image
-import fitz
-import io
-from docx import Document
+from src.ir_service.document_parser import (
+    extract_pdf,
+    extract_doc
+)
+from src.ir_service.metrics import metrics, timed_iter
 
 def extract_and_embed_txt(file_path: str, doc_id: int):
     embed_text(file_path, doc_id)
@@ -14,42 +15,27 @@ def extract_and_embed_txt(file_path: str, doc_id: int):
 def extract_and_embed_image(file_path: str, doc_id: int):
     embed_image(file_path, doc_id)
 
-def extract_and_embed_pdf(file_path: str, doc_id: int):
-    doc = fitz.open(file_path)
-    all_text = ""
-    images = []
-
-    for page in doc:
-        all_text += page.get_text()
+def _embed_batches(batches, doc_id: int):
+    """Embed (text, images) batches as they are extracted, numbering vectors across batches."""
+    num_sentences = 0
+    num_images = 0
+    # Extraction and decoding happen while the next batch is produced
+    for text, images in timed_iter(batches, lambda seconds: metrics.record_stage("parse.extract", seconds)):
+        if text.strip():
+            num_sentences += embed_text(text, doc_id, start=num_sentences)
+        if images:
+            num_images += embed_image(images, doc_id, start=num_images)
 
-        for img in page.get_images(full=True):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
+    if num_sentences == 0 and num_images == 0:
+        raise ValueError("No sentences or images were extracted from the document.")
 
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            images.append(image)
 
-    embed_text(all_text, doc_id)
-    embed_image(images, doc_id)
+def extract_and_embed_pdf(file_path: str, doc_id: int):
+    _embed_batches(extract_pdf(file_path), doc_id)
 
 
 def extract_and_embed_doc(file_path: str, doc_id: int):
-    doc = Document(file_path)
-    all_text = ""
-    images = []
-
-    for para in doc.paragraphs:
-        all_text += para.text + "\n"
-
-    for rel in doc.part.rels.values():
-        if "image" in rel.reltype:
-            image_data = rel.target_part.blob
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
-            images.append(image)
-    
-    embed_text(all_text, doc_id)
-    embed_image(images, doc_id)
+    _embed_batches(extract_doc(file_path), doc_id)
 
 
 def extract_and_embed(file_path: str, doc_id: int):
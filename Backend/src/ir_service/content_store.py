@@ -0,0 +1,169 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+
+from src.ir_service.config import CONTENT_STORE_DIR
+from src.ir_service.chunking import chunking_signature
+
+# Kept free of torch / CLIP imports: `has_image` is called from the
+# pipeline's parser processes.
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContentStore:
+    """
+    Content-addressed store of CLIP embeddings (and, for documents, the term
+    frequencies of their text for the lexical index).
+
+    Documents are keyed by the hash of the file, images by the hash of their
+    encoded bytes (including images pulled out of PDFs / DOCX). A renamed,
+    touched or duplicated file reuses the stored vectors instead of running
+    CLIP again. Everything lives under `root`, namespaced by model and by
+    encoder (`<model>-<encoder>` for anything but the PyTorch one), as
+    `docs/<hh>/<hash>.npz` and `images/<hh>/<hash>.npy`. Documents are
+    further namespaced by the text chunking settings (`docs-<signature>`),
+    since their text vectors depend on them.
+    """
+
+    def __init__(self, root: str, encoder: str, model_name: str = "ViT-B/32", chunking: str | None = None):
+        namespace = model_name.replace("/", "-")
+        # PyTorch embeddings are what the store held before other encoders existed
+        if encoder != "torch":
+            namespace = f"{namespace}-{encoder}"
+        self.root = os.path.join(root, namespace)
+        if chunking is None:
+            chunking = chunking_signature()
+        # One vector per sentence is what the store held before chunking existed
+        self.docs_dir = "docs" if chunking == "sentences" else f"docs-{chunking}"
+
+    def _path(self, kind: str, key: str, ext: str) -> str:
+        if kind == "docs":
+            kind = self.docs_dir
+        return os.path.join(self.root, kind, key[:2], f"{key}{ext}")
+
+    @staticmethod
+    def _write(path: str, save, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.path.splitext(path)[1]}"
+        save(tmp_path, data)
+        os.replace(tmp_path, path)
+
+    def has_document(self, key: str) -> bool:
+        return os.path.exists(self._path("docs", key, ".npz"))
+
+    def get_document(self, key: str) -> dict | None:
+        """
+        {"text": [N, 512], "images": [M, 512], "image_hashes": [M], "terms": {term: tf}}
+        or None. "terms" is None for entries stored before term frequencies were kept.
+        """
+        path = self._path("docs", key, ".npz")
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            terms = None
+            if "terms" in data:
+                terms = {str(t): int(tf) for t, tf in zip(data["terms"], data["term_counts"])}
+            return {
+                "text": data["text"],
+                "images": data["images"],
+                "image_hashes": [str(h) for h in data["image_hashes"]],
+                "terms": terms,
+            }
+
+    def put_document(self, key: str, text_emb: np.ndarray, image_emb: np.ndarray, image_hashes: list[str], terms: dict[str, int] | None = None):
+        entry = {
+            "text": np.asarray(text_emb, dtype=np.float32).reshape(-1, 512),
+            "images": np.asarray(image_emb, dtype=np.float32).reshape(-1, 512),
+            "image_hashes": np.array(image_hashes, dtype=str),
+        }
+        if terms is not None:
+            entry["terms"] = np.array(list(terms), dtype=str)
+            entry["term_counts"] = np.array(list(terms.values()), dtype=np.int32)
+        self._write(self._path("docs", key, ".npz"), lambda path, data: np.savez(path, **data), entry)
+
+    def has_image(self, key: str) -> bool:
+        return os.path.exists(self._path("images", key, ".npy"))
+
+    def get_image(self, key: str) -> np.ndarray | None:
+        path = self._path("images", key, ".npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def put_image(self, key: str, emb: np.ndarray):
+        self._write(self._path("images", key, ".npy"), np.save, np.asarray(emb, dtype=np.float32))
+
+    def remove_documents(self, keys: set[str]) -> int:
+        """
+        Delete the documents stored under `keys`. The images they referred to
+        are left for `prune`, which knows what every live document uses.
+        Returns the number of files removed.
+        """
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self._path("docs", key, ".npz"))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def prune(self, live_keys: set[str]) -> int:
+        """
+        Delete documents whose key is not in `live_keys` (and every document
+        stored under other chunking settings), and images no live document
+        refers to. Reads every live document: runs with index compaction,
+        not on every crawl. Returns the number of files removed.
+        """
+        removed = 0
+        live_images: set[str] = set()
+
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            if name.startswith("docs") and name != self.docs_dir:
+                for dirpath, _, filenames in os.walk(os.path.join(self.root, name)):
+                    removed += len(filenames)
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+        docs_dir = os.path.join(self.root, self.docs_dir)
+        for dirpath, _, filenames in os.walk(docs_dir):
+            for filename in filenames:
+                key = filename[:-len(".npz")]
+                path = os.path.join(dirpath, filename)
+                if key in live_keys:
+                    with np.load(path) as data:
+                        live_images.update(str(h) for h in data["image_hashes"])
+                else:
+                    os.remove(path)
+                    removed += 1
+
+        images_dir = os.path.join(self.root, "images")
+        for dirpath, _, filenames in os.walk(images_dir):
+            for filename in filenames:
+                if filename[:-len(".npy")] not in live_images:
+                    os.remove(os.path.join(dirpath, filename))
+                    removed += 1
+
+        return removed
+
+
+def get_content_store(encoder: str) -> ContentStore | None:
+    """
+    The configured content store for vectors of `encoder` (an encoder
+    signature), or None when CONTENT_STORE_DIR is empty.
+    """
+    if not CONTENT_STORE_DIR:
+        return None
+    return ContentStore(CONTENT_STORE_DIR, encoder)
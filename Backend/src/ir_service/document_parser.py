@@ -0,0 +1,357 @@
+import os
+import io
+import re
+import time
+import zipfile
+import posixpath
+import fitz
+import nltk
+from docx import Document
+from PIL import Image
+from typing import Iterator
+from collections import Counter
+from xml.etree import ElementTree
+
+from src.ir_service.config import MIN_IMAGE_SIZE, EXTRACT_BATCH_SIZE, PDF_TASK_PAGES
+from src.ir_service.content_store import bytes_digest
+from src.ir_service.lexical_index import term_frequencies
+from src.ir_service.chunking import pack_sentences
+from src.ir_service.metrics import timed_iter
+
+# This module must stay free of torch / CLIP imports: it is what the
+# indexing pipeline's worker processes import to parse documents.
+
+SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".txt", ".pdf", ".doc", ".docx"}
+
+# CLIP ViT-B/32 resizes the shorter image side to this before center-cropping
+CLIP_INPUT_SIZE = 224
+
+
+# Fallback when the punkt models are not installed: split after ., ! or ?
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_punkt: bool | None = None
+
+
+def _punkt_available() -> bool:
+    """
+    Look for the punkt models in the local NLTK data path only. Nothing is
+    downloaded: install them once with `python -m nltk.downloader punkt_tab`.
+    """
+    global _punkt
+    if _punkt is None:
+        _punkt = False
+        for resource in ("tokenizers/punkt_tab/english/", "tokenizers/punkt/english.pickle"):
+            try:
+                nltk.data.find(resource)
+                _punkt = True
+                break
+            except LookupError:
+                continue
+        if not _punkt:
+            print("Warning: NLTK punkt data not found, using a regex sentence splitter")
+    return _punkt
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split extracted text into the sentences that get embedded."""
+    if _punkt_available():
+        try:
+            return nltk.tokenize.sent_tokenize(text)
+        except LookupError:
+            pass
+    return [s for s in (part.strip() for part in _SENTENCE_END.split(text)) if s]
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """
+    Decode an image and shrink it right away so that its shorter side is
+    CLIP_INPUT_SIZE (what CLIP's preprocessing would resize it to anyway).
+    """
+    image = Image.open(io.BytesIO(data))
+    # Lets JPEG decode at a reduced scale instead of full resolution
+    image.draft("RGB", (CLIP_INPUT_SIZE, CLIP_INPUT_SIZE))
+    image = image.convert("RGB")
+
+    width, height = image.size
+    scale = CLIP_INPUT_SIZE / min(width, height)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(size, Image.BICUBIC)
+    return image
+
+
+def _too_small(width: int, height: int) -> bool:
+    return min(width, height) < MIN_IMAGE_SIZE
+
+
+def _iter_txt(file_path: str) -> Iterator[tuple[str, list[bytes]]]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield f.read(), []
+
+
+def _iter_image(file_path: str) -> Iterator[tuple[str, list[bytes]]]:
+    with open(file_path, "rb") as f:
+        yield "", [f.read()]
+
+
+def _iter_pdf(file_path: str, task: tuple | None = None, batch_size: int = EXTRACT_BATCH_SIZE) -> Iterator[tuple[str, list[bytes]]]:
+    """
+    Yield (text, image payloads) of a PDF, at most `batch_size` pages or
+    images at a time. Every image xref is extracted once, however many
+    pages show it; tiny images are skipped without being extracted.
+    `task` (see `parse_tasks`) restricts it to the text of a page range or
+    to a list of image xrefs.
+    """
+    doc = fitz.open(file_path)
+    try:
+        if task is not None and task[0] == "images":
+            images = []
+            for xref in task[1]:
+                images.append(doc.extract_image(xref)["image"])
+                if len(images) >= batch_size:
+                    yield "", images
+                    images = []
+            if images:
+                yield "", images
+            return
+
+        start, stop = task[1:] if task is not None else (0, doc.page_count)
+        seen_xrefs = set()
+        texts, images = [], []
+
+        for page_no in range(start, min(stop, doc.page_count)):
+            page = doc[page_no]
+            texts.append(page.get_text())
+            if task is not None:
+                # Text-only page range: the document's images are separate tasks
+                continue
+
+            for img in page.get_images(full=True):
+                xref, width, height = img[0], img[2], img[3]
+                if xref in seen_xrefs:
+                    continue
+                seen_xrefs.add(xref)
+                if _too_small(width, height):
+                    continue
+                images.append(doc.extract_image(xref)["image"])
+
+            if len(texts) >= batch_size or len(images) >= batch_size:
+                yield "".join(texts), images
+                texts, images = [], []
+
+        if texts or images:
+            yield "".join(texts), images
+    finally:
+        doc.close()
+
+
+def _docx_image_parts(file_path: str) -> list[str]:
+    """
+    Zip member names of the distinct images the main document of a DOCX
+    refers to, read from its relationships without loading the package.
+    """
+    with zipfile.ZipFile(file_path) as z:
+        rels = ElementTree.fromstring(z.read("word/_rels/document.xml.rels"))
+
+    names = {}
+    for rel in rels:
+        if "image" not in rel.get("Type", "") or rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        name = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("word", target))
+        names.setdefault(name)
+    return list(names)
+
+
+def _iter_docx_images(file_path: str, names: list[str], batch_size: int = EXTRACT_BATCH_SIZE) -> Iterator[tuple[str, list[bytes]]]:
+    """Yield the DOCX images stored as zip members `names`, `batch_size` at a time."""
+    images = []
+    with zipfile.ZipFile(file_path) as z:
+        for name in names:
+            data = z.read(name)
+            # Image.open only parses the header, so this is cheap
+            try:
+                with Image.open(io.BytesIO(data)) as header:
+                    if _too_small(*header.size):
+                        continue
+            except Exception:
+                continue
+
+            images.append(data)
+            if len(images) >= batch_size:
+                yield "", images
+                images = []
+
+    if images:
+        yield "", images
+
+
+def _iter_doc(file_path: str, task: tuple | None = None, batch_size: int = EXTRACT_BATCH_SIZE) -> Iterator[tuple[str, list[bytes]]]:
+    """
+    Yield the text of a DOCX, then its distinct images `batch_size` at a
+    time. `task` (see `parse_tasks`) restricts it to the text or to some
+    of the images.
+    """
+    if task is not None and task[0] == "images":
+        yield from _iter_docx_images(file_path, task[1], batch_size)
+        return
+
+    # python-docx only for the text: images are read straight from the zip
+    doc = Document(file_path)
+
+    all_text = ""
+    for para in doc.paragraphs:
+        all_text += para.text + "\n"
+    yield all_text, []
+    if task is None:
+        yield from _iter_docx_images(file_path, _docx_image_parts(file_path), batch_size)
+
+
+def iter_content(file_path: str, task: tuple | None = None) -> Iterator[tuple[str, list[bytes]]]:
+    """
+    Stream the raw text and still-encoded image payloads of a supported file
+    in bounded batches. `task` restricts a PDF / DOCX to one of its parse
+    tasks (see `parse_tasks`).
+    """
+    _, ext = os.path.splitext(file_path)
+
+    if ext == ".txt":
+        return _iter_txt(file_path)
+    elif ext == ".png" or ext == ".jpg" or ext == ".jpeg":
+        return _iter_image(file_path)
+    elif ext == ".doc" or ext == ".docx":
+        return _iter_doc(file_path, task)
+    elif ext == ".pdf":
+        return _iter_pdf(file_path, task)
+    else:
+        raise Exception("Invalid file type.")
+
+
+def parse_tasks(file_path: str, task_pages: int = PDF_TASK_PAGES, batch_size: int = EXTRACT_BATCH_SIZE) -> list[tuple | None]:
+    """
+    How to split a file into parse tasks of bounded size. A PDF becomes
+    ("pages", start, stop) tasks for the text of at most `task_pages` pages
+    and ("images", xrefs) tasks of at most `batch_size` images; a DOCX
+    becomes a ("text",) task and ("images", zip member names) tasks.
+    Images are listed once per document, however many pages show them, so
+    each is extracted and decoded once. Everything else is a single
+    whole-file task (None).
+    """
+    _, ext = os.path.splitext(file_path)
+    batch_size = max(1, batch_size)
+
+    if ext == ".pdf":
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+            xrefs = {}
+            for page in doc:
+                for img in page.get_images(full=True):
+                    xref, width, height = img[0], img[2], img[3]
+                    if not _too_small(width, height):
+                        xrefs.setdefault(xref)
+        step = task_pages if task_pages > 0 else max(1, page_count)
+        tasks = [("pages", start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        images = list(xrefs)
+    elif ext == ".doc" or ext == ".docx":
+        tasks = [("text",)]
+        images = _docx_image_parts(file_path)
+    else:
+        return [None]
+
+    tasks.extend(("images", images[i:i + batch_size]) for i in range(0, len(images), batch_size))
+    return tasks or [None]
+
+
+def read_content(file_path: str) -> tuple[str, list[bytes]]:
+    """Return the raw text and the still-encoded image payloads of a supported file."""
+    all_text, images = "", []
+    for text, payloads in iter_content(file_path):
+        all_text += text
+        images.extend(payloads)
+    return all_text, images
+
+
+def iter_decoded(file_path: str) -> Iterator[tuple[str, list[Image.Image]]]:
+    """Like `iter_content`, with the images decoded and downscaled for CLIP."""
+    for text, payloads in iter_content(file_path):
+        yield text, [decode_image(data) for data in payloads]
+
+
+def extract_pdf(file_path: str) -> Iterator[tuple[str, list[Image.Image]]]:
+    return iter_decoded(file_path)
+
+
+def extract_doc(file_path: str) -> Iterator[tuple[str, list[Image.Image]]]:
+    return iter_decoded(file_path)
+
+
+def extract_content(file_path: str) -> tuple[str, list[Image.Image]]:
+    """Return the raw text and the decoded images contained in a supported file."""
+    all_text, images = "", []
+    for text, decoded in iter_decoded(file_path):
+        all_text += text
+        images.extend(decoded)
+    return all_text, images
+
+
+def parse_document(file_path: str, doc_id: int, has_image=None, task: tuple | None = None) -> dict:
+    """
+    Extract and sentence-split a document, or one of its parse tasks (see
+    `parse_tasks`), and pack the sentences into CLIP-sized chunks ("sentences" holds
+    the chunks, one text vector each; "num_sentences" the sentence count).
+    Runs inside the pipeline's worker processes, so everything returned
+    has to be picklable.
+
+    Every image comes with the hash of its encoded bytes; identical images
+    are only kept once. Images for which `has_image(hash)` is true already
+    have a stored embedding and are not decoded (their slot in "images" is None).
+    "terms" holds the term frequencies of the text, for the lexical index,
+    and "timings" the seconds spent extracting, splitting, decoding and packing.
+    """
+    sentences = []
+    terms = Counter()
+    images = []
+    image_hashes = []
+    seen_hashes = set()
+    # Seconds per stage, recorded by the pipeline (metrics do not cross processes)
+    timings = {"parse.extract": 0.0, "parse.split": 0.0, "parse.decode": 0.0, "parse.pack": 0.0}
+
+    def add_extract(seconds: float):
+        timings["parse.extract"] += seconds
+
+    for text, payloads in timed_iter(iter_content(file_path, task), add_extract):
+        if text:
+            begin = time.perf_counter()
+            sentences.extend(split_sentences(text))
+            terms.update(term_frequencies(text))
+            timings["parse.split"] += time.perf_counter() - begin
+
+        for data in payloads:
+            image_hash = bytes_digest(data)
+            if image_hash in seen_hashes:
+                continue
+            seen_hashes.add(image_hash)
+            image_hashes.append(image_hash)
+            if has_image is not None and has_image(image_hash):
+                images.append(None)
+                continue
+            begin = time.perf_counter()
+            images.append(decode_image(data))
+            timings["parse.decode"] += time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    chunks = pack_sentences(sentences)
+    timings["parse.pack"] = time.perf_counter() - begin
+
+    return {
+        "doc_id": doc_id,
+        "path": file_path,
+        "task": task,
+        "sentences": chunks,
+        "num_sentences": len(sentences),
+        "images": images,
+        "image_hashes": image_hashes,
+        "terms": dict(terms),
+        "timings": timings,
+    }
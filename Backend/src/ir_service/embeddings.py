@@ -1,82 +1,192 @@
 import os
+import io
+import atexit
+import threading
 import faiss
 import numpy as np
-import nltk
-from nltk.tokenize import sent_tokenize
-import torch
 from PIL import Image, UnidentifiedImageError
-import clip
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.ir_service.config import (
+    SEARCH_THREADS,
+    COARSE_CANDIDATES,
+    LEXICAL_CANDIDATES,
+    RRF_K,
+    RERANK_K,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_PATH
+)
+from src.ir_service.index_layout import (
+    offset,
+    CENTROIDS,
+    manifest_path,
+    modality_of,
+    is_vector_partition,
+    is_image_id,
+    partition_of
+)
+from src.ir_service.index_store import (
+    open_index_writer,
+    get_writer,
+    get_search_indexes,
+    get_search_snapshot,
+    get_centroid_ranges,
+    vector_positions
+)
+from src.ir_service.index_tools import search_parameters, accepts_search_parameters, is_exact
+from src.ir_service.vector_store import get_exact_store
+from src.ir_service.query_cache import (
+    QueryEmbeddingCache,
+    text_key,
+    image_key
+)
+from src.ir_service.clip_model import ClipModel
+from src.ir_service.encoders import get_encoder
+from src.ir_service.document_parser import split_sentences
+from src.ir_service.chunking import pack_sentences
+from src.ir_service.startup import startup
+from src.ir_service.metrics import metrics
+from src.ir_service.lexical_index import get_lexical_index, retrieve_keyword
+
+# --- CLIP, loaded on first use (or by warm_up) ---
+clip_model = ClipModel("ViT-B/32")
+
+# Text / image shards are searched concurrently (FAISS releases the GIL)
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS or os.cpu_count() or 2, thread_name_prefix="faiss-search")
+
+# Normalized query embeddings, keyed by encoder and normalized text / image content hash
+query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_PATH)
+query_cache.load()
+atexit.register(query_cache.save)
+
+
+def encoder_signature() -> str:
+    """
+    Signature of the encoder in use (built on first call). It can differ from
+    the configured backend: ONNX falls back to PyTorch when it is unavailable.
+    """
+    return get_encoder(clip_model).signature
 
-# Download NLTK sentence splitter
-nltk.download('punkt', quiet=True)
-nltk.download('punkt_tab', quiet=True)
 
-# --- Initialize CLIP components ---
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+def encode_texts(sentences: list[str]) -> np.ndarray:
+    """
+    Encode a batch of sentences with the CLIP text encoder (through the
+    configured backend, see `encoders`) and return L2-normalized float32
+    embeddings of shape [N, 512].
+    """
+    metrics.observe("fre_batch_size", len(sentences), kind="text_encode")
+    with metrics.timer("encode.text"):
+        emb = get_encoder(clip_model).encode_text(sentences)                    # ndarray [N,512]
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
 
 
-# ID offset for combining doc_id and segment index
-offset = 10**5
+def encode_images(images: list[Image.Image]) -> np.ndarray:
+    """
+    Encode a batch of PIL images with the CLIP vision encoder and return
+    L2-normalized float32 embeddings of shape [N, 512].
+    """
+    metrics.observe("fre_batch_size", len(images), kind="image_encode")
+    with metrics.timer("encode.image"):
+        emb = get_encoder(clip_model).encode_image(images)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
 
 
-def _load_or_create_index(index_path: str, dim: int) -> faiss.IndexIDMap:
+def warm_up(index_path: str = "faiss_index.idx") -> threading.Thread:
     """
-    Helper to load an existing FAISS IndexIDMap or create a new one.
-    Uses inner-product (IP) index for cosine similarity on normalized vectors.
+    Load CLIP and open the index on a background thread, running one text and
+    one image through the model so the first query does not pay for it.
     """
-    if os.path.exists(index_path):
-        return faiss.read_index(index_path)
-    flat = faiss.IndexFlatIP(dim)
-    return faiss.IndexIDMap(flat)
 
+    def run():
+        try:
+            clip_model.load()
+            with startup.phase("encoder"):
+                get_encoder(clip_model)
+            with startup.phase("model_warm_up"):
+                encode_texts(["warm up"])
+                encode_images([Image.new("RGB", (224, 224))])
+        except Exception as e:
+            print(f"Warning: Failed to load CLIP {clip_model.name}: {e}")
+
+        if not os.path.exists(manifest_path(index_path)) and not os.path.exists(index_path):
+            print("No index yet; it is created by the first crawl")
+            return
+        try:
+            with startup.phase("index"):
+                get_search_indexes(index_path)
+        except Exception as e:
+            print(f"Warning: Failed to open index '{index_path}': {e}")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def text_vector_ids(doc_id: int, count: int, start: int = 0) -> np.ndarray:
+    """IDs for a document's sentences: doc_id * offset + i."""
+    first = doc_id * offset + start
+    return np.arange(first, first + count, dtype=np.int64)
+
+
+def image_vector_ids(doc_id: int, count: int, start: int = 0) -> np.ndarray:
+    """IDs for a document's images: doc_id * offset + 0.9 * offset + j."""
+    first = int(doc_id * offset + 0.9 * offset) + start
+    return np.arange(first, first + count, dtype=np.int64)
+
+
+def add_embeddings(emb: np.ndarray, ids: np.ndarray, index_path: str = "faiss_index.idx"):
+    """Add already-encoded vectors through the active index writer."""
+    writer, transient = get_writer(index_path)
+    writer.add(emb, ids)
+    if transient:
+        writer.commit()
+
+    num_images = int(is_image_id(ids).sum())
+    metrics.inc("fre_vectors_added_total", len(ids) - num_images, modality="text")
+    metrics.inc("fre_vectors_added_total", num_images, modality="image")
 
-def embed_text(text_input: str, doc_id: int, index_path: str = "faiss_index.idx"):
+
+def embed_text(text_input: str, doc_id: int, index_path: str = "faiss_index.idx", start: int = 0) -> int:
     """
-    Read a text file, split into sentences, encode with CLIP text encoder
-    (via the `clip` package), normalize embeddings, and add to a FAISS index.
+    Read a text file, split into sentences packed into CLIP-sized chunks,
+    encode with CLIP text encoder (via the `clip` package), normalize
+    embeddings, and add to a FAISS index.
+    Chunk IDs are numbered from `start`; returns the number of chunks.
     """
     if os.path.exists(text_input):
         with open(text_input, "r", encoding="utf-8") as f:
             text_input = f.read()
 
-    # 1) Read & split
-    sentences = sent_tokenize(text_input)
+    # 1) Read, split & pack
+    with metrics.timer("parse.split"):
+        sentences = pack_sentences(split_sentences(text_input))
     if not sentences:
         raise ValueError("No sentences were extracted from the document.")
 
-    if len(sentences) > 0.9 * offset:
-        raise Exception(f"Only {0.9 * offset} sentences can be embedded.")
-
-    # 2) Encode under no_grad, detach, move to CPU & numpy
-    with torch.no_grad():
-        text_tokens = clip.tokenize(sentences, truncate=True).to(device)        # [N, token_len]
-        emb = model.encode_text(text_tokens)                                    # torch.Tensor [N,512]
-        emb = emb.detach().cpu().numpy()                                        # ndarray [N,512]
+    if start + len(sentences) > 0.9 * offset:
+        raise Exception(f"Only {0.9 * offset} text chunks can be embedded.")
 
-    # 3) L2‐normalize row‐wise
-    emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+    # 2) Encode & L2-normalize
+    emb = encode_texts(sentences)
 
-    # 4) Print (optional) & determine dim
-    dim = 512
-
-    # 5) Build unique IDs for each sentence
+    # 3) Build unique IDs for each chunk
     # [100,000 - 190,000]
-    ids = np.array([doc_id * offset + i for i in range(len(sentences))], dtype=np.int64)
+    ids = text_vector_ids(doc_id, len(sentences), start)
 
-    # 6) Load or create FAISS index, add embeddings
-    index = _load_or_create_index(index_path, dim)
-    index.add_with_ids(emb, ids)
-    faiss.write_index(index, index_path)
+    # 4) Hand the embeddings to the index writer
+    add_embeddings(emb, ids, index_path)
 
-    print(f"Indexed {len(sentences)} sentences for docID={doc_id} → {index_path}")
+    print(f"Indexed {len(sentences)} text chunks for docID={doc_id} → {index_path}")
+    return len(sentences)
 
 
-def embed_image(image_input: list[Image.Image] | str, doc_id: int, index_path: str = "faiss_index.idx"):
+def embed_image(image_input: list[Image.Image] | str, doc_id: int, index_path: str = "faiss_index.idx", start: int = 0) -> int:
     """
     Read an image file path or PIL Image, encode with CLIP vision encoder,
     normalize embeddings, and add to the shared FAISS index.
+    Image IDs are numbered from `start`; returns the number of images.
     """
     if isinstance(image_input, str):
         if not os.path.exists(image_input):
@@ -84,234 +194,494 @@ def embed_image(image_input: list[Image.Image] | str, doc_id: int, index_path: s
         
         image_input = [Image.open(image_input).convert("RGB")]
     
-    if len(image_input) > 0.1 * offset:
+    if start + len(image_input) > 0.1 * offset:
         raise Exception(f"Only {0.1 * offset} images can be embedded.")
     
-    prepped = [preprocess(img) for img in image_input]
-    if not prepped:
+    if not image_input:
         print(f"Warning: Failed to preprocess any images for doc_id={doc_id}")
-        return
-    batch = torch.stack(prepped, dim=0).to(device)
-
-    # 4) Encode + normalize
-    with torch.no_grad():
-        emb = model.encode_image(batch)
-        emb = emb / emb.norm(dim=1, keepdim=True)
-    emb_np = emb.cpu().numpy()
+        return 0
 
-    dim = 512
+    emb_np = encode_images(image_input)
+    ids = image_vector_ids(doc_id, emb_np.shape[0], start)
 
-    start = int(doc_id * offset + 0.9 * offset)
-    ids = np.arange(start, start + emb_np.shape[0], dtype=np.int64)
-
-    index = _load_or_create_index(index_path, dim)
-    index.add_with_ids(emb_np, ids)
-    faiss.write_index(index, index_path)
+    add_embeddings(emb_np, ids, index_path)
 
     print(f"Indexed {emb_np.shape[0]} image(s) for doc_id={doc_id} into '{index_path}'.")
-
-
-def retrieve_closest_doc(query, index_path: str = "faiss_index.idx", k: int = 1, balance_factor: float = 3.0) -> list[tuple[int, float]]:
+    return emb_np.shape[0]
+
+
+def _search(
+    index: faiss.Index,
+    q_emb: np.ndarray,
+    search_k: int,
+    index_path: str,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    allowed_ids: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    Accepts a text string or image (file‑path or PIL.Image), encodes it
-    with the CLIP model you loaded via `clip.load("ViT-B/32")`, then
-    searches your shared FAISS index. Returns a list of (doc_id, score).
+    `index.search` with per-query parameters, restricted to `allowed_ids`
+    (vector IDs) when given: through an ID selector, or for index types that
+    take none (flat PQ codes) by over-fetching in proportion and dropping the
+    other IDs. When the index stores compressed codes, at least RERANK_K
+    candidates are fetched and re-scored against the exact vectors before
+    keeping the top `search_k`.
+    """
+    store = get_exact_store(index_path)
+    candidates_k = search_k if store is None else max(search_k, RERANK_K)
+    fetch_k = candidates_k
+    sel = None
+    post_filter = allowed_ids is not None and not accepts_search_parameters(index)
+    if post_filter:
+        fetch_k = min(index.ntotal, -(-candidates_k * index.ntotal // max(len(allowed_ids), 1)))
+    elif allowed_ids is not None:
+        sel = faiss.IDSelectorBatch(allowed_ids)
+    params = search_parameters(index, nprobe, ef_search, sel)
+
+    # Runs on a pool thread: only the histogram sees this, not the request breakdown
+    with metrics.timer("search.partition"):
+        distances, ids = index.search(q_emb, fetch_k, params=params)
+        if post_filter:
+            distances, ids = _keep_allowed(distances, ids, allowed_ids, candidates_k)
+    if store is None:
+        return distances, ids
+    with metrics.timer("search.rerank"):
+        return store.rerank(q_emb, distances, ids, search_k)
+
+
+def _search_exact(index: faiss.Index, q_emb: np.ndarray, search_k: int, positions: np.ndarray, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top `search_k` hits per row among the vectors at `positions` (with IDs
+    `ids`) of a flat partition. The candidates are gathered and scored with
+    one matrix product: an ID selector on a flat index would still scan
+    every vector. Padded with -1 like `index.search`.
+    """
+    distances = np.full((len(q_emb), search_k), -np.inf, dtype=np.float32)
+    labels = np.full((len(q_emb), search_k), -1, dtype=np.int64)
+    if len(ids) == 0:
+        return distances, labels
+
+    with metrics.timer("search.partition"):
+        vectors = faiss.downcast_index(index.index).reconstruct_batch(np.ascontiguousarray(positions, dtype=np.int64))
+        scores = q_emb @ vectors.T
+        k = min(search_k, len(ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        distances[:, :k] = np.take_along_axis(scores, top, axis=1)
+        labels[:, :k] = ids[top]
+    return distances, labels
+
+
+def _keep_allowed(distances: np.ndarray, ids: np.ndarray, allowed_ids: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """The best `k` hits per row among `allowed_ids`, padded with -1 like `index.search`."""
+    keep = np.isin(ids, allowed_ids)
+    # Allowed hits first, each group still in score order
+    order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+    kept = np.take_along_axis(keep, order, axis=1)
+    return np.where(kept, distances, -np.inf).astype(np.float32), np.where(kept, ids, -1)
+
+
+def _resolve_query(query, allow_paths: bool = True) -> tuple[str, bool, Image.Image | None, bytes | None]:
+    """
+    Return the cache key, modality, and decoded image / raw bytes of a query.
+    A string naming an image file is read as that image only when
+    `allow_paths` is set; otherwise every string is text.
     """
-    # Determine modality
     is_image = False
     image = None
-    if isinstance(query, Image.Image):
+    image_bytes = None
+    if isinstance(query, (bytes, bytearray)):
+        is_image = True
+        image_bytes = bytes(query)
+    elif isinstance(query, Image.Image):
         is_image = True
         image = query
-    elif isinstance(query, str) and os.path.exists(query):
+    elif isinstance(query, str) and allow_paths and os.path.exists(query):
+        with open(query, "rb") as f:
+            data = f.read()
         try:
-            image = Image.open(query).convert("RGB")
+            image = Image.open(io.BytesIO(data)).convert("RGB")
+            image_bytes = data
             is_image = True
         except UnidentifiedImageError:
             is_image = False
 
-    # Load index
-    if not os.path.exists(index_path):
-        raise FileNotFoundError(f"Index file '{index_path}' not found.")
-    index: faiss.IndexIDMap = faiss.read_index(index_path)
-
-    # Encode query to a 512‑d numpy vector
-    if is_image:
-        img_input = preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_image(img_input).cpu().numpy()
+    if not is_image:
+        key = text_key(query)
+    elif image_bytes is not None:
+        key = image_key(image_bytes)
     else:
-        tokens = clip.tokenize([query]).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_text(tokens).cpu().numpy()
-
-    q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
-
-    search_k = k * 100
-    distances, ids = index.search(q_emb, search_k)
-
-    results = {}
-    seen = set()
-    for dist, idx in zip(distances[0], ids[0]):
-        if idx < 0: continue
-
-        is_image_embedding = False
-        if (idx % offset) >= (0.9 * offset):
-            is_image_embedding = True
-
-        doc_id = idx // offset
-
-        if (doc_id, is_image_embedding) not in seen:
-            if doc_id in results:
-                score = float(dist)
-                if (is_image and not is_image_embedding) or (not is_image and is_image_embedding):
-                    score *= balance_factor
-                
-                seen.add((doc_id, is_image_embedding))                
-                results[doc_id] = max(results[doc_id], score)
-            else:
-                score = float(dist)
-                if (is_image and not is_image_embedding) or (not is_image and is_image_embedding):
-                    score *= balance_factor
-                results[doc_id] = score
-        
-        # if len(results) == k:
-        #     break
+        key = image_key(f"{image.mode}{image.size}".encode() + image.tobytes())
+    return key, is_image, image, image_bytes
 
-    if not results:
-        raise ValueError("No results found for the given query.")
-    
-    results = [(int(k), v) for k, v in results.items()]
 
-    return results
+def _decode_image(image: Image.Image | bytes) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image
+    try:
+        return Image.open(io.BytesIO(image)).convert("RGB")
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Unreadable image query: {e}") from e
 
 
-def retrieve_closest_text(query, index_path: str = "faiss_index.idx", k: int = 1):
+def encode_queries(queries: list, allow_paths: bool = True) -> tuple[np.ndarray, np.ndarray]:
     """
-    Accepts a text string or image (file‑path or PIL.Image), encodes it
-    with the CLIP model you loaded via `clip.load("ViT-B/32")`, then
-    searches your shared FAISS index. 
-    Returns a list of (doc_id, score) tuples for text embeddings only.
+    Encode a mix of text and image queries (see `encode_query`). Cache misses
+    are encoded in one batched forward pass per modality. Returns the
+    normalized [N, 512] query vectors and a boolean [N] image mask. Raises
+    ValueError when an image query cannot be decoded.
     """
-    # Determine modality
-    is_image = False
-    image = None
-    if isinstance(query, Image.Image):
-        is_image = True
-        image = query
-    elif isinstance(query, str) and os.path.exists(query):
-        try:
-            image = Image.open(query).convert("RGB")
-            is_image = True
-        except UnidentifiedImageError:
-            is_image = False
+    q_emb = np.zeros((len(queries), 512), dtype=np.float32)
+    is_image = np.zeros(len(queries), dtype=bool)
+
+    # Distinct cache misses: key -> [text / image, rows that share it]
+    texts: dict[str, list] = {}
+    images: dict[str, list] = {}
+    signature = encoder_signature()
+    for row, query in enumerate(queries):
+        key, is_image[row], image, image_bytes = _resolve_query(query, allow_paths)
+        key = f"{signature}/{key}"
+
+        cached = query_cache.get(key)
+        metrics.inc("fre_query_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            q_emb[row] = cached[0]
+        elif not is_image[row]:
+            texts.setdefault(key, [query, []])[1].append(row)
+        else:
+            images.setdefault(key, [image if image is not None else image_bytes, []])[1].append(row)
 
-    # Load index
-    if not os.path.exists(index_path):
-        raise FileNotFoundError(f"Index file '{index_path}' not found.")
-    index: faiss.IndexIDMap = faiss.read_index(index_path)
+    if texts:
+        emb = encode_texts([text for text, _ in texts.values()])
+        for key, (_, rows), row_emb in zip(texts, texts.values(), emb):
+            query_cache.put(key, row_emb[None, :])
+            q_emb[rows] = row_emb
 
-    # Encode query to a 512‑d numpy vector
-    if is_image:
-        img_input = preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_image(img_input).cpu().numpy()
+    if images:
+        decoded = [_decode_image(image) for image, _ in images.values()]
+        emb = encode_images(decoded)
+        for key, (_, rows), row_emb in zip(images, images.values(), emb):
+            query_cache.put(key, row_emb[None, :])
+            q_emb[rows] = row_emb
+
+    return q_emb, is_image
+
+
+def encode_query(query, allow_paths: bool = True) -> tuple[np.ndarray, bool]:
+    """
+    Accepts a text string, raw image bytes or an image (file‑path or PIL.Image)
+    and encodes it with CLIP. Returns the normalized [1, 512] query vector and
+    whether it is an image. Embeddings are served from `query_cache` when the
+    same text or image content was encoded before. Pass `allow_paths=False`
+    for untrusted input (HTTP requests): strings are then always text, so
+    clients cannot make the server open its own files.
+    """
+    q_emb, is_image = encode_queries([query], allow_paths)
+    return q_emb, bool(is_image[0])
+
+
+def _rank_documents(
+    distances: np.ndarray,
+    ids: np.ndarray,
+    is_image_query: bool,
+    k: int,
+    modality: str = "all",
+    balance_factor: float = 3.0,
+    tombstones: np.ndarray | None = None,
+) -> list[tuple[int, float]]:
+    """
+    Collapse one row of vector hits to documents with NumPy: drop hits of
+    tombstoned (deleted) documents, keep the hits of the requested modality
+    ("all", "text" or "image"), multiply cross-modal scores by
+    `balance_factor`, take each document's best score and return the top `k`
+    documents by descending score.
+    """
+    valid = ids >= 0
+    if tombstones is not None and len(tombstones):
+        valid &= ~np.isin(ids // offset, tombstones)
+    ids, scores = ids[valid], distances[valid].astype(np.float64)
+
+    is_image_embedding = (ids % offset) >= (0.9 * offset)
+    if modality == "text":
+        keep = ~is_image_embedding
+    elif modality == "image":
+        keep = is_image_embedding
     else:
-        tokens = clip.tokenize([query]).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_text(tokens).cpu().numpy()
+        keep = np.ones(len(ids), dtype=bool)
+        scores = np.where(is_image_embedding != is_image_query, scores * balance_factor, scores)
+
+    doc_ids, scores = ids[keep] // offset, scores[keep]
+    if len(doc_ids) == 0:
+        return []
 
-    q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
+    # Best score per document: sort by (doc, -score) and keep the first of each doc
+    order = np.lexsort((-scores, doc_ids))
+    doc_ids, scores = doc_ids[order], scores[order]
+    first = np.ones(len(doc_ids), dtype=bool)
+    first[1:] = doc_ids[1:] != doc_ids[:-1]
+    doc_ids, scores = doc_ids[first], scores[first]
 
-    search_k = k * 100
-    distances, ids = index.search(q_emb, search_k)
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(int(doc_ids[i]), float(scores[i])) for i in top]
 
-    results = {}
-    for dist, idx in zip(distances[0], ids[0]):
-        if idx < 0: 
+
+def _document_vector_ids(indexes: dict[str, faiss.Index], doc_ids: np.ndarray, ranges: np.ndarray | None) -> dict[str, np.ndarray]:
+    """
+    The vector IDs of `doc_ids`, per partition. Read off the first / last
+    vector ID stored with every centroid (`ranges`) when the index has them:
+    one pass over the documents instead of over every stored vector. IDs in
+    a range that hold no vector are harmless: the search skips them.
+    """
+    if ranges is None or len(ranges) == 0:
+        allowed = {}
+        for partition, index in indexes.items():
+            if is_vector_partition(partition):
+                stored_ids = faiss.vector_to_array(index.id_map)
+                allowed[partition] = stored_ids[np.isin(stored_ids // offset, doc_ids)]
+        return allowed
+
+    ranges = ranges[np.isin(ranges[:, 1] // offset, doc_ids)]
+    first_ids, last_ids = ranges[:, 1], ranges[:, 2]
+
+    counts = last_ids - first_ids + 1
+    ids = np.repeat(first_ids - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    shards = sum(1 for partition in indexes if modality_of(partition) == "text")
+    partitions = partition_of(ids, shards)
+    return {partition: ids[partitions == partition] for partition in np.unique(partitions).tolist()}
+
+
+def _coarse_candidates(
+    centroids: faiss.Index,
+    q_emb: np.ndarray,
+    is_image_query: np.ndarray,
+    candidates: int,
+    modality: str,
+    balance_factor: float,
+    tombstones: np.ndarray,
+) -> np.ndarray:
+    """
+    The `candidates` best documents of every row of `q_emb` on the centroid
+    index (one mean vector per document and modality), merged into one set
+    of doc ids. Deepens the search for rows that have fewer candidates.
+    """
+    doc_ids: set[int] = set()
+    search_k = min(2 * (candidates + len(tombstones)), centroids.ntotal)
+    rows = np.arange(len(q_emb))
+    while len(rows):
+        distances, ids = centroids.search(np.ascontiguousarray(q_emb[rows]), search_k)
+        unfinished = []
+        for j, row in enumerate(rows):
+            ranked = _rank_documents(distances[j], ids[j], bool(is_image_query[row]), candidates, modality, balance_factor, tombstones)
+            doc_ids.update(doc_id for doc_id, _ in ranked)
+            if len(ranked) < candidates:
+                unfinished.append(row)
+
+        if search_k >= centroids.ntotal:
+            break
+        rows = np.asarray(unfinished, dtype=np.int64)
+        search_k = min(search_k * 4, centroids.ntotal)
+
+    return np.fromiter(doc_ids, dtype=np.int64, count=len(doc_ids))
+
+
+def _search_documents_batch(
+    q_emb: np.ndarray,
+    is_image_query: np.ndarray,
+    index_path: str,
+    k: int,
+    modality: str = "all",
+    balance_factor: float = 3.0,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    doc_filter: np.ndarray | None = None,
+    candidates: int = COARSE_CANDIDATES,
+) -> list[list[tuple[int, float]]]:
+    """
+    Document-level top-k for every row of `q_emb`, among the documents in
+    `doc_filter` only when it is given: their vectors are scored directly on
+    exact (flat) partitions and through an ID selector on the others.
+
+    Without a filter, and when the index has more centroids than
+    `candidates` (0 disables this), the search runs in two stages: the
+    `candidates` best documents of each row are picked on the centroid index,
+    and only their vectors are re-scored. Each partition (shard)
+    needed for `modality` is searched once with all rows, all of them in
+    parallel, and their hits are merged. Starts by fetching k * 100 vectors
+    per partition and deepens the search geometrically, for the rows that
+    still have fewer than `k` distinct (non-tombstoned) documents, until
+    every searched partition has been covered.
+    """
+    results: list[list[tuple[int, float]]] = [[] for _ in range(len(q_emb))]
+    if len(q_emb) == 0:
+        return results
+
+    indexes, tombstones = get_search_snapshot(index_path)
+    centroids = indexes.get(CENTROIDS)
+    metrics.observe("fre_batch_size", len(q_emb), kind="search")
+    if doc_filter is None and candidates > 0 and centroids is not None and centroids.ntotal > candidates:
+        with metrics.timer("search.coarse"):
+            doc_filter = _coarse_candidates(centroids, q_emb, is_image_query, max(candidates, k), modality, balance_factor, tombstones)
+
+    ranges = get_centroid_ranges(index_path, centroids) if centroids is not None else None
+    allowed = _document_vector_ids(indexes, doc_filter, ranges) if doc_filter is not None else None
+    # (index, allowed vector IDs or None, id map offsets for direct scoring or None, number of searchable vectors)
+    targets = []
+    for partition, index in indexes.items():
+        if not is_vector_partition(partition) or index.ntotal == 0:
             continue
-            
-        # Check if it's a text embedding (< 0.9 * offset)
-        if (idx % offset) < (0.9 * offset):
-            doc_id = idx // offset
-            if doc_id not in results:
-                results[doc_id] = float(dist)
-            else:
-                results[doc_id] = max(results[doc_id], float(dist))
+        if modality != "all" and modality_of(partition) != modality:
+            continue
+        if allowed is None:
+            targets.append((index, None, None, index.ntotal))
+            continue
+        allowed_ids = allowed.get(partition)
+        if allowed_ids is None or not len(allowed_ids):
+            continue
+        if is_exact(index):
+            positions, allowed_ids = vector_positions(index_path, partition, index, allowed_ids)
+            if len(positions):
+                targets.append((index, allowed_ids, positions, len(positions)))
+        else:
+            targets.append((index, allowed_ids, None, len(allowed_ids)))
+    if not targets:
+        return results
+
+    largest = max(size for *_, size in targets)
+    search_k = min(k * 100, largest)
+    rows = np.arange(len(q_emb))
+    while len(rows):
+        batch = np.ascontiguousarray(q_emb[rows])
+        with metrics.timer("search.index"):
+            futures = [
+                _search_pool.submit(_search_exact, index, batch, min(search_k, size), positions, allowed_ids)
+                if positions is not None else
+                _search_pool.submit(_search, index, batch, min(search_k, size), index_path, nprobe, ef_search, allowed_ids)
+                for index, allowed_ids, positions, size in targets
+            ]
+            hits = [future.result() for future in futures]
+
+        with metrics.timer("search.rank"):
+            distances = np.concatenate([d for d, _ in hits], axis=1)
+            ids = np.concatenate([i for _, i in hits], axis=1)
+
+            unfinished = []
+            for j, row in enumerate(rows):
+                results[row] = _rank_documents(distances[j], ids[j], bool(is_image_query[row]), k, modality, balance_factor, tombstones)
+                if len(results[row]) < k:
+                    unfinished.append(row)
+
+        if search_k >= largest:
+            break
+        rows = np.asarray(unfinished, dtype=np.int64)
+        search_k = min(search_k * 4, largest)
+
+    return results
+
+
+def _search_documents(
+    q_emb: np.ndarray,
+    is_image_query: bool,
+    index_path: str,
+    k: int,
+    modality: str = "all",
+    balance_factor: float = 3.0,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+) -> list[tuple[int, float]]:
+    """Document-level top-k for a single [1, 512] query (see `_search_documents_batch`)."""
+    return _search_documents_batch(
+        q_emb, np.array([is_image_query]), index_path, k, modality, balance_factor, nprobe, ef_search
+    )[0]
+
+
+def retrieve_closest_doc(query, index_path: str = "faiss_index.idx", k: int = 1, balance_factor: float = 3.0, nprobe: int | None = None, ef_search: int | None = None, allow_paths: bool = True) -> list[tuple[int, float]]:
+    """
+    Accepts a text string, image bytes or image (file‑path or PIL.Image), encodes it
+    with the CLIP model (`clip_model`, loaded on first use), then
+    searches your shared FAISS index. Returns the `k` best (doc_id, score)
+    pairs, highest score first. Cross-modal hits are weighted by `balance_factor`.
+    `nprobe` / `ef_search` tune IVF / HNSW indexes for this query only;
+    `allow_paths` as in `encode_query`.
+    """
+    q_emb, is_image = encode_query(query, allow_paths)
+    results = _search_documents(q_emb, is_image, index_path, k, "all", balance_factor, nprobe, ef_search)
 
     if not results:
-        raise ValueError("No text results found for the given query.")
-    
-    # Convert to list of tuples and sort by score in descending order
-    results_list = [(int(doc_id), score) for doc_id, score in results.items()]
-    results_list.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return only k results
-    return results_list[:k]
+        raise ValueError("No results found for the given query.")
+    return results
 
 
-def retrieve_closest_images(query, index_path: str = "faiss_index.idx", k: int = 1):
+def retrieve_closest_docs_batch(queries: list, index_path: str = "faiss_index.idx", k: int = 1, balance_factor: float = 3.0, nprobe: int | None = None, ef_search: int | None = None, allow_paths: bool = True) -> list[list[tuple[int, float]]]:
     """
-    Accepts a text string or image (file‑path or PIL.Image), encodes it
-    with the CLIP model you loaded via `clip.load("ViT-B/32")`, then
-    searches your shared FAISS index. 
-    Returns a list of (doc_id, score) tuples for image embeddings only.
+    Batched `retrieve_closest_doc`: `queries` may mix text strings, image bytes
+    and images. All queries are encoded together and every partition is
+    searched once with all of them. Returns one list of (doc_id, score) pairs
+    per query, in order; a query without results gets an empty list.
     """
-    # Determine modality
-    is_image = False
-    image = None
-    if isinstance(query, Image.Image):
-        is_image = True
-        image = query
-    elif isinstance(query, str) and os.path.exists(query):
-        try:
-            image = Image.open(query).convert("RGB")
-            is_image = True
-        except UnidentifiedImageError:
-            is_image = False
+    q_emb, is_image = encode_queries(queries, allow_paths)
+    return _search_documents_batch(q_emb, is_image, index_path, k, "all", balance_factor, nprobe, ef_search)
 
-    # Load index
-    if not os.path.exists(index_path):
-        raise FileNotFoundError(f"Index file '{index_path}' not found.")
-    index: faiss.IndexIDMap = faiss.read_index(index_path)
 
-    # Encode query to a 512‑d numpy vector
-    if is_image:
-        img_input = preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_image(img_input).cpu().numpy()
-    else:
-        tokens = clip.tokenize([query]).to(device)
-        with torch.no_grad():
-            q_emb = model.encode_text(tokens).cpu().numpy()
+def _reciprocal_rank_fusion(rankings: list[list[tuple[int, float]]], rrf_k: int = RRF_K) -> list[tuple[int, float]]:
+    """Fuse several (doc_id, score) rankings: each document scores sum(1 / (rrf_k + rank))."""
+    fused: dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
 
-    q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
 
-    search_k = k * 100
-    distances, ids = index.search(q_emb, search_k)
+def retrieve_hybrid(query: str, index_path: str = "faiss_index.idx", k: int = 1, balance_factor: float = 3.0, candidates: int = LEXICAL_CANDIDATES, nprobe: int | None = None, ef_search: int | None = None) -> list[tuple[int, float]]:
+    """
+    Keyword + vector search for a text query: the best `candidates` BM25
+    documents narrow the FAISS search (see `_search_documents_batch`), and the two rankings are
+    merged with reciprocal rank fusion. Falls back to `retrieve_closest_doc`
+    when no document contains any of the query's terms.
+    """
+    lexical_hits = retrieve_keyword(query, candidates) if get_lexical_index() is not None else []
+    # A text query: never read as a file path
+    if not lexical_hits:
+        return retrieve_closest_doc(query, index_path, k, balance_factor, nprobe, ef_search, allow_paths=False)
 
-    results = {}
-    for dist, idx in zip(distances[0], ids[0]):
-        if idx < 0: 
-            continue
-            
-        # Check if it's an image embedding (>= 0.9 * offset)
-        if (idx % offset) >= (0.9 * offset):
-            doc_id = idx // offset
-            if doc_id not in results:
-                results[doc_id] = float(dist)
-            else:
-                results[doc_id] = max(results[doc_id], float(dist))
+    q_emb, is_image = encode_query(query, allow_paths=False)
+    doc_filter = np.array([doc_id for doc_id, _ in lexical_hits], dtype=np.int64)
+    dense_hits = _search_documents_batch(
+        q_emb, np.array([is_image]), index_path, len(doc_filter), "all", balance_factor, nprobe, ef_search, doc_filter
+    )[0]
+    return _reciprocal_rank_fusion([dense_hits, lexical_hits])[:k]
+
+
+def retrieve_closest_text(query, index_path: str = "faiss_index.idx", k: int = 1, nprobe: int | None = None, ef_search: int | None = None):
+    """
+    Accepts a text string or image (file‑path or PIL.Image), encodes it
+    with the CLIP model (`clip_model`, loaded on first use), then
+    searches your shared FAISS index. 
+    Returns a list of (doc_id, score) tuples for text embeddings only.
+    """
+    q_emb, is_image = encode_query(query)
+    results = _search_documents(q_emb, is_image, index_path, k, "text", 1.0, nprobe, ef_search)
+
+    if not results:
+        raise ValueError("No text results found for the given query.")
+    return results
+
+
+def retrieve_closest_images(query, index_path: str = "faiss_index.idx", k: int = 1, nprobe: int | None = None, ef_search: int | None = None):
+    """
+    Accepts a text string or image (file‑path or PIL.Image), encodes it
+    with the CLIP model (`clip_model`, loaded on first use), then
+    searches your shared FAISS index. 
+    Returns a list of (doc_id, score) tuples for image embeddings only.
+    """
+    q_emb, is_image = encode_query(query)
+    results = _search_documents(q_emb, is_image, index_path, k, "image", 1.0, nprobe, ef_search)
 
     if not results:
         raise ValueError("No image results found for the given query.")
-    
-    # Convert to list of tuples and sort by score in descending order
-    results_list = [(int(doc_id), score) for doc_id, score in results.items()]
-    results_list.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return only k results
-    return results_list[:k]
+    return results
 
 
 def delete_doc_embeddings(
@@ -323,49 +693,39 @@ def delete_doc_embeddings(
     Delete all vectors for each `doc_id` in `doc_ids` from a FAISS IndexIDMap.
 
     Vectors were originally added with IDs = doc_id * offset + segment_index.
-    Uses IDSelectorRange to avoid loading the entire id_map into Python.
+    The documents are tombstoned rather than removed one by one (see
+    IndexWriter), so deleting many documents costs about one pass.
+    Goes through the active IndexWriter when a crawl is running.
 
     Returns a dict mapping each doc_id to the number of vectors removed.
     """
-    index = faiss.read_index(index_path)
-    if not hasattr(index, "id_map"):
-        raise ValueError("Index is not an IndexIDMap; cannot remove by ID.")
-
-    removed_counts: dict[int, int] = {}
-    total_before = index.ntotal
+    writer, transient = get_writer(index_path)
+    removed_counts = writer.remove_docs(doc_ids, offset=offset)
+    if transient:
+        writer.commit()
 
-    for doc_id in doc_ids:
-        imin = doc_id * offset
-        imax = (doc_id + 1) * offset
-        pre_ntotal = index.ntotal
-
-        selector = faiss.IDSelectorRange(imin, imax)
-        index.remove_ids(selector)
-
-        post_ntotal = index.ntotal
-        removed = pre_ntotal - post_ntotal
-        removed_counts[doc_id] = removed
-
-    faiss.write_index(index, index_path)
-
-    total_removed = total_before - index.ntotal
+    total_removed = sum(removed_counts.values())
+    metrics.inc("fre_vectors_removed_total", total_removed)
     print(f"Removed a total of {total_removed} vectors across doc_ids={doc_ids}")
     return removed_counts
 
 
 def display_document_ids_in_vector_db():
     from pprint import pprint
-    index = _load_or_create_index("faiss_index.idx", 512)
-    stored_ids = faiss.vector_to_array(index.id_map)
+    try:
+        indexes, tombstones = get_search_snapshot("faiss_index.idx")
+    except FileNotFoundError:
+        return {}
 
     ids = defaultdict(lambda: {"images": 0, "text": 0})
-    for id in stored_ids:
-        reduced_id = int(id // offset)
-        if (id % offset) >= (0.9 * offset):
-            ids[reduced_id]["images"] += 1
-        else:
-            ids[reduced_id]["text"] += 1
+    for partition, index in indexes.items():
+        if not is_vector_partition(partition):
+            continue
+        stored_docs = faiss.vector_to_array(index.id_map) // offset
+        stored_docs = stored_docs[~np.isin(stored_docs, tombstones)]
+        doc_ids, counts = np.unique(stored_docs, return_counts=True)
+        for doc_id, count in zip(doc_ids, counts):
+            ids[int(doc_id)]["images" if modality_of(partition) == "image" else "text"] += int(count)
 
     # pprint(dict(ids))
-    return dict(ids)
-
+    return dict(sorted(ids.items()))
@@ -0,0 +1,296 @@
+import os
+import time
+import argparse
+import threading
+import numpy as np
+from PIL import Image
+
+from src.ir_service.config import (
+    ENCODER_BACKEND,
+    ENCODER_THREADS,
+    ENCODER_QUANTIZE,
+    ENCODER_CACHE_DIR,
+    ENCODER_COS_TOLERANCE
+)
+from src.ir_service.clip_model import ClipModel
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class TorchEncoder:
+    """Eager PyTorch CLIP towers (the reference implementation)."""
+
+    name = "torch"
+    # Identifies the embeddings an encoder produces: cached and stored
+    # vectors are only valid for the same signature
+    signature = "torch"
+
+    def __init__(self, clip_model: ClipModel, threads: int = ENCODER_THREADS):
+        self.clip_model = clip_model
+        self.threads = threads
+
+    def load(self) -> "TorchEncoder":
+        m = self.clip_model.load()
+        if self.threads > 0:
+            m.torch.set_num_threads(self.threads)
+        return self
+
+    def encode_text(self, sentences: list[str]) -> np.ndarray:
+        """Unnormalized float32 text embeddings [N, 512]."""
+        m = self.clip_model.load()
+        with m.torch.no_grad():
+            text_tokens = m.clip.tokenize(sentences, truncate=True).to(m.device)
+            emb = m.model.encode_text(text_tokens)
+        return emb.detach().cpu().numpy().astype(np.float32)
+
+    def encode_image(self, images: list[Image.Image]) -> np.ndarray:
+        """Unnormalized float32 image embeddings [N, 512]."""
+        m = self.clip_model.load()
+        batch = m.torch.stack([m.preprocess(img) for img in images], dim=0).to(m.device)
+        with m.torch.no_grad():
+            emb = m.model.encode_image(batch)
+        return emb.detach().cpu().numpy().astype(np.float32)
+
+
+class OnnxEncoder:
+    """
+    CLIP text and vision towers exported to ONNX and run with ONNX Runtime.
+
+    The towers are exported from the loaded PyTorch model the first time and
+    cached under `cache_dir`; with `quantize`, weights are additionally
+    converted to int8 (dynamic quantization). Tokenization and image
+    preprocessing still use the `clip` package.
+    """
+
+    name = "onnx"
+
+    def __init__(self, clip_model: ClipModel, cache_dir: str = ENCODER_CACHE_DIR, quantize: bool = ENCODER_QUANTIZE, threads: int = ENCODER_THREADS):
+        self.clip_model = clip_model
+        self.cache_dir = cache_dir
+        self.quantize = quantize
+        self.signature = "onnx-int8" if quantize else "onnx"
+        self.threads = threads
+        self.text_session = None
+        self.image_session = None
+
+    def _path(self, tower: str, quantized: bool) -> str:
+        stem = self.clip_model.name.replace("/", "-")
+        suffix = ".int8" if quantized else ""
+        return os.path.join(self.cache_dir, f"clip-{stem}.{tower}{suffix}.onnx")
+
+    def _export(self, tower: str) -> str:
+        """Export one tower (if not cached) and return the model file to run."""
+        path = self._path(tower, False)
+        m = self.clip_model.load()
+
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch = m.torch
+
+            class Tower(torch.nn.Module):
+                def __init__(self, model):
+                    super().__init__()
+                    self.model = model
+
+                def forward(self, x):
+                    if tower == "text":
+                        return self.model.encode_text(x)
+                    return self.model.encode_image(x)
+
+            if tower == "text":
+                example = m.clip.tokenize(["an example sentence"]).to(m.device)
+                input_name = "tokens"
+            else:
+                example = torch.zeros((1, 3, 224, 224), dtype=next(m.model.parameters()).dtype, device=m.device)
+                input_name = "pixels"
+
+            tmp_path = f"{path}.tmp"
+            kwargs = dict(
+                input_names=[input_name],
+                output_names=["embedding"],
+                dynamic_axes={input_name: {0: "batch"}, "embedding": {0: "batch"}},
+                opset_version=17,
+            )
+            with torch.no_grad():
+                try:
+                    torch.onnx.export(Tower(m.model).eval(), (example,), tmp_path, dynamo=False, **kwargs)
+                except TypeError:
+                    # Older torch without the `dynamo` switch
+                    torch.onnx.export(Tower(m.model).eval(), (example,), tmp_path, **kwargs)
+            os.replace(tmp_path, path)
+            print(f"Exported CLIP {tower} tower → {path}")
+
+        if not self.quantize:
+            return path
+
+        quantized_path = self._path(tower, True)
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            tmp_path = f"{quantized_path}.tmp"
+            quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, quantized_path)
+            print(f"Quantized CLIP {tower} tower → {quantized_path}")
+        return quantized_path
+
+    def _session(self, path: str):
+        options = onnxruntime.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def load(self) -> "OnnxEncoder":
+        if self.image_session is None:
+            if onnxruntime is None:
+                raise ImportError("onnxruntime is not installed")
+            self.text_session = self._session(self._export("text"))
+            self.image_session = self._session(self._export("image"))
+        return self
+
+    def encode_text(self, sentences: list[str]) -> np.ndarray:
+        m = self.clip_model.load()
+        # Same integer dtype the tower was exported with
+        tokens = m.clip.tokenize(sentences, truncate=True).numpy()
+        return self.load().text_session.run(None, {"tokens": tokens})[0].astype(np.float32)
+
+    def encode_image(self, images: list[Image.Image]) -> np.ndarray:
+        m = self.clip_model.load()
+        pixels = np.stack([m.preprocess(img).numpy() for img in images]).astype(np.float32)
+        return self.load().image_session.run(None, {"pixels": pixels})[0].astype(np.float32)
+
+
+# Sample inputs for `compare_encoders` when none are given
+_SAMPLE_SENTENCES = [
+    "A cat sleeping on a sofa.",
+    "Pakistan has a long history of trade along the Silk Road.",
+    "The volleyball team won the championship after five sets.",
+    "Probability theory studies random events.",
+    "Chemical reactions rearrange atoms into new substances.",
+    "The first telephone call was made in 1876.",
+]
+
+
+def _sample_images(count: int = 6) -> list[Image.Image]:
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (256, 320, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def _normalize(emb: np.ndarray) -> np.ndarray:
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def compare_encoders(reference, candidate, sentences: list[str] = None, images: list[Image.Image] = None) -> dict[str, float]:
+    """Lowest cosine similarity between the two encoders' text and image embeddings."""
+    sentences = sentences or _SAMPLE_SENTENCES
+    images = images or _sample_images()
+
+    text_cos = np.sum(_normalize(reference.encode_text(sentences)) * _normalize(candidate.encode_text(sentences)), axis=1)
+    image_cos = np.sum(_normalize(reference.encode_image(images)) * _normalize(candidate.encode_image(images)), axis=1)
+    return {"text_min_cos": float(text_cos.min()), "image_min_cos": float(image_cos.min())}
+
+
+def create_encoder(clip_model: ClipModel, backend: str = ENCODER_BACKEND, tolerance: float = ENCODER_COS_TOLERANCE):
+    """
+    Build the configured backend ("torch" or "onnx"). The ONNX backend is
+    checked against PyTorch on a few sample inputs and the PyTorch encoder is
+    used instead if it is unavailable or drifts below `tolerance` cosine.
+    """
+    reference = TorchEncoder(clip_model).load()
+    if backend == "torch":
+        return reference
+    if backend != "onnx":
+        raise ValueError(f"Unknown encoder backend '{backend}'")
+
+    try:
+        candidate = OnnxEncoder(clip_model).load()
+        check = compare_encoders(reference, candidate)
+    except Exception as e:
+        print(f"Warning: ONNX encoder unavailable ({e}); using PyTorch")
+        return reference
+
+    if min(check.values()) < tolerance:
+        print(f"Warning: ONNX embeddings drift from PyTorch {check} (tolerance {tolerance}); using PyTorch")
+        return reference
+
+    print(f"Using ONNX encoder (quantize={candidate.quantize}) {check}")
+    return candidate
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder(clip_model: ClipModel):
+    """The process-wide encoder for `clip_model`, built on first use."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = create_encoder(clip_model)
+    return _encoder
+
+
+def benchmark(encoders: list, num_sentences: int = 256, num_images: int = 64, batch_size: int = 64) -> list[dict]:
+    """Sentences / images encoded per second by each encoder, in batches of `batch_size`."""
+    sentences = [_SAMPLE_SENTENCES[i % len(_SAMPLE_SENTENCES)] + f" ({i})" for i in range(num_sentences)]
+    images = _sample_images(num_images)
+    rows = []
+
+    for encoder in encoders:
+        # Warm-up run outside the timing
+        encoder.encode_text(sentences[:2])
+        encoder.encode_image(images[:2])
+
+        start = time.perf_counter()
+        for i in range(0, len(sentences), batch_size):
+            encoder.encode_text(sentences[i:i + batch_size])
+        text_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            encoder.encode_image(images[i:i + batch_size])
+        image_elapsed = time.perf_counter() - start
+
+        rows.append({
+            "backend": encoder.name,
+            "quantized": getattr(encoder, "quantize", False),
+            "sentences_per_s": len(sentences) / text_elapsed,
+            "images_per_s": len(images) / image_elapsed,
+        })
+        print(rows[-1])
+
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CLIP encoder backends")
+    parser.add_argument("--threads", type=int, default=ENCODER_THREADS)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check_cmd = sub.add_parser("check", help="cosine similarity of ONNX vs PyTorch embeddings")
+    check_cmd.add_argument("--quantize", action="store_true")
+
+    bench_cmd = sub.add_parser("bench", help="encoding throughput of PyTorch, ONNX and ONNX int8")
+    bench_cmd.add_argument("--sentences", type=int, default=256)
+    bench_cmd.add_argument("--images", type=int, default=64)
+    bench_cmd.add_argument("--batch-size", type=int, default=64)
+
+    args = parser.parse_args()
+    clip_model = ClipModel()
+    reference = TorchEncoder(clip_model, threads=args.threads).load()
+
+    if args.command == "check":
+        candidate = OnnxEncoder(clip_model, quantize=args.quantize, threads=args.threads).load()
+        print(compare_encoders(reference, candidate))
+    else:
+        candidates = [
+            OnnxEncoder(clip_model, quantize=False, threads=args.threads).load(),
+            OnnxEncoder(clip_model, quantize=True, threads=args.threads).load(),
+        ]
+        for candidate in candidates:
+            print(candidate.name, "int8" if candidate.quantize else "fp32", compare_encoders(reference, candidate))
+        benchmark([reference] + candidates, args.sentences, args.images, args.batch_size)
@@ -1,20 +1,44 @@
 import os
-import json
+import threading
 from src.ir_service.embeddings import (
     retrieve_closest_doc, 
     delete_doc_embeddings,
-    display_document_ids_in_vector_db
+    display_document_ids_in_vector_db,
+    open_index_writer,
+    encoder_signature
 )
-from src.ir_service.content_extractor import (
-    extract_and_embed
+from src.ir_service.index_store import publish_doc_limit
+from src.ir_service.pipeline import IndexingPipeline
+from src.ir_service.content_store import (
+    file_digest,
+    get_content_store
 )
+from src.ir_service.scanner import DirectoryScanner
+from src.ir_service.vfs_store import VfsStore, DocsView, PathsView
+from src.ir_service.lexical_index import get_lexical_index, term_frequencies
+from src.ir_service.document_parser import read_content
+from src.ir_service.chunking import chunking_signature
+from src.ir_service.jobs import jobs
+from src.ir_service.metrics import metrics
 
 DOCUMENT_DIR = "../data/"
 
-# Global variables for virtual file system
-index: int = 0
-vfs_by_docId: dict[str, dict] = {}
-vfs_by_path: dict[str, str] = {}
+# Imported into the SQLite store on first open, then kept as a .bak
+LEGACY_VFS_PATH = "virtual_file_system.json"
+
+# The virtual file system lives in SQLite (see VfsStore). Crawls write their
+# changes in one transaction after the index commit, so readers keep seeing
+# the previous VFS until the new index is in place.
+_store: VfsStore | None = None
+_store_lock = threading.Lock()
+
+# Directory listings cached between refreshes, saved next to the VFS
+scanner = DirectoryScanner()
+
+# Serializes crawls: /refresh and the file watcher both update the VFS and the index
+crawl_lock = threading.RLock()
+
+DEFAULT_WHITELIST = {".jpg", ".jpeg", ".png", ".txt", ".pdf", ".doc", ".docx"}
 
 class FileMetadata:
     filename: str
@@ -23,120 +47,383 @@ class FileMetadata:
     size: float
     extension: str
 
-def get_vfs() -> tuple[dict[str, dict], dict[str, str]]:
-    return vfs_by_docId, vfs_by_path
+def get_vfs_store() -> VfsStore:
+    """The VFS store, opened (and migrated from the legacy JSON file) on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = VfsStore()
+                store.migrate_json(LEGACY_VFS_PATH)
+                _store = store
+    return _store
+
+def get_vfs() -> tuple[DocsView, PathsView]:
+    """Read-only (vfs_by_docId, vfs_by_path) views over the committed VFS."""
+    store = get_vfs_store()
+    return DocsView(store), PathsView(store)
 
 def normalize_path(path: str) -> str:
     return path.replace('\\', '/')
 
-def build_virtual_file_system(root: str, whitelist: set[str] = None):
-    global index, vfs_by_docId, vfs_by_path
-    if whitelist is None:
-        whitelist = set([".jpg", ".jpeg", ".png", ".txt", ".pdf", ".doc", ".docx"])
-
-    # Reset globals
-    vfs_by_docId.clear()
-    vfs_by_path.clear()
-
-    for dirpath, _, filenames in os.walk(root):
-        for filename in filenames:
-            _, ext = os.path.splitext(filename)
-            if ext not in whitelist:
-                continue
-
-            file_path = os.path.join(dirpath, filename)
-            file_path = normalize_path(file_path)
-            file_stat = os.stat(file_path)
-            
-            extract_and_embed(file_path, index)
-
-            str_index = str(index)
-            vfs_by_path[file_path] = str_index
-            vfs_by_docId[str_index] = {
-                "filename": filename,
-                "path": file_path,
-                "last_modified": file_stat.st_mtime,
-                "size": file_stat.st_size,
-                "extension": ext
+def _document_terms(file_path: str, text_terms: dict[str, int]) -> dict[str, int]:
+    """Term frequencies of a document for the lexical index: its text plus its file name."""
+    terms = dict(text_terms)
+    name, _ = os.path.splitext(os.path.basename(file_path))
+    for term, tf in term_frequencies(name).items():
+        terms[term] = terms.get(term, 0) + tf
+    return terms
+
+def _file_metadata(file_path: str, filename: str, ext: str, file_stat: os.stat_result, content_hash: str | None = None) -> dict:
+    return {
+        "filename": filename,
+        "path": file_path,
+        "last_modified": file_stat.st_mtime,
+        "size": file_stat.st_size,
+        "extension": ext,
+        "content_hash": content_hash
+    }
+
+
+class _Crawl:
+    """
+    Changes gathered by one crawl. Nothing is written to the VFS store until
+    the index has been committed; the row upserts and deletes then go in a
+    single transaction. New documents' doc ids stay hidden from searches
+    until that transaction has committed, so results never include
+    documents the VFS does not list. Files that fail to index are recorded
+    in the same transaction and skipped until their mtime or size changes.
+    """
+
+    def __init__(self, progress=None):
+        self.store = get_vfs_store()
+        # Doc ids from here on are new in this crawl
+        self.first_doc_id = self.store.next_doc_id()
+        self.next_doc_id = self.first_doc_id
+        self.progress = progress
+        self.encoder = encoder_signature()
+        self.content_store = get_content_store(self.encoder)
+
+        self.jobs: list[tuple[str, int, str | None]] = []
+        self.metadata: dict[str, dict] = {}
+        self.doc_ids_to_remove: list[int] = []
+        self.upserts: dict[int, dict] = {}
+        self.deletes: set[int] = set()
+        self.terms: dict[int, dict[str, int]] = {}
+        self.failures: dict[str, dict] = {}
+        self.cleared_failures: set[str] = set()
+        self.stats = {"added": 0, "modified": 0, "unchanged_content": 0, "deleted": 0, "failed_unchanged": 0}
+        self.changed = False
+
+    def report(self, stage: str, done: int = 0, total: int = 0):
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    def plan_file(self, file_path: str, file_stat: os.stat_result, force: bool = False):
+        """
+        Queue `file_path` for indexing if it is new or its content changed; a
+        file whose mtime changed but whose content hash did not is only
+        re-stamped. A file that failed to index is skipped until its mtime or
+        size changes. `force` re-indexes a known or failed file regardless.
+        """
+        store = self.content_store
+        filename = os.path.basename(file_path)
+        _, ext = os.path.splitext(filename)
+
+        doc_id = self.store.doc_id_of(file_path)
+        if doc_id is None:
+            failure = self.store.failure_of(file_path)
+            if failure is not None and not force and (failure["last_modified"], failure["size"]) == (file_stat.st_mtime, file_stat.st_size):
+                self.stats["failed_unchanged"] += 1
+                return
+
+            content_hash = file_digest(file_path) if store is not None else None
+            doc_id = self.next_doc_id
+            self.next_doc_id += 1
+            self.stats["added"] += 1
+
+        else:
+            known = self.store.get(doc_id)
+            if file_stat.st_mtime == known["last_modified"] and not force:
+                return
+
+            content_hash = file_digest(file_path) if store is not None else None
+            if content_hash is not None and content_hash == known.get("content_hash") and not force:
+                # Touched but unchanged: keep the vectors, refresh the metadata
+                self.upserts[doc_id] = _file_metadata(file_path, filename, ext, file_stat, content_hash)
+                self.stats["unchanged_content"] += 1
+                self.changed = True
+                return
+
+            self.doc_ids_to_remove.append(doc_id)
+            self.stats["modified"] += 1
+
+        self.jobs.append((file_path, doc_id, content_hash))
+        self.metadata[file_path] = _file_metadata(file_path, filename, ext, file_stat, content_hash)
+
+    def forget_file(self, file_path: str, doc_id: int | None = None):
+        if doc_id is None:
+            doc_id = self.store.doc_id_of(file_path)
+        self.doc_ids_to_remove.append(doc_id)
+        self.deletes.add(doc_id)
+        self.stats["deleted"] += 1
+
+    def forget_failure(self, file_path: str):
+        """Drop the failure record of a file that is gone."""
+        self.cleared_failures.add(file_path)
+        self.changed = True
+
+    def apply(self):
+        """
+        Remove stale vectors, run the new/changed files through the indexing
+        pipeline under a single index writer (committed on exit), then
+        commit the VFS changes.
+        """
+        if self.jobs or self.doc_ids_to_remove:
+            self.report("indexing", 0, len(self.jobs))
+            with metrics.timer("crawl.index"), open_index_writer() as writer:
+                writer.hide_docs_from(self.first_doc_id)
+                if self.doc_ids_to_remove:
+                    delete_doc_embeddings(self.doc_ids_to_remove)
+
+                pipeline = IndexingPipeline(store=self.content_store, progress=lambda done, total: self.report("indexing", done, total))
+                failed = pipeline.run(self.jobs)
+
+            for file_path, doc_id, _ in self.jobs:
+                if file_path in failed:
+                    # Left out of the VFS, and not retried until the file changes
+                    self.deletes.add(doc_id)
+                    self.failures[file_path] = {**self.metadata[file_path], "error": failed[file_path]}
+                    continue
+                self.upserts[doc_id] = self.metadata[file_path]
+                self.terms[doc_id] = _document_terms(file_path, pipeline.terms.get(doc_id, {}))
+
+            self.stats.update(pipeline.stats)
+            self.stats["failed"] = len(failed)
+            self.changed = True
+
+            if writer.needs_compaction:
+                jobs.submit("compact", lambda job: compact_index())
+
+        if self.changed:
+            deletes = list(self.deletes - self.upserts.keys())
+            # Stored embeddings of the replaced / deleted content, unless another document still has it
+            dropped = {
+                metadata["content_hash"]
+                for metadata in map(self.store.get, self.doc_ids_to_remove)
+                if metadata is not None and metadata.get("content_hash")
             }
-            
-            index += 1
+            with metrics.timer("crawl.commit_vfs"):
+                self.store.apply(self.upserts, deletes, self.next_doc_id, self.failures, self.cleared_failures)
+
+                lexical = get_lexical_index()
+                if lexical is not None and (self.terms or deletes):
+                    lexical.apply(self.terms, deletes)
+
+            # The VFS lists the new documents: let searches return them
+            publish_doc_limit("faiss_index.idx", self.next_doc_id)
+
+            # Orphaned images are swept by the full prune that runs with compaction
+            store = self.content_store
+            if store is not None and dropped:
+                self.report("pruning")
+                store.remove_documents(dropped - self.store.content_hashes(dropped))
+
+        for item, count in self.stats.items():
+            if count:
+                metrics.inc("fre_crawl_items_total", count, item=item)
+
+
+def compact_index(index_path: str = "faiss_index.idx") -> dict[str, int]:
+    """
+    Physically remove tombstoned documents from the index and prune the
+    embedding store (runs as a background job).
+    """
+    with crawl_lock:
+        with open_index_writer(index_path) as writer:
+            removed = writer.compact()
+
+        # Full sweep of the embedding store: crawls only drop the documents they replaced
+        pruned = 0
+        store = get_content_store(encoder_signature())
+        if store is not None:
+            pruned = store.prune(get_vfs_store().content_hashes())
+    print(f"Compacted index: removed {removed} tombstoned vectors, pruned {pruned} stored embeddings")
+    return {"removed": removed, "pruned": pruned}
+
+
+def backfill_lexical_index(progress=None, batch_size: int = 256) -> int:
+    """
+    Add documents indexed before the lexical index existed: their text is read
+    again (no CLIP involved). Returns the number of documents added.
+    """
+    lexical = get_lexical_index()
+    store = get_vfs_store()
+    if lexical is None or len(lexical) >= len(store):
+        return 0
+
+    indexed = lexical.doc_ids()
+    missing = [doc_id for doc_id in store.doc_ids() if doc_id not in indexed]
+    terms: dict[int, dict[str, int]] = {}
+    for i, doc_id in enumerate(missing):
+        if progress is not None:
+            progress("lexical_backfill", i, len(missing))
+        path = store.get(doc_id)["path"]
+        try:
+            terms[doc_id] = _document_terms(path, term_frequencies(read_content(path)[0]))
+        except Exception as e:
+            print(f"Warning: Failed to read {path} for the lexical index: {e}")
+            terms[doc_id] = _document_terms(path, {})
+        if len(terms) >= batch_size:
+            lexical.apply(terms, [])
+            terms = {}
+    lexical.apply(terms, [])
+    return len(missing)
+
+
+def build_virtual_file_system(root: str, whitelist: set[str] = None) -> dict[str, int]:
+    with crawl_lock:
+        # Start from an empty VFS
+        get_vfs_store().clear()
+        if get_lexical_index() is not None:
+            get_lexical_index().clear()
+        scanner.reset()
+
+        return update_virtual_file_system(root, whitelist, full_scan=True)
 
 
 def save_virtual_file_system():
-    global index, vfs_by_docId, vfs_by_path
-    with open("virtual_file_system.json", "w") as f:
-        json.dump((index, vfs_by_docId, vfs_by_path), f, indent=4)
+    # VFS rows are committed by each crawl; only the scan cache is left to write
+    with crawl_lock:
+        scanner.save()
 
 
 def load_virtual_file_system():
-    global index, vfs_by_docId, vfs_by_path
-
-    if os.path.exists("virtual_file_system.json"):
-        with open("virtual_file_system.json", "r") as f:
-            index, vfs_by_docId, vfs_by_path = json.load(f)
-    else:
-        vfs_by_docId = {}
-        vfs_by_path = {}
-        index = 0
-
-
-def update_virtual_file_system(root: str = DOCUMENT_DIR, whitelist: set[str] = None):
-    global index, vfs_by_docId, vfs_by_path
-
+    with crawl_lock:
+        if len(get_vfs_store()) > 0:
+            scanner.load()
+        else:
+            scanner.reset()
+
+
+def update_virtual_file_system(root: str = DOCUMENT_DIR, whitelist: set[str] = None, full_scan: bool | None = None, progress=None) -> dict[str, int]:
+    """
+    Bring the VFS and the index in line with the files under `root`.
+
+    Directories whose mtime did not change are not re-listed and their files
+    not re-stat-ed, unless this is a full scan (see DirectoryScanner).
+    Files whose mtime changed but whose content hash did not are only
+    re-stamped. `progress(stage, done, total)` is called as the crawl
+    advances. Returns crawl statistics.
+    """
     if whitelist is None:
-        whitelist = set([".jpg", ".jpeg", ".png", ".txt", ".pdf", ".doc", ".docx"])
-
-    for dirpath, _, filenames in os.walk(root):
-        for filename in filenames:
-
-            _, ext = os.path.splitext(filename)
-            if ext not in whitelist:
+        whitelist = DEFAULT_WHITELIST
+
+    with crawl_lock, metrics.timer("crawl"):
+        crawl = _Crawl(progress)
+        crawl.report("scanning")
+        with metrics.timer("crawl.scan"):
+            result = scanner.scan(root, whitelist, full=full_scan)
+
+        # Documents built with other chunking settings or another encoder are re-encoded
+        chunking = chunking_signature()
+        built_with = crawl.store.get_setting("chunking") or ("sentences" if len(crawl.store) else chunking)
+        reindex = built_with != chunking
+        if reindex:
+            print(f"Text chunking changed ({built_with} → {chunking}): re-indexing every document")
+        encoder = crawl.encoder
+        encoded_with = crawl.store.get_setting("encoder") or ("torch" if len(crawl.store) else encoder)
+        if encoded_with != encoder:
+            print(f"Encoder changed ({encoded_with} → {encoder}): re-indexing every document")
+            reindex = True
+
+        # Unchanged directories can still hold files missing from the VFS,
+        # e.g. ones that failed to index (skipped while they are unchanged)
+        prefix = normalize_path(os.path.join(root, ""))
+        known = dict(crawl.store.paths(prefix))
+        candidates = dict(result.files)
+        for file_path in result.unchanged:
+            if file_path not in known or reindex:
+                try:
+                    candidates[file_path] = os.stat(file_path)
+                except OSError:
+                    continue
+
+        crawl.report("hashing", 0, len(candidates))
+        with metrics.timer("crawl.hash"):
+            for i, file_path in enumerate(sorted(candidates)):
+                crawl.plan_file(file_path, candidates[file_path], force=reindex)
+                if i % 256 == 255:
+                    crawl.report("hashing", i + 1, len(candidates))
+
+        # Known paths under `root` the scan did not see are gone
+        seen = result.paths()
+        for path, doc_id in known.items():
+            if path not in seen:
+                crawl.forget_file(path, doc_id)
+        for path in crawl.store.failed_paths(prefix):
+            if path not in seen:
+                crawl.forget_failure(path)
+
+        crawl.apply()
+        crawl.store.set_setting("chunking", chunking)
+        crawl.store.set_setting("encoder", encoder)
+        backfilled = backfill_lexical_index(progress)
+
+    stats = {
+        "full_scan": result.full,
+        "scanned": result.stats["scanned"],
+        "skipped": result.stats["skipped"],
+        **crawl.stats,
+        **({"lexical_backfilled": backfilled} if backfilled else {})
+    }
+    print(f"Updated virtual file system: {stats}")
+    return stats
+
+
+def sync_paths(paths: list[str], whitelist: set[str] = None) -> dict[str, int]:
+    """
+    Re-index only `paths` (files or directories) instead of crawling the whole
+    tree: new and changed files are indexed, vanished ones removed. Used by the
+    file watcher. Returns crawl statistics.
+    """
+    if whitelist is None:
+        whitelist = DEFAULT_WHITELIST
+
+    with crawl_lock, metrics.timer("crawl"):
+        crawl = _Crawl()
+
+        # Expand directories (created, moved or deleted as a whole) into files
+        files = set()
+        for path in map(normalize_path, paths):
+            prefix = path.rstrip("/") + "/"
+            files.update(p for p, _ in crawl.store.paths(prefix))
+            files.update(crawl.store.failed_paths(prefix))
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    files.update(normalize_path(os.path.join(dirpath, f)) for f in filenames)
+            else:
+                files.add(path)
+
+        for file_path in sorted(files):
+            if os.path.splitext(file_path)[1] not in whitelist:
                 continue
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                doc_id = crawl.store.doc_id_of(file_path)
+                if doc_id is not None:
+                    crawl.forget_file(file_path, doc_id)
+                elif crawl.store.failure_of(file_path) is not None:
+                    crawl.forget_failure(file_path)
+                continue
+            crawl.plan_file(file_path, file_stat)
+
+        crawl.apply()
+        if crawl.changed:
+            save_virtual_file_system()
 
-            file_path = os.path.join(dirpath, filename)
-            file_path = normalize_path(file_path)
-            file_stat = os.stat(file_path)
-
-            if file_path not in vfs_by_path:
-                extract_and_embed(file_path, index)
-                
-                str_index = str(index)
-                vfs_by_path[file_path] = str_index
-                vfs_by_docId[str_index] = {
-                    "filename": filename,
-                    "path": file_path,
-                    "last_modified": file_stat.st_mtime,
-                    "size": file_stat.st_size,
-                    "extension": ext
-                }
-                index += 1
-                
-            elif file_stat.st_mtime != vfs_by_docId[vfs_by_path[file_path]]["last_modified"]:
-                str_index = vfs_by_path[file_path]
-
-                index = int(str_index)
-
-                delete_doc_embeddings([index])
-                extract_and_embed(file_path, index)
-
-                vfs_by_docId[str_index] = {
-                    "filename": filename,
-                    "path": file_path,
-                    "last_modified": file_stat.st_mtime,
-                    "size": file_stat.st_size,
-                    "extension": os.path.splitext(filename)[1]
-                }
-    
-    docIds_to_delete = []
-    for path, doc_id in list(vfs_by_path.items()):
-        if not os.path.exists(path):
-            docIds_to_delete.append(int(doc_id))
-            del vfs_by_docId[doc_id]
-            del vfs_by_path[path]
-
-    if docIds_to_delete:
-        delete_doc_embeddings(docIds_to_delete)
+    return crawl.stats
 
 
 if __name__ == "__main__":
@@ -151,6 +438,7 @@ if __name__ == "__main__":
         output.append((id, score))
     output.sort(key=lambda x: x[1], reverse=True)
 
+    vfs_by_docId, _ = get_vfs()
     for id, score in output:
         print(vfs_by_docId[id]["filename"], " - ", score)
 
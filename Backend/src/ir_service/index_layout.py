@@ -0,0 +1,234 @@
+import os
+import glob
+import json
+import faiss
+import numpy as np
+
+from src.ir_service.config import INDEX_SHARDS
+
+# ID offset for combining doc_id and segment index:
+# text vectors use doc_id * offset + [0, 0.9 * offset),
+# image vectors use doc_id * offset + [0.9 * offset, offset)
+offset = 10**5
+
+# Text and image vectors live in separate sub-indexes ("partitions"), each
+# further split into shards by doc_id % shards: "text.0", "image.3", ...
+# With a single shard the partitions are just "text" and "image".
+MODALITIES = ("text", "image")
+
+# Document-level partition: one pooled (mean) vector per document and
+# modality, searched first to pick the documents whose vectors are re-scored
+CENTROIDS = "centroids"
+
+
+def is_image_id(ids: np.ndarray) -> np.ndarray:
+    return (np.asarray(ids) % offset) >= (0.9 * offset)
+
+
+def partition_name(modality: str, shard: int, shards: int = INDEX_SHARDS) -> str:
+    return modality if shards == 1 else f"{modality}.{shard}"
+
+
+def partition_names(shards: int = INDEX_SHARDS) -> list[str]:
+    return [partition_name(modality, shard, shards) for modality in MODALITIES for shard in range(shards)]
+
+
+def is_vector_partition(partition: str) -> bool:
+    """Whether `partition` holds sentence / image vectors (as opposed to the centroids)."""
+    return partition != CENTROIDS
+
+
+def modality_of(partition: str) -> str:
+    return partition.split(".")[0]
+
+
+def shard_of(partition: str) -> int:
+    _, _, shard = partition.partition(".")
+    return int(shard) if shard else 0
+
+
+def partition_of(ids: np.ndarray, shards: int = INDEX_SHARDS) -> np.ndarray:
+    """Partition name for every vector ID."""
+    ids = np.asarray(ids)
+    modalities = np.where(is_image_id(ids), "image", "text")
+    if shards == 1:
+        return modalities
+    return np.char.add(np.char.add(modalities, "."), ((ids // offset) % shards).astype(str))
+
+
+def _stem(index_path: str) -> str:
+    return os.path.splitext(index_path)[0]
+
+
+def manifest_path(index_path: str) -> str:
+    return f"{_stem(index_path)}.manifest.json"
+
+
+def partition_file(index_path: str, partition: str, generation: int) -> str:
+    return f"{_stem(index_path)}.{partition}.g{generation}.idx"
+
+
+def ranges_file(index_path: str, generation: int) -> str:
+    return f"{_stem(index_path)}.{CENTROIDS}.g{generation}.ranges.npy"
+
+
+def read_manifest(index_path: str) -> dict | None:
+    """
+    The manifest names the file holding each partition of the published
+    index generation and the doc ids deleted from it but not yet compacted
+    away: {"generation": n, "partitions": {name: file}, "tombstones": [doc_id, ...]}.
+    "next_doc_id" is one past the highest doc id ever added, and doc ids from
+    "doc_limit" on are not searched yet (see `IndexWriter.hide_docs_from`).
+    "centroid_ranges" names the file with the vector ID range of every
+    centroid (see `read_centroid_ranges`).
+    """
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def publish_indexes(
+    index_path: str,
+    indexes: dict[str, faiss.Index],
+    tombstones: list[int] | None = None,
+    replace: bool = False,
+    doc_limit: int | None = None,
+    next_doc_id: int | None = None,
+    centroid_ranges: np.ndarray | None = None,
+) -> int:
+    """
+    Write `indexes` (partition name -> index) as a new generation and
+    atomically switch the manifest to it. Partitions not passed in (unless
+    `replace` is set), and the tombstones, doc limit, next doc id and
+    centroid ranges when passed as None, are carried over unchanged.
+    Returns the new generation number.
+    """
+    manifest = read_manifest(index_path) or {"generation": 0, "partitions": {}}
+    if tombstones is None:
+        tombstones = manifest.get("tombstones", [])
+    if doc_limit is None:
+        doc_limit = manifest.get("doc_limit")
+    if next_doc_id is None:
+        next_doc_id = manifest.get("next_doc_id")
+    generation = manifest["generation"] + 1
+    directory = os.path.dirname(manifest_path(index_path))
+    files = {} if replace else dict(manifest["partitions"])
+
+    for partition, index in indexes.items():
+        path = partition_file(index_path, partition, generation)
+        faiss.write_index(index, path)
+        files[partition] = os.path.basename(path)
+
+    ranges_name = manifest.get("centroid_ranges")
+    if centroid_ranges is not None:
+        path = ranges_file(index_path, generation)
+        with open(path, "wb") as f:
+            np.save(f, np.asarray(centroid_ranges, dtype=np.int64).reshape(-1, 3))
+        ranges_name = os.path.basename(path)
+
+    published = {"generation": generation, "partitions": files, "tombstones": sorted(tombstones)}
+    if doc_limit is not None:
+        published["doc_limit"] = doc_limit
+    if next_doc_id is not None:
+        published["next_doc_id"] = next_doc_id
+    if ranges_name is not None:
+        published["centroid_ranges"] = ranges_name
+
+    tmp_path = f"{manifest_path(index_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(published, f, indent=4)
+    os.replace(tmp_path, manifest_path(index_path))
+
+    keep = set(files.values()) | ({ranges_name} if ranges_name is not None else set())
+    _remove_stale_files(index_path, {os.path.join(directory, name) for name in keep})
+    return generation
+
+
+def _remove_stale_files(index_path: str, keep: set[str]):
+    stem = glob.escape(_stem(index_path))
+    for path in glob.glob(f"{stem}.*.g*.idx") + glob.glob(f"{stem}.*.g*.ranges.npy"):
+        if os.path.normpath(path) in {os.path.normpath(p) for p in keep}:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Still mapped by a reader (Windows); retried on the next publish
+            pass
+
+
+def open_partitions(index_path: str, manifest: dict, io_flags: int = 0) -> dict[str, faiss.Index]:
+    directory = os.path.dirname(manifest_path(index_path))
+    return {
+        partition: faiss.read_index(os.path.join(directory, name), io_flags)
+        for partition, name in manifest["partitions"].items()
+    }
+
+
+def read_centroid_ranges(index_path: str, manifest: dict) -> np.ndarray | None:
+    """
+    The vector IDs covered by each centroid, as rows of (centroid ID, first
+    vector ID, last vector ID) sorted by centroid ID, or None when the
+    index was published without them.
+    """
+    name = manifest.get("centroid_ranges")
+    if name is None or CENTROIDS not in manifest["partitions"]:
+        return None
+    with open(os.path.join(os.path.dirname(manifest_path(index_path)), name), "rb") as f:
+        return np.load(f)
+
+
+def _split(sources: list[faiss.Index], shards: int) -> dict[str, faiss.Index]:
+    """Redistribute the vectors of `sources` into the partitions of a `shards`-shard layout."""
+    # Imported here: index_tools depends on this module
+    from src.ir_service.index_tools import export_vectors
+
+    exported = [export_vectors(index) for index in sources]
+    ids = np.concatenate([i for i, _ in exported])
+    vectors = np.concatenate([v for _, v in exported])
+    partitions = partition_of(ids, shards)
+
+    indexes = {}
+    for partition in partition_names(shards):
+        index = faiss.clone_index(sources[0])
+        index.reset()
+        mask = partitions == partition
+        if mask.any():
+            index.add_with_ids(vectors[mask], ids[mask])
+        indexes[partition] = index
+    return indexes
+
+
+def migrate_legacy_index(index_path: str, shards: int = INDEX_SHARDS):
+    """
+    Split a single, pre-partition index file (text and image vectors mixed)
+    into partitions. The old file is kept as `<index_path>.bak`.
+    """
+    if read_manifest(index_path) is not None or not os.path.exists(index_path):
+        return
+
+    publish_indexes(index_path, _split([faiss.read_index(index_path)], shards))
+    os.replace(index_path, f"{index_path}.bak")
+    print(f"Split '{index_path}' into {shards} shard(s) of text / image partitions")
+
+
+def reshard_index(index_path: str, shards: int = INDEX_SHARDS):
+    """
+    Redistribute a published index whose partitions do not match a
+    `shards`-shard layout (e.g. after INDEX_SHARDS changed). The centroids
+    do not depend on the layout and are carried over.
+    """
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        return
+    vector_partitions = [p for p in manifest["partitions"] if is_vector_partition(p)]
+    if set(vector_partitions) == set(partition_names(shards)):
+        return
+
+    opened = open_partitions(index_path, manifest)
+    indexes = _split([opened[p] for p in vector_partitions], shards)
+    if CENTROIDS in opened:
+        indexes[CENTROIDS] = opened[CENTROIDS]
+    publish_indexes(index_path, indexes, replace=True)
+    print(f"Resharded '{index_path}' from {len(vector_partitions)} into {2 * shards} partitions")
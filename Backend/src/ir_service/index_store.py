@@ -0,0 +1,637 @@
+import os
+import threading
+import faiss
+import numpy as np
+from contextlib import contextmanager
+
+from src.ir_service.config import (
+    INDEX_FACTORY,
+    VECTOR_STORAGE,
+    TRAIN_SAMPLE_SIZE,
+    COMPACT_THRESHOLD,
+    INDEX_SHARDS
+)
+from src.ir_service.index_layout import (
+    offset,
+    CENTROIDS,
+    partition_of,
+    partition_names,
+    shard_of,
+    manifest_path,
+    read_manifest,
+    read_centroid_ranges,
+    publish_indexes,
+    migrate_legacy_index,
+    reshard_index
+)
+from src.ir_service.index_tools import (
+    create_index,
+    resolve_factory,
+    export_vectors,
+    training_minimum,
+    is_exact,
+    train_on_sample,
+    rebuild_without
+)
+from src.ir_service.vector_store import get_exact_store
+from src.ir_service.metrics import metrics
+
+
+class _IndexPartition:
+    """
+    One resident sub-index (a text or image shard) of an IndexWriter.
+
+    A layout that must be trained (IVF / PQ) is only built once the partition
+    holds enough vectors to train it; until then the partition stays exact
+    (flat), which is also the better choice for that few vectors.
+    """
+
+    def __init__(self, name: str, index: faiss.Index, factory: str = INDEX_FACTORY, storage: str = VECTOR_STORAGE):
+        self.name = name
+        self.shard = shard_of(name)
+        self.index = index
+        self.dirty = False
+
+        self.factory = factory
+        self.storage = storage
+        # Vectors needed to train the configured layout (0 = no training)
+        self.min_train = training_minimum(create_index(index.d, factory, storage))
+
+        self._pending_emb: list[np.ndarray] = []
+        self._pending_ids: list[np.ndarray] = []
+        self.pending_count = 0
+
+    def add(self, emb: np.ndarray, ids: np.ndarray):
+        self._pending_emb.append(emb)
+        self._pending_ids.append(ids)
+        self.pending_count += len(ids)
+
+    def flush(self, force: bool = False):
+        """
+        Move buffered vectors into the in-memory index. An untrained (IVF/PQ)
+        index keeps buffering until it has TRAIN_SAMPLE_SIZE vectors to train
+        on, or until `force` is set by commit. With fewer than `min_train`
+        vectors the partition is kept exact instead.
+        """
+        if not self.pending_count:
+            return
+        if not self.index.is_trained and self.pending_count < TRAIN_SAMPLE_SIZE and not force:
+            return
+
+        emb = np.concatenate(self._pending_emb, axis=0)
+        ids = np.concatenate(self._pending_ids, axis=0)
+        if not self.index.is_trained and len(ids) < self.min_train:
+            self.index = create_index(self.index.d, "Flat", "float32")
+        train_on_sample(self.index, emb)
+        self.index.add_with_ids(emb, ids)
+
+        self._pending_emb.clear()
+        self._pending_ids.clear()
+        self.pending_count = 0
+        self.dirty = True
+
+        # Same rule as for an untrained index: train on a full sample, or at commit
+        if self.staged and self.index.ntotal >= self.min_train and (force or self.index.ntotal >= TRAIN_SAMPLE_SIZE):
+            self._convert()
+
+    @property
+    def staged(self) -> bool:
+        """Whether the partition is held exact until it can train its configured layout."""
+        return self.min_train > 0 and is_exact(self.index)
+
+    def _convert(self):
+        """Rebuild the (exact) partition in its configured layout, trained on its vectors."""
+        ids, vectors = export_vectors(self.index)
+        index = create_index(self.index.d, self.factory, self.storage)
+        train_on_sample(index, vectors)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        self.dirty = True
+        print(f"Converted {self.name} partition to '{resolve_factory(self.factory, self.storage)}' ({len(ids)} vectors)")
+
+    def doc_counts(self, doc_ids: np.ndarray, offset: int = offset) -> dict[int, int]:
+        """Number of vectors each of `doc_ids` has in this partition (one pass over the ids)."""
+        stored_docs = faiss.vector_to_array(self.index.id_map) // offset
+        found, counts = np.unique(stored_docs[np.isin(stored_docs, doc_ids)], return_counts=True)
+        return {int(doc_id): int(count) for doc_id, count in zip(found, counts)}
+
+    def purge(self, doc_ids: np.ndarray, offset: int = offset) -> int:
+        """
+        Physically remove every vector of `doc_ids` with a single batched
+        remove_ids call, i.e. one pass over the index however many documents
+        are removed. Returns the number of vectors removed.
+        """
+        stored_ids = faiss.vector_to_array(self.index.id_map)
+        remove_mask = np.isin(stored_ids // offset, doc_ids)
+        removed = int(remove_mask.sum())
+        if not removed:
+            return 0
+
+        try:
+            self.index.remove_ids(faiss.IDSelectorBatch(stored_ids[remove_mask]))
+        except RuntimeError:
+            # e.g. HNSW cannot remove in place: rebuild without the documents
+            self.index = rebuild_without(self.index, remove_mask)
+
+        self.dirty = True
+        return removed
+
+    def doc_centroids(self, doc_ids: np.ndarray, offset: int = offset) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The normalized mean vector of each of `doc_ids` stored in this
+        partition, with the IDs of the document's first and last vector
+        here (the last one doubles as the centroid's ID). Documents without
+        vectors here are left out.
+        """
+        stored_ids = faiss.vector_to_array(self.index.id_map)
+        positions = np.flatnonzero(np.isin(stored_ids // offset, doc_ids))
+        if len(positions) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.zeros((0, self.index.d), dtype=np.float32)
+
+        ids, vectors = export_vectors(self.index, positions)
+        order = np.argsort(ids, kind="stable")
+        ids, vectors = ids[order], vectors[order]
+        docs = ids // offset
+        starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+
+        centroids = np.add.reduceat(vectors, starts, axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return ids[starts], ids[ends - 1], np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class IndexWriter:
+    """
+    Keeps the FAISS index resident in memory while documents are being indexed.
+
+    Text and image vectors go to separate partitions, each sharded by
+    doc_id % INDEX_SHARDS; only the shards a crawl touched are rewritten on
+    commit. Vectors passed to `add`
+    are buffered and moved into the in-memory partitions once `batch_size` of
+    them have accumulated. Nothing is written to disk until `commit`, which
+    publishes the changed partitions as a new index generation, so a whole
+    crawl costs a single serialization.
+
+    Removed documents become tombstones (published in the manifest, filtered
+    out at search time) instead of being removed one by one. Documents that
+    are re-indexed are physically removed in one batched pass right before
+    their new vectors go in; the rest stay tombstones until `compact`, which
+    is due once they exceed COMPACT_THRESHOLD of the stored vectors.
+
+    Alongside the partitions, the writer keeps the "centroids" index: one
+    mean vector per document and modality, recomputed on commit for every
+    document added or removed during the session, used by two-stage search.
+    Each centroid's first and last vector ID are published with it (see
+    `read_centroid_ranges`), so searches find a document's vectors without
+    scanning the partitions.
+    """
+
+    def __init__(
+        self,
+        index_path: str = "faiss_index.idx",
+        dim: int = 512,
+        batch_size: int = 4096,
+        shards: int = INDEX_SHARDS,
+        factory: str = INDEX_FACTORY,
+        storage: str = VECTOR_STORAGE,
+    ):
+        self.index_path = index_path
+        self.dim = dim
+        self.batch_size = batch_size
+        self.shards = shards
+
+        migrate_legacy_index(index_path, shards)
+        reshard_index(index_path, shards)
+        manifest = read_manifest(index_path)
+        indexes = {}
+        self.tombstones: set[int] = set()
+        self.doc_limit: int | None = None
+        if manifest is not None:
+            self.tombstones = set(manifest.get("tombstones", []))
+            self.doc_limit = manifest.get("doc_limit")
+            directory = os.path.dirname(manifest_path(index_path))
+            for name, file_name in manifest["partitions"].items():
+                indexes[name] = faiss.read_index(os.path.join(directory, file_name))
+
+        self.partitions = {
+            name: _IndexPartition(name, indexes[name] if name in indexes else create_index(dim, factory, storage), factory, storage)
+            for name in partition_names(shards)
+        }
+        # Always exact: it holds one vector per document
+        self.centroids = indexes[CENTROIDS] if CENTROIDS in indexes else create_index(dim, "Flat", "float32")
+        ranges = read_centroid_ranges(index_path, manifest) if manifest is not None else None
+        # centroid ID -> (first, last) vector ID
+        self.centroid_ranges: dict[int, tuple[int, int]] = {
+            int(centroid_id): (int(first), int(last)) for centroid_id, first, last in (ranges if ranges is not None else [])
+        }
+        # Full-precision copies for re-ranking when the index stores compressed codes
+        self.exact_store = get_exact_store(index_path)
+
+        self._pending_count = 0
+        # Tombstoned documents re-added during this session: purged before their new vectors go in
+        self._purge: set[int] = set()
+        self._tombstones_changed = False
+        self._doc_limit_changed = False
+        self.needs_compaction = False
+        # Documents whose centroids are recomputed on commit
+        self._touched: set[int] = set()
+        if (CENTROIDS not in indexes or ranges is None) and self.ntotal:
+            # Index published before there were centroids (or their ranges): build them all
+            for partition in self.partitions.values():
+                self._touched.update(np.unique(faiss.vector_to_array(partition.index.id_map) // offset).tolist())
+
+        # One past the highest doc id added so far
+        if manifest is not None and "next_doc_id" in manifest:
+            self.next_doc_id = manifest["next_doc_id"]
+        else:
+            self.next_doc_id = max(
+                (int(faiss.vector_to_array(p.index.id_map).max()) // offset + 1 for p in self.partitions.values() if p.index.ntotal),
+                default=0,
+            )
+
+    @property
+    def ntotal(self) -> int:
+        return sum(p.index.ntotal for p in self.partitions.values())
+
+    def add(self, emb: np.ndarray, ids: np.ndarray):
+        """Buffer normalized embeddings together with their vector IDs."""
+        if len(ids) == 0:
+            return
+
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if self.exact_store is not None:
+            self.exact_store.append(ids, emb)
+
+        # Re-added documents: their old vectors must go before these are added
+        added_docs = np.unique(ids // offset).tolist()
+        self._touched.update(added_docs)
+        self.next_doc_id = max(self.next_doc_id, added_docs[-1] + 1)
+        if self.tombstones:
+            revived = self.tombstones.intersection(added_docs)
+            self._purge.update(revived)
+
+        partitions = partition_of(ids, self.shards)
+        for name, partition in self.partitions.items():
+            mask = partitions == name
+            if mask.any():
+                partition.add(emb[mask], ids[mask])
+
+        self._pending_count += len(ids)
+        if self._pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self, force: bool = False):
+        """Move buffered vectors into the in-memory partitions."""
+        if self._purge and self._pending_count:
+            self._remove(self._purge)
+            self._purge.clear()
+
+        for partition in self.partitions.values():
+            partition.flush(force)
+        self._pending_count = sum(p.pending_count for p in self.partitions.values())
+
+    def _by_partition(self, doc_ids: np.ndarray):
+        """(partition, the doc ids among `doc_ids` that live in its shard) for the affected partitions."""
+        shards = doc_ids % self.shards
+        for partition in self.partitions.values():
+            in_shard = doc_ids[shards == partition.shard]
+            if len(in_shard):
+                yield partition, in_shard
+
+    def _remove(self, doc_ids: set[int]) -> int:
+        """Physically remove `doc_ids` (one pass per affected shard) and drop their tombstones."""
+        doc_ids_np = np.fromiter(doc_ids, dtype=np.int64, count=len(doc_ids))
+        removed = sum(p.purge(in_shard) for p, in_shard in self._by_partition(doc_ids_np))
+        self.tombstones.difference_update(doc_ids)
+        self._touched.update(doc_ids)
+        self._tombstones_changed = True
+        return removed
+
+    def remove_docs(self, doc_ids: list[int], offset: int = offset) -> dict[int, int]:
+        """
+        Tombstone every vector belonging to `doc_ids`; searches stop returning
+        them once committed. Returns a dict mapping each doc_id to the number
+        of vectors removed.
+        """
+        doc_ids_np = np.asarray(doc_ids, dtype=np.int64)
+        removed_counts = {doc_id: 0 for doc_id in doc_ids}
+        for partition, in_shard in self._by_partition(doc_ids_np):
+            for doc_id, count in partition.doc_counts(in_shard, offset).items():
+                removed_counts[doc_id] += count
+
+        # Only tombstoned: `add` queues the purge of those that are re-indexed
+        self.tombstones.update(int(doc_id) for doc_id in doc_ids)
+        self._tombstones_changed = True
+        return removed_counts
+
+    def hide_docs_from(self, doc_limit: int):
+        """
+        Keep doc ids from `doc_limit` on out of searches, until
+        `publish_doc_limit` raises the limit: a crawl's new documents are
+        only searched once the VFS lists them. Vectors already stored from
+        `doc_limit` on were added by a crawl whose VFS commit failed; they
+        are tombstoned (and purged if their doc ids are handed out again).
+        """
+        if self.next_doc_id > doc_limit:
+            self.remove_docs(list(range(doc_limit, self.next_doc_id)))
+            self.next_doc_id = doc_limit
+        if self.doc_limit != doc_limit:
+            self.doc_limit = doc_limit
+            self._doc_limit_changed = True
+
+    def tombstoned_count(self) -> int:
+        """Number of stored vectors that belong to tombstoned documents."""
+        if not self.tombstones:
+            return 0
+        tombstones = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+        return sum(sum(p.doc_counts(in_shard).values()) for p, in_shard in self._by_partition(tombstones))
+
+    def compact(self) -> int:
+        """Physically remove all tombstoned documents. Returns the number of vectors removed."""
+        self.flush(force=True)
+        self._purge.clear()
+        if not self.tombstones:
+            return 0
+        return self._remove(set(self.tombstones))
+
+    def _update_centroids(self) -> bool:
+        """Recompute the centroids of the documents touched since the last commit."""
+        if not self._touched:
+            return False
+        touched = np.fromiter(self._touched, dtype=np.int64, count=len(self._touched))
+        self._touched.clear()
+
+        stored_ids = faiss.vector_to_array(self.centroids.id_map)
+        stale = stored_ids[np.isin(stored_ids // offset, touched)]
+        if len(stale):
+            self.centroids.remove_ids(faiss.IDSelectorBatch(stale))
+        for centroid_id in stale.tolist():
+            self.centroid_ranges.pop(centroid_id, None)
+
+        for partition, in_shard in self._by_partition(touched):
+            first_ids, last_ids, centroids = partition.doc_centroids(in_shard)
+            if len(last_ids):
+                self.centroids.add_with_ids(centroids, last_ids)
+                self.centroid_ranges.update(zip(last_ids.tolist(), zip(first_ids.tolist(), last_ids.tolist())))
+        return True
+
+    def _centroid_ranges_array(self) -> np.ndarray:
+        """`centroid_ranges` as published: (centroid ID, first, last) rows sorted by centroid ID."""
+        rows = [(centroid_id, first, last) for centroid_id, (first, last) in sorted(self.centroid_ranges.items())]
+        return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+    def commit(self):
+        """Flush pending vectors and publish the changed partitions as a new generation."""
+        self.flush(force=True)
+        self._pending_count = 0
+        # Re-indexed documents were purged by the flush; deleted ones stay tombstones until compaction
+        self._purge.clear()
+
+        dirty = {name: p.index for name, p in self.partitions.items() if p.dirty}
+        if self._update_centroids():
+            dirty[CENTROIDS] = self.centroids
+        if read_manifest(self.index_path) is None:
+            # The first commit publishes every partition, even empty ones
+            dirty = {name: p.index for name, p in self.partitions.items()}
+            dirty[CENTROIDS] = self.centroids
+        if not dirty and not self._tombstones_changed and not self._doc_limit_changed:
+            return
+        ranges = self._centroid_ranges_array() if CENTROIDS in dirty else None
+
+        tombstoned = self.tombstoned_count()
+        self.needs_compaction = tombstoned > COMPACT_THRESHOLD * max(self.ntotal, 1)
+
+        with metrics.timer("index.commit"):
+            generation = publish_indexes(
+                self.index_path,
+                dirty,
+                [int(doc_id) for doc_id in self.tombstones],
+                doc_limit=self.doc_limit,
+                next_doc_id=self.next_doc_id,
+                centroid_ranges=ranges,
+            )
+        for partition in self.partitions.values():
+            partition.dirty = False
+        self._tombstones_changed = False
+        self._doc_limit_changed = False
+
+        print(
+            f"Committed {self.ntotal} vectors ({tombstoned} tombstoned) → {self.index_path} "
+            f"(generation {generation}, {len(dirty)}/{len(self.partitions) + 1} partitions rewritten)"
+        )
+
+        # Rows of removed / re-indexed vectors pile up in the exact store
+        if self.exact_store is not None and len(self.exact_store) > 2 * self.ntotal + self.batch_size:
+            live_ids = np.concatenate([faiss.vector_to_array(p.index.id_map) for p in self.partitions.values()])
+            self.exact_store.compact(live_ids)
+
+
+# Writer shared by embed_* / delete_doc_embeddings while a crawl is running
+_active_writer: IndexWriter | None = None
+
+
+@contextmanager
+def open_index_writer(index_path: str = "faiss_index.idx", batch_size: int = 4096):
+    """
+    Keep one IndexWriter open for the duration of the `with` block. Every
+    embed_text / embed_image / delete_doc_embeddings call targeting the same
+    index path goes through it, and the index is committed once on exit.
+    """
+    global _active_writer
+
+    if _active_writer is not None and _active_writer.index_path == index_path:
+        yield _active_writer
+        return
+
+    previous = _active_writer
+    writer = IndexWriter(index_path, batch_size=batch_size)
+    _active_writer = writer
+    try:
+        yield writer
+        writer.commit()
+    finally:
+        _active_writer = previous
+
+
+def publish_doc_limit(index_path: str, doc_limit: int):
+    """
+    Let searches see the doc ids below `doc_limit` (see
+    `IndexWriter.hide_docs_from`). Only the manifest is rewritten.
+    """
+    manifest = read_manifest(index_path)
+    if manifest is None or manifest.get("doc_limit", doc_limit) >= doc_limit:
+        return
+    publish_indexes(index_path, {}, doc_limit=doc_limit)
+
+
+def get_writer(index_path: str) -> tuple[IndexWriter, bool]:
+    """
+    Return the writer for `index_path` and whether it was created just for
+    this call (in which case the caller must commit it).
+    """
+    if _active_writer is not None and _active_writer.index_path == index_path:
+        return _active_writer, False
+    return IndexWriter(index_path), True
+
+
+def _read_index_for_search(path: str) -> faiss.Index:
+    """
+    Open an index file read-only, memory-mapping it where the installed FAISS
+    supports it so that several processes share the same pages.
+    """
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, io_flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class IndexReader:
+    """
+    Long-lived, query-side handle on the published index.
+
+    Partition files are opened once and reused across requests. Every `get`
+    does a cheap `os.stat` of the manifest; partitions are only re-opened when
+    the writer has published a new generation, and files that did not change
+    between generations keep their open handle.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.indexes: dict[str, faiss.Index] = {}
+        # (partitions, doc ids not to return) of the open generation, swapped as one
+        self.current: tuple[dict[str, faiss.Index], np.ndarray] = ({}, np.empty(0, dtype=np.int64))
+        self.files: dict[str, str] = {}
+        self.generation: int | None = None
+        self._stat: tuple[int, int, int] | None = None
+        self._lock = threading.Lock()
+        # partition -> (index, sorted vector IDs, their offsets in the id map), built on demand
+        self._positions: dict[str, tuple[faiss.Index, np.ndarray, np.ndarray]] = {}
+        # (centroids index, its ranges) of the open generation, see `read_centroid_ranges`
+        self.ranges: tuple[faiss.Index | None, np.ndarray | None] = (None, None)
+        self.ranges_file: str | None = None
+
+    def _manifest_stat(self) -> tuple[int, int, int]:
+        st = os.stat(manifest_path(self.index_path))
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def get(self) -> dict[str, faiss.Index]:
+        """The partitions of the current generation (treat as read-only)."""
+        return self.snapshot()[0]
+
+    def snapshot(self) -> tuple[dict[str, faiss.Index], np.ndarray]:
+        """
+        The partitions of the current generation and the doc ids searches
+        must skip: tombstoned ones, and those hidden until the VFS lists them.
+        """
+        if not os.path.exists(manifest_path(self.index_path)):
+            migrate_legacy_index(self.index_path)
+            if not os.path.exists(manifest_path(self.index_path)):
+                raise FileNotFoundError(f"Index '{self.index_path}' not found.")
+
+        stat = self._manifest_stat()
+        if stat != self._stat:
+            with self._lock:
+                if stat != self._stat:
+                    self._open(read_manifest(self.index_path))
+                    self._stat = stat
+        return self.current
+
+    def centroid_ranges(self, centroids: faiss.Index) -> np.ndarray | None:
+        """The vector ID ranges of `centroids` (this reader's centroid partition), None when not published."""
+        index, ranges = self.ranges
+        return ranges if index is centroids else None
+
+    def positions(self, partition: str, index: faiss.Index, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Offsets into the id map of `index` (this reader's `partition`) of
+        the stored vectors among `ids`, and their IDs. The sorted id map is
+        built once per opened partition file.
+        """
+        lookup = self._positions.get(partition)
+        if lookup is None or lookup[0] is not index:
+            stored_ids = faiss.vector_to_array(index.id_map)
+            order = np.argsort(stored_ids, kind="stable")
+            lookup = self._positions[partition] = (index, stored_ids[order], order)
+
+        _, sorted_ids, order = lookup
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(sorted_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        found = sorted_ids[pos] == ids
+        return order[pos[found]], ids[found]
+
+    def _open(self, manifest: dict):
+        if manifest["generation"] == self.generation:
+            return
+
+        directory = os.path.dirname(manifest_path(self.index_path))
+        indexes = {}
+        with metrics.timer("index.read"):
+            for partition, file_name in manifest["partitions"].items():
+                if self.files.get(partition) == file_name:
+                    indexes[partition] = self.indexes[partition]
+                else:
+                    indexes[partition] = _read_index_for_search(os.path.join(directory, file_name))
+
+        tombstones = np.asarray(manifest.get("tombstones", []), dtype=np.int64)
+        hidden = tombstones
+        doc_limit, next_doc_id = manifest.get("doc_limit"), manifest.get("next_doc_id", 0)
+        if doc_limit is not None and next_doc_id > doc_limit:
+            # Added by a crawl whose VFS commit is still pending (or failed)
+            hidden = np.union1d(tombstones, np.arange(doc_limit, next_doc_id, dtype=np.int64))
+
+        centroids = indexes.get(CENTROIDS)
+        ranges = self.ranges[1]
+        if manifest.get("centroid_ranges") != self.ranges_file or centroids is not self.ranges[0]:
+            ranges = read_centroid_ranges(self.index_path, manifest)
+        self.ranges = (centroids, ranges)
+        self.ranges_file = manifest.get("centroid_ranges")
+
+        # Swap in one assignment so concurrent searches see a whole generation
+        self.current = (indexes, hidden)
+        self.indexes = indexes
+        self.files = dict(manifest["partitions"])
+        self.generation = manifest["generation"]
+
+        metrics.clear("fre_index_vectors")
+        for partition, index in indexes.items():
+            metrics.set("fre_index_vectors", index.ntotal, partition=partition)
+        metrics.set("fre_index_tombstoned_documents", len(tombstones))
+        metrics.set("fre_index_generation", self.generation)
+        print(f"Opened index generation {self.generation} from '{manifest_path(self.index_path)}'")
+
+
+_readers: dict[str, IndexReader] = {}
+_readers_lock = threading.Lock()
+
+
+def _get_reader(index_path: str) -> IndexReader:
+    reader = _readers.get(index_path)
+    if reader is None:
+        with _readers_lock:
+            reader = _readers.setdefault(index_path, IndexReader(index_path))
+    return reader
+
+
+def get_search_indexes(index_path: str = "faiss_index.idx") -> dict[str, faiss.Index]:
+    """Return the partitions of the current published generation of `index_path`."""
+    return _get_reader(index_path).get()
+
+
+def vector_positions(index_path: str, partition: str, index: faiss.Index, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Offsets and IDs of the stored vectors among `ids` in a published partition (see `IndexReader.positions`)."""
+    return _get_reader(index_path).positions(partition, index, ids)
+
+
+def get_centroid_ranges(index_path: str, centroids: faiss.Index) -> np.ndarray | None:
+    """The vector ID ranges of a published centroid partition (see `read_centroid_ranges`)."""
+    return _get_reader(index_path).centroid_ranges(centroids)
+
+
+def get_search_snapshot(index_path: str = "faiss_index.idx") -> tuple[dict[str, faiss.Index], np.ndarray]:
+    """Return the partitions and the doc ids to skip (see `IndexReader.snapshot`) of the current generation of `index_path`."""
+    return _get_reader(index_path).snapshot()
@@ -0,0 +1,406 @@
+import re
+import time
+import argparse
+import faiss
+import numpy as np
+
+from src.ir_service.config import (
+    INDEX_FACTORY,
+    NPROBE,
+    EF_SEARCH,
+    TRAIN_SAMPLE_SIZE,
+    VECTOR_STORAGE
+)
+from src.ir_service.index_layout import (
+    CENTROIDS,
+    is_image_id,
+    is_vector_partition,
+    read_manifest,
+    open_partitions,
+    publish_indexes,
+    migrate_legacy_index
+)
+from src.ir_service.vector_store import (
+    ExactVectorStore,
+    exact_store_base
+)
+
+
+def _storage_codec(storage: str) -> str:
+    if storage == "float32":
+        return "Flat"
+    if storage == "float16":
+        return "SQfp16"
+    if storage == "sq8":
+        return "SQ8"
+    match = re.fullmatch(r"pq(\d+)", storage)
+    if match:
+        return f"PQ{match.group(1)}"
+    raise ValueError(f"Unknown vector storage '{storage}'.")
+
+
+def resolve_factory(factory: str = INDEX_FACTORY, storage: str = VECTOR_STORAGE) -> str:
+    """
+    Combine the index structure with the vector storage codec, e.g.
+    ("Flat", "sq8") -> "SQ8", ("IVF4096,Flat", "pq64") -> "IVF4096,PQ64",
+    ("HNSW32", "float16") -> "HNSW32,SQfp16". Factory strings that already
+    name a codec are used as-is.
+    """
+    codec = _storage_codec(storage)
+    if codec == "Flat":
+        return factory
+    if factory == "Flat":
+        return codec
+    if factory.endswith(",Flat"):
+        return factory[:-len("Flat")] + codec
+    if re.fullmatch(r"HNSW\d+", factory):
+        return f"{factory},{codec}"
+    return factory
+
+
+def create_index(dim: int, factory: str = INDEX_FACTORY, storage: str = VECTOR_STORAGE) -> faiss.IndexIDMap:
+    """
+    Build an empty index from a faiss.index_factory string, wrapped in an
+    IndexIDMap so vectors keep their doc_id * offset + i IDs.
+    Inner product is used throughout, for cosine similarity on normalized vectors.
+    """
+    inner = faiss.index_factory(dim, resolve_factory(factory, storage), faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexIDMap(inner)
+
+
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    if hasattr(index, "id_map"):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+
+def accepts_search_parameters(index: faiss.Index) -> bool:
+    """Whether `index.search` takes SearchParameters (and so an ID selector): flat PQ codes do not."""
+    return not isinstance(_inner_index(index), (faiss.IndexPQ, faiss.IndexFastScan))
+
+
+def search_parameters(index: faiss.Index, nprobe: int | None = None, ef_search: int | None = None, sel: faiss.IDSelector | None = None) -> faiss.SearchParameters | None:
+    """
+    Per-query search parameters for approximate indexes. Passing these to
+    `index.search` instead of mutating the index keeps a shared, read-only
+    index safe to use from several request threads. `sel` restricts the
+    search to the selected vector IDs; check `accepts_search_parameters`
+    first, indexes that take none return None.
+    """
+    inner = _inner_index(index)
+
+    if not accepts_search_parameters(index):
+        return None
+    if isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search if ef_search is not None else EF_SEARCH
+    else:
+        try:
+            faiss.extract_index_ivf(inner)
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe if nprobe is not None else NPROBE
+        except RuntimeError:
+            if sel is None:
+                return None
+            params = faiss.SearchParameters()
+
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+def export_vectors(index: faiss.Index, positions: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (ids, vectors) for everything stored in an IndexIDMap, or only for
+    the entries at `positions` (offsets into its id_map).
+    For quantized indexes (PQ, SQ) the vectors are the decoded approximations.
+    """
+    inner = _inner_index(index)
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    if positions is not None:
+        ids = ids[positions]
+    if len(ids) == 0:
+        return ids, np.zeros((0, index.d), dtype=np.float32)
+
+    try:
+        faiss.extract_index_ivf(inner).make_direct_map()
+    except RuntimeError:
+        pass
+
+    if positions is None:
+        return ids, inner.reconstruct_n(0, index.ntotal)
+    return ids, inner.reconstruct_batch(np.ascontiguousarray(positions, dtype=np.int64))
+
+
+def training_minimum(index: faiss.Index) -> int:
+    """
+    Fewest vectors an untrained `index` can be trained on: one per IVF list
+    and 2^nbits per PQ codebook (0 when it needs no training).
+    """
+    if index.is_trained:
+        return 0
+
+    inner = _inner_index(index)
+    minimum = 1
+    try:
+        minimum = max(minimum, faiss.extract_index_ivf(inner).nlist)
+    except RuntimeError:
+        pass
+    if getattr(inner, "pq", None) is not None:
+        minimum = max(minimum, inner.pq.ksub)
+    elif isinstance(inner, faiss.IndexHNSWPQ):
+        # Always 8-bit codes
+        minimum = max(minimum, 256)
+    return minimum
+
+
+def is_exact(index: faiss.Index) -> bool:
+    """Whether `index` is a flat float32 index (searched exactly, needs no training)."""
+    return isinstance(_inner_index(index), faiss.IndexFlat)
+
+
+def is_lossless(index: faiss.Index) -> bool:
+    """Whether `index` keeps its vectors as float32, so that `export_vectors` returns them exactly."""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    return isinstance(inner, (faiss.IndexFlat, faiss.IndexIVFFlat))
+
+
+def train_on_sample(index: faiss.Index, vectors: np.ndarray, sample_size: int = TRAIN_SAMPLE_SIZE):
+    """Train an untrained index on a random sample of `vectors`."""
+    if index.is_trained:
+        return
+
+    rng = np.random.default_rng(0)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+    start = time.perf_counter()
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    print(f"Trained index on {len(vectors)} vectors in {time.perf_counter() - start:.1f}s")
+
+
+def rebuild_without(index: faiss.Index, remove_mask: np.ndarray) -> faiss.Index:
+    """
+    Rebuild `index` without the vectors flagged in `remove_mask` (aligned with
+    the id_map). Used for index types such as HNSW that cannot remove in place.
+    """
+    ids, vectors = export_vectors(index)
+    keep = ~remove_mask
+
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    if keep.any():
+        rebuilt.add_with_ids(vectors[keep], ids[keep])
+    return rebuilt
+
+
+def train_index(
+    index_path: str = "faiss_index.idx",
+    factory: str = INDEX_FACTORY,
+    sample_size: int = TRAIN_SAMPLE_SIZE,
+    storage: str = VECTOR_STORAGE,
+):
+    """
+    Convert the published index to the layout described by `factory` and
+    `storage`: train each partition on a sample of its stored embeddings,
+    re-add every vector under its original ID and publish the result as a
+    new generation.
+
+    Partitions holding compressed codes only decode to approximations, so
+    their vectors are read from the exact vector store instead, which is
+    then kept as it is; the conversion is refused when the store lacks any
+    of them. When every partition holds float32 vectors and the new layout
+    is compressed, the exact store is rewritten from the old index.
+    """
+    migrate_legacy_index(index_path)
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise FileNotFoundError(f"Index '{index_path}' not found.")
+
+    partitions = {
+        partition: index for partition, index in open_partitions(index_path, manifest).items()
+        # The centroids stay exact (flat) whatever the layout
+        if is_vector_partition(partition)
+    }
+    dim = next(iter(partitions.values())).d
+    store = ExactVectorStore(exact_store_base(index_path), dim)
+    lossless = all(is_lossless(index) for index in partitions.values() if index.ntotal)
+    refill = storage != "float32" and lossless
+
+    # Checked up front: nothing is cleared or published when a vector is missing
+    for partition, old in partitions.items():
+        if is_lossless(old) or old.ntotal == 0:
+            continue
+        _, found = store.lookup(faiss.vector_to_array(old.id_map))
+        if not found.all():
+            raise ValueError(
+                f"The {partition} partition holds compressed codes and {int((~found).sum())} of its vectors "
+                f"have no float32 copy in '{store.vectors_path}': re-index the documents instead."
+            )
+
+    if refill:
+        store.clear()
+
+    new_indexes = {}
+    for partition, old in partitions.items():
+        if is_lossless(old):
+            ids, vectors = export_vectors(old)
+        else:
+            ids = faiss.vector_to_array(old.id_map)
+            vectors, _ = store.lookup(ids)
+        if refill:
+            store.append(ids, vectors)
+
+        new = create_index(old.d, factory, storage)
+        if len(ids) < training_minimum(new):
+            # Too few vectors to train on: stays exact, the writer converts it once it has enough
+            new = create_index(old.d, "Flat", "float32")
+        if len(ids):
+            train_on_sample(new, vectors, sample_size)
+            new.add_with_ids(vectors, ids)
+        new_indexes[partition] = new
+        layout = resolve_factory(factory, storage) if not is_exact(new) else "Flat"
+        print(f"Rebuilt {partition} partition as '{layout}' with {new.ntotal} vectors")
+
+    publish_indexes(index_path, new_indexes)
+
+
+def _search_settings(index: faiss.Index, nprobe_values: list[int] = None, ef_search_values: list[int] = None) -> list[dict]:
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return [{"ef_search": ef} for ef in (ef_search_values or [16, 32, 64, 128, 256])]
+    try:
+        faiss.extract_index_ivf(inner)
+        return [{"nprobe": p} for p in (nprobe_values or [1, 4, 16, 64, 256])]
+    except RuntimeError:
+        return [{}]
+
+
+def evaluate_recall(
+    index_path: str = "faiss_index.idx",
+    k: int = 10,
+    num_queries: int = 200,
+    nprobe_values: list[int] = None,
+    ef_search_values: list[int] = None,
+) -> list[dict]:
+    """
+    Report recall@k and per-query latency of every partition of the published
+    index against an exact (flat) search over the same vectors. Ground truth
+    uses the exact vector store when the index holds compressed codes.
+    Queries are a random sample of the stored embeddings. Returns one row per
+    partition and search setting.
+    """
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise FileNotFoundError(f"Index '{index_path}' not found.")
+
+    store = ExactVectorStore(exact_store_base(index_path))
+    rng = np.random.default_rng(0)
+    rows = []
+
+    for partition, index in open_partitions(index_path, manifest).items():
+        if not is_vector_partition(partition):
+            continue
+        ids, vectors = export_vectors(index)
+        if len(ids) == 0:
+            continue
+
+        exact_vectors, found = store.lookup(ids)
+        vectors = np.where(found[:, None], exact_vectors, vectors)
+        queries = vectors[rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)]
+
+        exact = faiss.IndexIDMap(faiss.IndexFlatIP(index.d))
+        exact.add_with_ids(vectors, ids)
+        _, truth = exact.search(queries, k)
+
+        for setting in _search_settings(index, nprobe_values, ef_search_values):
+            params = search_parameters(index, setting.get("nprobe"), setting.get("ef_search"))
+
+            start = time.perf_counter()
+            _, found_ids = index.search(queries, k, params=params)
+            elapsed = time.perf_counter() - start
+
+            hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found_ids))
+            rows.append({
+                "partition": partition,
+                **setting,
+                f"recall@{k}": hits / (len(queries) * k),
+                "ms_per_query": 1000 * elapsed / len(queries),
+            })
+            print(rows[-1])
+
+    return rows
+
+
+def evaluate_two_stage(
+    index_path: str = "faiss_index.idx",
+    k: int = 10,
+    num_queries: int = 200,
+    candidates_values: list[int] = None,
+) -> list[dict]:
+    """
+    Report document-level recall@k and per-query latency of two-stage search
+    (see COARSE_CANDIDATES) for each number of candidate documents, against
+    the search over every vector. Queries are a random sample of the stored
+    embeddings. Run it before turning two-stage search on.
+    """
+    # Imported here: embeddings imports this module
+    from src.ir_service.embeddings import _search_documents_batch
+
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise FileNotFoundError(f"Index '{index_path}' not found.")
+    if CENTROIDS not in manifest["partitions"]:
+        raise ValueError(f"Index '{index_path}' has no centroids yet; refresh it first.")
+
+    exported = [export_vectors(index) for partition, index in open_partitions(index_path, manifest).items() if is_vector_partition(partition)]
+    ids = np.concatenate([ids for ids, _ in exported])
+    vectors = np.concatenate([vectors for _, vectors in exported])
+    sample = np.random.default_rng(0).choice(len(ids), min(num_queries, len(ids)), replace=False)
+    queries = np.ascontiguousarray(vectors[sample] / np.linalg.norm(vectors[sample], axis=1, keepdims=True))
+    is_image = is_image_id(ids[sample])
+
+    truth = _search_documents_batch(queries, is_image, index_path, k, candidates=0)
+    rows = []
+    for candidates in candidates_values or [50, 100, 200, 500]:
+        start = time.perf_counter()
+        found = _search_documents_batch(queries, is_image, index_path, k, candidates=candidates)
+        elapsed = time.perf_counter() - start
+
+        hits = [len({d for d, _ in t} & {d for d, _ in f}) / max(1, len(t)) for t, f in zip(truth, found)]
+        rows.append({
+            "candidates": candidates,
+            f"doc_recall@{k}": float(np.mean(hits)),
+            "ms_per_query": 1000 * elapsed / len(queries),
+        })
+        print(rows[-1])
+
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS index maintenance tools")
+    parser.add_argument("--index", default="faiss_index.idx")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_cmd = sub.add_parser("train", help="rebuild the index with a different factory string")
+    train_cmd.add_argument("--factory", default=INDEX_FACTORY)
+    train_cmd.add_argument("--sample-size", type=int, default=TRAIN_SAMPLE_SIZE)
+    train_cmd.add_argument("--storage", default=VECTOR_STORAGE, help="float32, float16, sq8 or pq<m>")
+
+    recall_cmd = sub.add_parser("recall", help="report recall@k against an exact search")
+    recall_cmd.add_argument("--k", type=int, default=10)
+    recall_cmd.add_argument("--queries", type=int, default=200)
+    recall_cmd.add_argument("--nprobe", type=int, nargs="*")
+    recall_cmd.add_argument("--ef-search", type=int, nargs="*")
+    recall_cmd.add_argument("--candidates", type=int, nargs="*", help="also report two-stage search with these candidate counts")
+
+    args = parser.parse_args()
+    if args.command == "train":
+        train_index(args.index, args.factory, args.sample_size, args.storage)
+    else:
+        evaluate_recall(args.index, args.k, args.queries, args.nprobe, args.ef_search)
+        if args.candidates is not None:
+            evaluate_two_stage(args.index, args.k, args.queries, args.candidates)
@@ -0,0 +1,117 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+
+class Job:
+    """State of one background job, as reported by the progress endpoint."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.stage = "queued"
+        self.done = 0
+        self.total = 0
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.result = None
+        self.error: str | None = None
+
+        # Rate over the current stage
+        self._stage_started = self.created
+
+    def update(self, stage: str, done: int = 0, total: int = 0):
+        if stage != self.stage:
+            self._stage_started = time.time()
+        self.stage = stage
+        self.done = done
+        self.total = total
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        end = self.finished if self.finished is not None else time.time()
+        elapsed = end - self.started if self.started is not None else 0.0
+        stage_elapsed = end - self._stage_started
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "rate": self.done / stage_elapsed if stage_elapsed > 0 else 0.0,
+            "elapsed": elapsed,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs one at a time on a background thread.
+
+    Submitting a job of a kind that is already waiting in the queue returns
+    that job instead of queueing a duplicate. The most recent
+    `keep` jobs stay available for status queries.
+    """
+
+    def __init__(self, keep: int = 50):
+        self.keep = keep
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queue: list[tuple[Job, object]] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, kind: str, fn) -> Job:
+        """Queue `fn(job)`; its return value becomes the job's result."""
+        with self._cond:
+            for job, _ in self._queue:
+                if job.kind == kind:
+                    return job
+
+            job = Job(kind)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.active:
+                    break
+                self._jobs.popitem(last=False)
+
+            self._queue.append((job, fn))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job, fn = self._queue.pop(0)
+
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.result = fn(job)
+                job.status = "done"
+                job.stage = "done"
+            except Exception as e:
+                print(f"Warning: Job {job.id} ({job.kind}) failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+
+
+jobs = JobManager()
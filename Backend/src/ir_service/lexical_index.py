@@ -0,0 +1,178 @@
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+from src.ir_service.config import LEXICAL_DB_PATH, BM25_K1, BM25_B
+from src.ir_service.metrics import metrics
+
+# Kept free of torch / CLIP imports: `term_frequencies` runs in the
+# pipeline's parser processes, and keyword search must not load the model.
+
+_TOKEN = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS postings (
+    term   TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf     INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS doc_lengths (
+    doc_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens (letters / digits); single characters are dropped."""
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1]
+
+
+def term_frequencies(text: str) -> dict[str, int]:
+    return dict(Counter(tokenize(text)))
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index in SQLite (WAL mode): one posting (term, doc_id, tf)
+    per distinct term of a document, plus document lengths and corpus totals.
+    Documents are replaced / removed row by row in one transaction per crawl,
+    like the VFS store.
+    """
+
+    def __init__(self, path: str = LEXICAL_DB_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _stats(self, conn: sqlite3.Connection) -> tuple[int, int]:
+        """(number of documents, total document length)."""
+        values = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+        return values.get("num_docs", 0), values.get("total_length", 0)
+
+    def __len__(self) -> int:
+        return self._stats(self._conn())[0]
+
+    def doc_ids(self) -> set[int]:
+        return {doc_id for (doc_id,) in self._conn().execute("SELECT doc_id FROM doc_lengths")}
+
+    def apply(self, upserts: dict[int, dict[str, int]], deletes: list[int]):
+        """Replace the term frequencies of `upserts` and remove `deletes`, in one transaction."""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                num_docs, total_length = self._stats(conn)
+
+                for doc_id in set(deletes) | upserts.keys():
+                    row = conn.execute("SELECT length FROM doc_lengths WHERE doc_id = ?", (doc_id,)).fetchone()
+                    if row is None:
+                        continue
+                    conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                    conn.execute("DELETE FROM doc_lengths WHERE doc_id = ?", (doc_id,))
+                    num_docs -= 1
+                    total_length -= row[0]
+
+                for doc_id, terms in upserts.items():
+                    conn.executemany(
+                        "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                        [(term, doc_id, tf) for term, tf in terms.items()],
+                    )
+                    length = sum(terms.values())
+                    conn.execute("INSERT INTO doc_lengths (doc_id, length) VALUES (?, ?)", (doc_id, length))
+                    num_docs += 1
+                    total_length += length
+
+                conn.executemany(
+                    "INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+                    [("num_docs", num_docs), ("total_length", total_length)],
+                )
+
+    def clear(self):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM doc_lengths")
+                conn.execute("DELETE FROM stats")
+
+    def search(self, query: str, k: int = 10) -> list[tuple[int, float]]:
+        """The `k` best (doc_id, BM25 score) pairs for the terms of `query`, highest first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        conn = self._conn()
+        # One read transaction, so postings and totals come from the same commit
+        conn.execute("BEGIN")
+        try:
+            num_docs, total_length = self._stats(conn)
+            if num_docs == 0:
+                return []
+            avg_length = total_length / num_docs
+
+            scores: dict[int, float] = {}
+            for term in terms:
+                rows = conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN doc_lengths d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+
+                idf = math.log(1 + (num_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        finally:
+            conn.rollback()
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+_lexical_index: LexicalIndex | None = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex | None:
+    """The lexical index, opened on first use; None when LEXICAL_DB_PATH is empty."""
+    global _lexical_index
+    if not LEXICAL_DB_PATH:
+        return None
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    return _lexical_index
+
+
+def retrieve_keyword(query: str, k: int = 1) -> list[tuple[int, float]]:
+    """Keyword-only search: BM25 over the crawled text and file names, without CLIP."""
+    index = get_lexical_index()
+    if index is None:
+        raise ValueError("The lexical index is disabled.")
+    with metrics.timer("search.keyword"):
+        return index.search(query, k)
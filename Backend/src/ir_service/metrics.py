@@ -0,0 +1,156 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from src.ir_service.config import METRICS_ENABLED
+
+# Seconds: from sub-millisecond index searches to minutes-long crawls
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "fre_stage_duration_seconds": ("histogram", "Time spent in each indexing / search stage.", TIME_BUCKETS),
+    "fre_batch_size": ("histogram", "Items per CLIP / FAISS batch.", SIZE_BUCKETS),
+    "fre_vectors_added_total": ("counter", "Vectors handed to the index writer.", None),
+    "fre_vectors_removed_total": ("counter", "Vectors of deleted / re-indexed documents.", None),
+    "fre_query_cache_requests_total": ("counter", "Query embedding cache lookups.", None),
+    "fre_crawl_items_total": ("counter", "Files / vectors processed by crawls, by outcome.", None),
+    "fre_index_vectors": ("gauge", "Vectors in each partition of the served index generation.", None),
+    "fre_index_tombstoned_documents": ("gauge", "Deleted documents not compacted away yet.", None),
+    "fre_index_generation": ("gauge", "Generation of the served index.", None),
+    "fre_http_request_duration_seconds": ("histogram", "Latency of HTTP requests by route.", TIME_BUCKETS),
+}
+
+# Stage durations of the request being handled on this thread, or None
+_request_timings: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms (see METRICS), rendered in the
+    Prometheus text format for /metrics. Stage timers also add up into the
+    timing breakdown of the HTTP request being handled, if any.
+    """
+
+    def __init__(self, enabled: bool = bool(METRICS_ENABLED)):
+        self.enabled = enabled
+        self._values: dict[str, dict[tuple, float]] = {name: {} for name in METRICS}
+        # Histograms: labels -> [bucket counts..., sum, count]
+        self._histograms: dict[str, dict[tuple, list[float]]] = {name: {} for name in METRICS}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def clear(self, name: str):
+        """Drop every series of a gauge (e.g. partitions that no longer exist)."""
+        with self._lock:
+            self._values[name].clear()
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def record_stage(self, stage: str, seconds: float):
+        """Record a stage duration measured elsewhere (e.g. in a parser process)."""
+        self.observe("fre_stage_duration_seconds", seconds, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - begin)
+
+    def start_request(self) -> contextvars.Token:
+        """Start collecting the stage timings of the current request."""
+        return _request_timings.set({})
+
+    def end_request(self, token: contextvars.Token) -> dict[str, float]:
+        timings = _request_timings.get() or {}
+        _request_timings.reset(token)
+        return timings
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind != "histogram":
+                    for key, value in sorted(self._values[name].items()):
+                        lines.append(f"{name}{_labels(key)} {value}")
+                    continue
+
+                for key, series in sorted(self._histograms[name].items()):
+                    for bound, count in zip(buckets, series):
+                        le = f'le="{bound:g}"'
+                        lines.append(f"{name}_bucket{_labels(key, le)} {count}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{name}_bucket{_labels(key, le)} {series[-1]}")
+                    lines.append(f"{name}_sum{_labels(key)} {series[-2]}")
+                    lines.append(f"{name}_count{_labels(key)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def timed_iter(iterable, record):
+    """Yield from `iterable`, calling `record(seconds)` with the time each item took to produce."""
+    iterator = iter(iterable)
+    while True:
+        begin = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(time.perf_counter() - begin)
+            return
+        record(time.perf_counter() - begin)
+        yield item
+
+
+def server_timing(timings: dict[str, float], total: float) -> str:
+    """A Server-Timing header value: one `stage;dur=<ms>` entry per stage, then the total."""
+    entries = [f"{stage};dur={1000 * seconds:.2f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={1000 * total:.2f}")
+    return ", ".join(entries)
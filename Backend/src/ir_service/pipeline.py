@@ -0,0 +1,399 @@
+import os
+import multiprocessing
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+
+from src.ir_service.content_store import ContentStore, get_content_store
+from src.ir_service.document_parser import parse_document, parse_tasks, read_content
+from src.ir_service.lexical_index import term_frequencies
+from src.ir_service.metrics import metrics
+from src.ir_service.embeddings import (
+    offset,
+    encode_texts,
+    encode_images,
+    text_vector_ids,
+    image_vector_ids,
+    add_embeddings,
+    open_index_writer,
+    encoder_signature
+)
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Start method for the parser processes. The server is multithreaded
+    (request threads, watcher, job runner, search batcher), and a child forked
+    while another thread holds a lock can deadlock. So workers come from a
+    fork server that has only imported the parser, or are spawned where
+    there is no fork server.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["src.ir_service.document_parser"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class _DocState:
+    """
+    Embeddings of one document while its parts (its parse tasks: page
+    ranges, groups of images, or the whole file) are parsed and their
+    sentences / images encoded.
+    """
+
+    def __init__(self, doc_id: int, key: str | None, num_parts: int):
+        self.doc_id = doc_id
+        self.key = key
+        self.text: list[np.ndarray | None] = [None] * num_parts
+        self.images: list[np.ndarray | None] = [None] * num_parts
+        self.image_hashes: list[list[str]] = [[] for _ in range(num_parts)]
+        self.seen_hashes: set[str] = set()
+        self.terms: Counter = Counter()
+
+        self.num_sentences = 0
+        self.num_images = 0
+        # Parts not parsed yet, and vectors not encoded yet
+        self.parts_pending = num_parts
+        self.remaining = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.parts_pending == 0 and self.remaining == 0
+
+
+class IndexingPipeline:
+    """
+    Staged indexing pipeline used by the file crawler.
+
+    1) Parsing (fitz, python-docx, PIL decode, sent_tokenize, packing the
+       sentences into CLIP-sized chunks) runs in a process pool, with a
+       bounded number of documents in flight.
+       PDFs and DOCX files are split into bounded tasks (see
+       `parse_tasks`): the text of at most PDF_TASK_PAGES pages, or at most
+       EXTRACT_BATCH_SIZE distinct images of the whole document, so memory
+       does not grow with the size of a document.
+    2) A single encoder stage in the calling process fills fixed-size batches
+       with sentences and images from many documents before running CLIP.
+    3) Once all of a document's vectors are encoded they are handed to the
+       active IndexWriter, which adds them to the index in bulk.
+
+    With a content store, documents whose file hash is already stored (touched,
+    renamed or duplicated files) and images whose bytes hash is stored skip
+    parsing / CLIP and reuse the stored vectors.
+
+    The term frequencies of every indexed document's text are collected in
+    `terms` (doc_id -> {term: tf}) for the lexical index.
+
+    Vector IDs follow the usual doc_id * offset + i scheme.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        workers: int | None = None,
+        index_path: str = "faiss_index.idx",
+        store: ContentStore | None = None,
+        progress=None,
+    ):
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+
+        self.batch_size = batch_size
+        self.workers = workers
+        self.index_path = index_path
+        self.store = store if store is not None else get_content_store(encoder_signature())
+        # Called as progress(done, total) each time a document is indexed or fails
+        self.progress = progress
+        self._done = 0
+        self._total = 0
+
+        self._docs: dict[int, _DocState] = {}
+        # Sentences waiting for the text encoder: (doc_id, part, i, sentence)
+        self._texts: list[tuple[int, int, int, str]] = []
+        # Distinct images waiting for the vision encoder: hash -> (image, [(doc_id, part, j)])
+        self._images: dict[str, tuple[Image.Image, list[tuple[int, int, int]]]] = {}
+        # Jobs whose content is identical to a document currently being encoded
+        self._in_progress: set[str] = set()
+        self._waiting: dict[str, list[tuple[str, int]]] = {}
+
+        self.stats = {
+            "documents": 0,
+            "reused_documents": 0,
+            "sentences": 0,
+            "text_chunks": 0,
+            "images": 0,
+            "encoded_images": 0,
+            "reused_images": 0,
+            "text_batches": 0,
+            "image_batches": 0,
+        }
+        self.failed: dict[str, str] = {}
+        self.terms: dict[int, dict[str, int]] = {}
+
+    def run(self, jobs: list[tuple[str, int, str | None]]) -> dict[str, str]:
+        """
+        Index every (file_path, doc_id, content_hash) in `jobs`; content_hash
+        may be None when it is unknown.
+        Returns a dict mapping the paths that could not be indexed to the error.
+        """
+        self._total = len(jobs)
+        with open_index_writer(self.index_path):
+            to_parse = []
+            for file_path, doc_id, key in jobs:
+                if key is not None and self.store is not None and self.store.has_document(key):
+                    self._reuse(file_path, doc_id, key)
+                elif key is not None and key in self._in_progress:
+                    self._waiting.setdefault(key, []).append((file_path, doc_id))
+                else:
+                    if key is not None:
+                        self._in_progress.add(key)
+                    to_parse.append((file_path, doc_id, key))
+
+            tasks = self._split(to_parse)
+            if self.workers <= 1 or len(tasks) <= 1:
+                for file_path, doc_id, part, task in tasks:
+                    if doc_id not in self._docs:
+                        continue
+                    try:
+                        parsed = parse_document(file_path, doc_id, self._has_image, task)
+                    except Exception as e:
+                        self._fail(self._docs[doc_id], file_path, e)
+                        continue
+                    self._consume(parsed, part)
+            else:
+                self._run_pool(tasks)
+
+            while self._texts:
+                self._encode_text_batch()
+            while self._images:
+                self._encode_image_batch()
+
+        return self.failed
+
+    @property
+    def _has_image(self):
+        return self.store.has_image if self.store is not None else None
+
+    def _split(self, jobs: list[tuple[str, int, str | None]]) -> list[tuple[str, int, int, tuple | None]]:
+        """Register each job and turn it into (file_path, doc_id, part, task) parse tasks."""
+        tasks = []
+        for file_path, doc_id, key in jobs:
+            try:
+                parts = parse_tasks(file_path)
+            except Exception as e:
+                self._docs[doc_id] = _DocState(doc_id, key, 1)
+                self._fail(self._docs[doc_id], file_path, e)
+                continue
+
+            self._docs[doc_id] = _DocState(doc_id, key, len(parts))
+            self.stats["documents"] += 1
+            tasks.extend((file_path, doc_id, part, task) for part, task in enumerate(parts))
+        return tasks
+
+    def _run_pool(self, tasks: list[tuple[str, int, int, tuple | None]]):
+        max_in_flight = self.workers * 2
+        task_iter = iter(tasks)
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context()) as pool:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                while True:
+                    task = next(task_iter, None)
+                    if task is None:
+                        return False
+                    file_path, doc_id, part, parse_task = task
+                    # Skip the remaining parts of a document that already failed
+                    if doc_id in self._docs:
+                        break
+                in_flight[pool.submit(parse_document, file_path, doc_id, self._has_image, parse_task)] = (file_path, doc_id, part)
+                return True
+
+            while len(in_flight) < max_in_flight and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, doc_id, part = in_flight.pop(future)
+                    state = self._docs.get(doc_id)
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        if state is not None:
+                            self._fail(state, file_path, e)
+                    else:
+                        if state is not None:
+                            self._consume(parsed, part)
+                    submit_next()
+
+    def _advance(self, count: int = 1):
+        self._done += count
+        if self.progress is not None:
+            self.progress(self._done, self._total)
+
+    def _fail(self, state: _DocState | str, file_path: str, error: Exception):
+        """
+        Give up on a document. Its queued sentences / images are dropped as
+        they come up for encoding. `state` may also be the content hash of a
+        document that was never registered.
+        """
+        key = state if isinstance(state, str) or state is None else state.key
+        if isinstance(state, _DocState):
+            self._docs.pop(state.doc_id, None)
+
+        print(f"Warning: Failed to index {file_path}: {error}")
+        self.failed[file_path] = str(error)
+        self._in_progress.discard(key)
+
+        # Identical copies would fail the same way
+        waiting = self._waiting.pop(key, [])
+        for waiting_path, _ in waiting:
+            self.failed[waiting_path] = str(error)
+        self._advance(1 + len(waiting))
+
+    def _reuse(self, file_path: str, doc_id: int, key: str):
+        """Index a document from the vectors stored for its content hash."""
+        entry = self.store.get_document(key)
+        if entry is None:
+            self._fail(key, file_path, Exception(f"Stored embeddings for {key} disappeared."))
+            return
+
+        terms = entry["terms"]
+        if terms is None:
+            # Stored before term frequencies were kept: read the text once, no CLIP
+            try:
+                terms = term_frequencies(read_content(file_path)[0])
+            except Exception as e:
+                self._fail(key, file_path, e)
+                return
+            self.store.put_document(key, entry["text"], entry["images"], entry["image_hashes"], terms)
+
+        add_embeddings(entry["text"], text_vector_ids(doc_id, len(entry["text"])), self.index_path)
+        add_embeddings(entry["images"], image_vector_ids(doc_id, len(entry["images"])), self.index_path)
+        self.terms[doc_id] = terms
+        self.stats["reused_documents"] += 1
+        self._advance()
+
+    def _consume(self, parsed: dict, part: int):
+        """Queue the sentences and images of one parsed part of a document for encoding."""
+        state = self._docs[parsed["doc_id"]]
+        sentences = parsed["sentences"]
+        for stage, seconds in parsed["timings"].items():
+            metrics.record_stage(stage, seconds)
+
+        # Images seen in another part of the same document are only kept once
+        images, image_hashes = [], []
+        for image, image_hash in zip(parsed["images"], parsed["image_hashes"]):
+            if image_hash not in state.seen_hashes:
+                state.seen_hashes.add(image_hash)
+                images.append(image)
+                image_hashes.append(image_hash)
+
+        if state.num_sentences + len(sentences) > 0.9 * offset:
+            self._fail(state, parsed["path"], Exception(f"Only {0.9 * offset} text chunks can be embedded."))
+            return
+        if state.num_images + len(images) > 0.1 * offset:
+            self._fail(state, parsed["path"], Exception(f"Only {0.1 * offset} images can be embedded."))
+            return
+
+        # Resolve stored image embeddings before queueing anything
+        cached = {}
+        for image, image_hash in zip(images, image_hashes):
+            if image_hash in self._images or image_hash in cached or self.store is None:
+                continue
+            emb = self.store.get_image(image_hash)
+            if emb is not None:
+                cached[image_hash] = emb
+            elif image is None:
+                self._fail(state, parsed["path"], Exception(f"Stored embedding for image {image_hash} disappeared."))
+                return
+
+        doc_id = state.doc_id
+        state.text[part] = np.zeros((len(sentences), 512), dtype=np.float32)
+        state.images[part] = np.zeros((len(images), 512), dtype=np.float32)
+        state.image_hashes[part] = image_hashes
+        state.terms.update(parsed["terms"])
+        state.num_sentences += len(sentences)
+        state.num_images += len(images)
+        state.remaining += len(sentences) + len(images)
+        state.parts_pending -= 1
+        self.stats["sentences"] += parsed["num_sentences"]
+        self.stats["text_chunks"] += len(sentences)
+        self.stats["images"] += len(images)
+
+        if state.complete:
+            self._finish(state)
+            return
+
+        self._texts.extend((doc_id, part, i, sentence) for i, sentence in enumerate(sentences))
+
+        for j, (image, image_hash) in enumerate(zip(images, image_hashes)):
+            if image_hash in cached:
+                self.stats["reused_images"] += 1
+                self._fill(doc_id, part, "images", j, cached[image_hash])
+            elif image_hash in self._images:
+                self._images[image_hash][1].append((doc_id, part, j))
+            else:
+                self._images[image_hash] = (image, [(doc_id, part, j)])
+
+        while len(self._texts) >= self.batch_size:
+            self._encode_text_batch()
+        while len(self._images) >= self.batch_size:
+            self._encode_image_batch()
+
+    def _fill(self, doc_id: int, part: int, kind: str, i: int, emb: np.ndarray):
+        state = self._docs.get(doc_id)
+        if state is None:
+            # The document failed after this vector was queued
+            return
+        getattr(state, kind)[part][i] = emb
+        state.remaining -= 1
+        if state.complete:
+            self._finish(state)
+
+    def _finish(self, state: _DocState):
+        """All parts of a document are encoded: index and store them."""
+        self._docs.pop(state.doc_id, None)
+
+        text = np.concatenate(state.text, axis=0)
+        images = np.concatenate(state.images, axis=0)
+        image_hashes = [h for hashes in state.image_hashes for h in hashes]
+
+        add_embeddings(text, text_vector_ids(state.doc_id, len(text)), self.index_path)
+        add_embeddings(images, image_vector_ids(state.doc_id, len(images)), self.index_path)
+        self.terms[state.doc_id] = dict(state.terms)
+        self._advance()
+
+        if self.store is not None and state.key is not None:
+            self.store.put_document(state.key, text, images, image_hashes, self.terms[state.doc_id])
+            self._in_progress.discard(state.key)
+            for file_path, doc_id in self._waiting.pop(state.key, []):
+                self._reuse(file_path, doc_id, state.key)
+
+    def _encode_text_batch(self):
+        batch, self._texts = self._texts[:self.batch_size], self._texts[self.batch_size:]
+        # Drop sentences of documents that failed meanwhile
+        batch = [item for item in batch if item[0] in self._docs]
+        if not batch:
+            return
+        emb = encode_texts([sentence for _, _, _, sentence in batch])
+        self.stats["text_batches"] += 1
+
+        for (doc_id, part, i, _), row in zip(batch, emb):
+            self._fill(doc_id, part, "text", i, row)
+
+    def _encode_image_batch(self):
+        hashes = list(self._images)[:self.batch_size]
+        batch = [self._images.pop(h) for h in hashes]
+        emb = encode_images([image for image, _ in batch])
+        self.stats["image_batches"] += 1
+        self.stats["encoded_images"] += len(batch)
+
+        for image_hash, (_, targets), row in zip(hashes, batch, emb):
+            if self.store is not None:
+                self.store.put_image(image_hash, row)
+            for doc_id, part, j in targets:
+                self._fill(doc_id, part, "images", j, row)
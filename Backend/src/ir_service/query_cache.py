@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+def text_key(text: str) -> str:
+    """Cache key for a text query: whitespace-collapsed and case-folded."""
+    return "text:" + " ".join(text.split()).casefold()
+
+
+def image_key(data: bytes) -> str:
+    """Cache key for an image query: a hash of the uploaded bytes."""
+    return "image:" + hashlib.sha256(data).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of normalized query embeddings.
+
+    Entries older than `ttl` seconds are treated as misses (ttl <= 0 keeps
+    them forever). Hit / miss / eviction counters are available from `stats`.
+    When `path` is set, `load` and `save` persist the cache as an .npz file.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl > 0 and now - created > self.ttl
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0], time.time()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, emb: np.ndarray):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), emb)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        """Write the live entries to `path` (no-op without a path)."""
+        if not self.path:
+            return
+        with self._lock:
+            now = time.time()
+            items = [(k, c, e) for k, (c, e) in self._entries.items() if not self._expired(c, now)]
+
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            keys=np.array([k for k, _, _ in items], dtype=str),
+            created=np.array([c for _, c, _ in items], dtype=np.float64),
+            embeddings=np.stack([e for _, _, e in items]) if items else np.zeros((0, 0), dtype=np.float32),
+        )
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Restore entries saved by `save`, oldest first, skipping expired ones."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        data = np.load(self.path)
+        now = time.time()
+        with self._lock:
+            for key, created, emb in zip(data["keys"], data["created"], data["embeddings"]):
+                if not self._expired(float(created), now):
+                    self._entries[str(key)] = (float(created), emb)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        print(f"Loaded {len(self._entries)} cached query embeddings from '{self.path}'")
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.ir_service.config import SCAN_CACHE_PATH, SCAN_WORKERS, FULL_SCAN_INTERVAL
+
+# Directories modified less than this many seconds before a scan are not
+# trusted on the next one: a change within the filesystem's mtime
+# granularity would otherwise go unnoticed.
+_RACY_WINDOW = 2.0
+
+# Files of one directory are stat-ed in chunks of this size
+_STAT_CHUNK = 256
+
+
+def _normalize_path(path: str) -> str:
+    return path.replace('\\', '/')
+
+
+class ScanResult:
+    """
+    Files found by a scan.
+
+    `files` maps paths that were stat-ed to their stat result. `unchanged`
+    holds paths listed in directories whose mtime did not change; they are
+    reported from the cache without a stat and assumed unmodified.
+    """
+
+    def __init__(self):
+        self.files: dict[str, os.stat_result] = {}
+        self.unchanged: set[str] = set()
+        self.full = False
+        self.stats = {
+            "directories": 0,
+            "skipped_directories": 0,
+            "scanned": 0,
+            "skipped": 0,
+        }
+
+    def paths(self) -> set[str]:
+        return self.unchanged.union(self.files)
+
+
+class DirectoryScanner:
+    """
+    Incremental, parallel replacement for os.walk + os.stat.
+
+    Every directory is stat-ed on each scan, but only directories whose mtime
+    changed since the last scan are listed and have their files stat-ed.
+    Listing and stat-ing run on a thread pool, which mostly helps on network
+    shares where each call is a round trip.
+
+    A directory's mtime only changes when entries are added, removed or
+    renamed in it, not when a file is rewritten in place. Such edits are
+    picked up by a full scan, which is forced every FULL_SCAN_INTERVAL
+    seconds (0 makes every scan a full scan) or with `full=True`.
+    """
+
+    def __init__(self, cache_path: str = SCAN_CACHE_PATH, workers: int = SCAN_WORKERS, full_scan_interval: float = FULL_SCAN_INTERVAL):
+        self.cache_path = cache_path
+        self.workers = workers
+        self.full_scan_interval = full_scan_interval
+
+        # dir path -> {"mtime_ns": int | None, "dirs": [names], "files": [names]}
+        self.dirs: dict[str, dict] = {}
+        self.last_full_scan = 0.0
+
+    def reset(self):
+        self.dirs = {}
+        self.last_full_scan = 0.0
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            self.reset()
+            return
+        with open(self.cache_path, "r") as f:
+            data = json.load(f)
+        self.dirs = data["dirs"]
+        self.last_full_scan = data["last_full_scan"]
+
+    def save(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"last_full_scan": self.last_full_scan, "dirs": self.dirs}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _needs_full_scan(self, now: float) -> bool:
+        return not self.dirs or now - self.last_full_scan >= self.full_scan_interval
+
+    def scan(self, root: str, whitelist: set[str], full: bool | None = None) -> ScanResult:
+        """List every whitelisted file under `root`."""
+        started = time.time()
+        result = ScanResult()
+        result.full = self._needs_full_scan(started) if full is None else full
+
+        def wanted(name: str) -> bool:
+            return os.path.splitext(name)[1] in whitelist
+
+        dirs: dict[str, dict] = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self._visit, root, result.full, started): ("dir", root)}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path = pending.pop(future)
+
+                    if kind == "stat":
+                        for file_path, file_stat in future.result():
+                            result.files[file_path] = file_stat
+                        continue
+
+                    entry, skipped = future.result()
+                    if entry is None:
+                        # Vanished while scanning
+                        continue
+
+                    dirs[path] = entry
+                    result.stats["directories"] += 1
+
+                    file_paths = [
+                        _normalize_path(os.path.join(path, name))
+                        for name in entry["files"] if wanted(name)
+                    ]
+                    if skipped:
+                        result.stats["skipped_directories"] += 1
+                        result.stats["skipped"] += len(file_paths)
+                        result.unchanged.update(file_paths)
+                    else:
+                        result.stats["scanned"] += len(file_paths)
+                        for i in range(0, len(file_paths), _STAT_CHUNK):
+                            chunk = file_paths[i:i + _STAT_CHUNK]
+                            pending[pool.submit(self._stat_files, chunk)] = ("stat", path)
+
+                    for name in entry["dirs"]:
+                        sub_path = os.path.join(path, name)
+                        pending[pool.submit(self._visit, sub_path, result.full, started)] = ("dir", sub_path)
+
+        self.dirs = dirs
+        if result.full:
+            self.last_full_scan = started
+        return result
+
+    def _visit(self, path: str, full: bool, started: float) -> tuple[dict | None, bool]:
+        """
+        Return the cache entry for directory `path` and whether it was
+        reused unchanged from the previous scan.
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, False
+
+        cached = self.dirs.get(path)
+        if not full and cached is not None and cached["mtime_ns"] == mtime_ns:
+            return cached, True
+
+        sub_dirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            # Like os.walk: list symlinked directories, but do not descend into them
+                            if not entry.is_symlink():
+                                sub_dirs.append(entry.name)
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return None, False
+
+        racy = started - mtime_ns / 1e9 < _RACY_WINDOW
+        return {"mtime_ns": None if racy else mtime_ns, "dirs": sub_dirs, "files": files}, False
+
+    @staticmethod
+    def _stat_files(file_paths: list[str]) -> list[tuple[str, os.stat_result]]:
+        stats = []
+        for file_path in file_paths:
+            try:
+                stats.append((file_path, os.stat(file_path)))
+            except OSError:
+                # Deleted between listing and stat
+                continue
+        return stats
@@ -0,0 +1,114 @@
+import time
+import threading
+from concurrent.futures import Future
+
+from src.ir_service.config import SEARCH_BATCH_WAIT_MS, SEARCH_BATCH_SIZE
+from src.ir_service.embeddings import retrieve_closest_doc, retrieve_closest_docs_batch
+from src.ir_service.metrics import metrics
+
+
+class _Pending:
+    """One caller's query and search parameters, waiting for its batch."""
+
+    def __init__(self, query, params: tuple):
+        self.query = query
+        self.params = params
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+        self.started: float | None = None
+
+
+class SearchBatcher:
+    """
+    Micro-batches concurrent `retrieve_closest_doc` calls.
+
+    Callers block while a background thread collects their queries: the
+    oldest waiting query holds the batch open for up to `wait_ms`
+    milliseconds, or until `max_batch` queries are waiting. Queries that
+    arrive while a batch is being searched make up the next one. Each batch
+    goes through `retrieve_closest_docs_batch` once per distinct set of search
+    parameters, so it costs one CLIP forward pass per modality and one FAISS
+    search per partition. `max_batch` <= 1 calls `retrieve_closest_doc` directly.
+    """
+
+    def __init__(self, wait_ms: float = SEARCH_BATCH_WAIT_MS, max_batch: int = SEARCH_BATCH_SIZE):
+        self.wait = max(0.0, wait_ms) / 1000
+        self.max_batch = max_batch
+        self._queue: list[_Pending] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    def retrieve_closest_doc(self, query, index_path: str = "faiss_index.idx", k: int = 1, balance_factor: float = 3.0, nprobe: int | None = None, ef_search: int | None = None, allow_paths: bool = True) -> list[tuple[int, float]]:
+        """Same as `embeddings.retrieve_closest_doc`, searched together with concurrent calls."""
+        if not self.enabled:
+            return retrieve_closest_doc(query, index_path, k, balance_factor, nprobe, ef_search, allow_paths)
+
+        pending = _Pending(query, (index_path, k, balance_factor, nprobe, ef_search, allow_paths))
+        with self._cond:
+            self._queue.append(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+        results = pending.future.result()
+        # Recorded on the caller's thread, so they show up in its request's timings
+        metrics.record_stage("search.queue", pending.started - pending.submitted)
+        metrics.record_stage("search.batch", time.perf_counter() - pending.started)
+
+        if not results:
+            raise ValueError("No results found for the given query.")
+        return results
+
+    def _take(self) -> list[_Pending]:
+        """Block until a batch is due and return it."""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = self._queue[0].submitted + self.wait
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return batch
+
+    def _search(self, group: list[_Pending]):
+        started = time.perf_counter()
+        for pending in group:
+            pending.started = started
+        try:
+            results = retrieve_closest_docs_batch([pending.query for pending in group], *group[0].params)
+        except Exception as e:
+            if len(group) == 1:
+                group[0].future.set_exception(e)
+                return
+            # One bad query (e.g. an unreadable image) must not fail the others
+            for pending in group:
+                self._search([pending])
+            return
+
+        for pending, result in zip(group, results):
+            pending.future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            metrics.observe("fre_batch_size", len(batch), kind="scheduler")
+
+            groups: dict[tuple, list[_Pending]] = {}
+            for pending in batch:
+                groups.setdefault(pending.params, []).append(pending)
+            for group in groups.values():
+                self._search(group)
+
+
+search_batcher = SearchBatcher()
@@ -0,0 +1,49 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StartupTracker:
+    """
+    Records how long each startup phase (VFS load, model load, index open,
+    initial crawl, ...) took and whether it succeeded, for the /ready endpoint.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._phases: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        begin = time.time()
+        with self._lock:
+            self._phases[name] = {"status": "running", "started": begin - self.started}
+        try:
+            yield
+        except Exception as e:
+            self._end(name, begin, "failed", str(e))
+            raise
+        self._end(name, begin, "done")
+
+    def _end(self, name: str, begin: float, status: str, error: str | None = None):
+        with self._lock:
+            entry = self._phases[name]
+            entry["status"] = status
+            entry["seconds"] = time.time() - begin
+            if error is not None:
+                entry["error"] = error
+
+    def status(self, name: str) -> str | None:
+        entry = self._phases.get(name)
+        return entry["status"] if entry is not None else None
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "uptime": time.time() - self.started,
+                "phases": {name: dict(entry) for name, entry in self._phases.items()},
+            }
+
+
+startup = StartupTracker()
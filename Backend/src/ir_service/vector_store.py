@@ -0,0 +1,172 @@
+import os
+import threading
+import numpy as np
+
+from src.ir_service.config import VECTOR_STORAGE, RERANK_K
+
+
+class ExactVectorStore:
+    """
+    Append-only, on-disk store of the full-precision float32 embeddings.
+
+    Used when the FAISS index holds compressed codes (float16 / SQ / PQ): the
+    first search pass runs on the codes and the top candidates are re-scored
+    against the exact vectors here. Vectors live in `<base>.f32` (raw rows) and
+    their IDs in `<base>.ids`; reads go through a read-only memory map. When
+    an ID is written more than once, the last row wins.
+    """
+
+    def __init__(self, base_path: str, dim: int = 512):
+        self.vectors_path = f"{base_path}.f32"
+        self.ids_path = f"{base_path}.ids"
+        self.dim = dim
+
+        self._lock = threading.Lock()
+        self._generation: int | None = None
+        self._vectors: np.ndarray | None = None
+        self._sorted_ids: np.ndarray | None = None
+        self._rows: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.ids_path):
+            return 0
+        return os.path.getsize(self.ids_path) // 8
+
+    def append(self, ids: np.ndarray, emb: np.ndarray):
+        """Persist exact vectors for `ids` (rows of `emb`)."""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        emb = np.ascontiguousarray(emb, dtype=np.float32)
+        with self._lock:
+            # Vectors first: a reader never sees an ID without its row
+            with open(self.vectors_path, "ab") as f:
+                f.write(emb.tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(ids.tobytes())
+
+    def _refresh(self):
+        generation = len(self)
+        if generation == self._generation:
+            return
+
+        with self._lock:
+            if generation == self._generation:
+                return
+            # Appends only extend the files; anything else (compaction, a
+            # cleared store) reloads every ID
+            if self._generation is not None and generation > self._generation:
+                start, sorted_ids, rows = self._generation, self._sorted_ids, self._rows
+            else:
+                start, sorted_ids, rows = 0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+            if generation == 0:
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+                tail = np.zeros(0, dtype=np.int64)
+            else:
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(generation, self.dim))
+                tail = np.fromfile(self.ids_path, dtype=np.int64, count=generation - start, offset=start * 8)
+
+            # Keep the last row written for every ID: within the new tail, then over older rows
+            tail_ids, first_in_reversed = np.unique(tail[::-1], return_index=True)
+            tail_rows = generation - 1 - first_in_reversed
+
+            if len(sorted_ids) and len(tail_ids):
+                pos = np.minimum(np.searchsorted(sorted_ids, tail_ids), len(sorted_ids) - 1)
+                replaced = pos[sorted_ids[pos] == tail_ids]
+                keep = np.ones(len(sorted_ids), dtype=bool)
+                keep[replaced] = False
+                sorted_ids, rows = sorted_ids[keep], rows[keep]
+
+            at = np.searchsorted(sorted_ids, tail_ids)
+            self._sorted_ids = np.insert(sorted_ids, at, tail_ids)
+            self._rows = np.insert(rows, at, tail_rows)
+            self._generation = generation
+
+    def lookup(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return (vectors, found) for `ids`; rows of IDs that are not stored are
+        zero and flagged False in `found`.
+        """
+        self._refresh()
+        ids = np.asarray(ids, dtype=np.int64)
+
+        vectors = np.zeros((len(ids), self.dim), dtype=np.float32)
+        if len(self._sorted_ids) == 0:
+            return vectors, np.zeros(len(ids), dtype=bool)
+
+        pos = np.minimum(np.searchsorted(self._sorted_ids, ids), len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == ids
+        if found.any():
+            vectors[found] = self._vectors[self._rows[pos[found]]]
+        return vectors, found
+
+    def rerank(self, q_emb: np.ndarray, distances: np.ndarray, ids: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Re-score FAISS candidates (`distances`, `ids` as returned by
+        `index.search`) with exact inner products and keep the best `k` per query.
+        """
+        out_d = np.full((len(q_emb), k), -np.inf, dtype=np.float32)
+        out_i = np.full((len(q_emb), k), -1, dtype=np.int64)
+
+        for row, (q, cand_d, cand_i) in enumerate(zip(q_emb, distances, ids)):
+            valid = cand_i >= 0
+            cand_d, cand_i = cand_d[valid].astype(np.float32), cand_i[valid]
+
+            vectors, found = self.lookup(cand_i)
+            scores = np.where(found, vectors @ q, cand_d)
+
+            order = np.argsort(-scores)[:k]
+            out_d[row, :len(order)] = scores[order]
+            out_i[row, :len(order)] = cand_i[order]
+
+        return out_d, out_i
+
+    def clear(self):
+        """Remove every stored vector."""
+        with self._lock:
+            self._vectors = None
+            for path in (self.vectors_path, self.ids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._generation = None
+
+    def compact(self, live_ids: np.ndarray):
+        """Rewrite the store keeping only the latest row of each ID in `live_ids`."""
+        self._refresh()
+        live_ids = np.unique(np.asarray(live_ids, dtype=np.int64))
+        vectors, found = self.lookup(live_ids)
+        live_ids, vectors = live_ids[found], vectors[found]
+
+        with self._lock:
+            # Drop the memory map before replacing the files underneath it
+            self._vectors = None
+            for path, data in ((self.vectors_path, vectors), (self.ids_path, live_ids)):
+                tmp_path = f"{path}.tmp"
+                data.tofile(tmp_path)
+                os.replace(tmp_path, path)
+            self._generation = None
+
+        print(f"Compacted exact vector store to {len(live_ids)} vectors")
+
+
+def exact_store_enabled() -> bool:
+    return VECTOR_STORAGE != "float32" and RERANK_K > 0
+
+
+def exact_store_base(index_path: str) -> str:
+    return f"{os.path.splitext(index_path)[0]}.exact"
+
+
+_stores: dict[str, ExactVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_exact_store(index_path: str = "faiss_index.idx") -> ExactVectorStore | None:
+    """The exact vector store paired with `index_path`, or None when re-ranking is off."""
+    if not exact_store_enabled():
+        return None
+
+    with _stores_lock:
+        store = _stores.get(index_path)
+        if store is None:
+            store = _stores[index_path] = ExactVectorStore(exact_store_base(index_path))
+    return store
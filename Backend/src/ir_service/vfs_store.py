@@ -0,0 +1,246 @@
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping, Iterator
+
+from src.ir_service.config import VFS_DB_PATH
+
+_COLUMNS = ("filename", "path", "last_modified", "size", "extension", "content_hash")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id        INTEGER PRIMARY KEY,
+    path          TEXT NOT NULL UNIQUE,
+    filename      TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    size          INTEGER NOT NULL,
+    extension     TEXT NOT NULL,
+    content_hash  TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    path          TEXT PRIMARY KEY,
+    last_modified REAL NOT NULL,
+    size          INTEGER NOT NULL,
+    error         TEXT NOT NULL
+);
+"""
+
+
+def _row_metadata(row: sqlite3.Row | tuple) -> dict:
+    return dict(zip(_COLUMNS, row))
+
+
+class VfsStore:
+    """
+    Virtual file system metadata in SQLite (WAL mode), one row per document.
+
+    Lookups by doc id and by path are indexed; crawls write only the rows
+    they change, in a single transaction, so readers (each thread has its
+    own connection) see either the previous or the new state. Also holds the
+    next free doc id, and the files that failed to index (with the mtime and
+    size they had), so crawls do not retry them until they change.
+    """
+
+    def __init__(self, path: str = VFS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, doc_id: int) -> dict | None:
+        row = self._conn().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return _row_metadata(row) if row is not None else None
+
+    def doc_id_of(self, path: str) -> int | None:
+        row = self._conn().execute("SELECT doc_id FROM documents WHERE path = ?", (path,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def doc_ids(self) -> Iterator[int]:
+        for (doc_id,) in self._conn().execute("SELECT doc_id FROM documents ORDER BY doc_id"):
+            yield doc_id
+
+    def paths(self, prefix: str = "") -> Iterator[tuple[str, int]]:
+        """(path, doc_id) of every document whose path starts with `prefix`."""
+        if not prefix:
+            cursor = self._conn().execute("SELECT path, doc_id FROM documents")
+        else:
+            # Range scan on the path index instead of LIKE (which ignores it)
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            cursor = self._conn().execute(
+                "SELECT path, doc_id FROM documents WHERE path >= ? AND path < ?", (prefix, upper)
+            )
+        yield from cursor
+
+    def content_hashes(self, among: set[str] | None = None) -> set[str]:
+        """Content hashes of the stored documents, or only those of `among` that are still used (indexed lookups)."""
+        if among is None:
+            return {h for (h,) in self._conn().execute("SELECT DISTINCT content_hash FROM documents WHERE content_hash IS NOT NULL")}
+
+        among = list(among)
+        found = set()
+        # SQLite caps the number of bound parameters per statement
+        for i in range(0, len(among), 500):
+            chunk = among[i:i + 500]
+            found.update(h for (h,) in self._conn().execute(
+                f"SELECT DISTINCT content_hash FROM documents WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        return found
+
+    def failure_of(self, path: str) -> dict | None:
+        """{"last_modified", "size", "error"} of `path` if it failed to index, else None."""
+        row = self._conn().execute("SELECT last_modified, size, error FROM failures WHERE path = ?", (path,)).fetchone()
+        return dict(zip(("last_modified", "size", "error"), row)) if row is not None else None
+
+    def failed_paths(self, prefix: str = "") -> list[str]:
+        """Paths starting with `prefix` that failed to index."""
+        if not prefix:
+            cursor = self._conn().execute("SELECT path FROM failures")
+        else:
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            cursor = self._conn().execute("SELECT path FROM failures WHERE path >= ? AND path < ?", (prefix, upper))
+        return [path for (path,) in cursor]
+
+    def next_doc_id(self) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'next_doc_id'").fetchone()
+        return row[0] if row is not None else 0
+
+    def get_setting(self, key: str) -> str | None:
+        """Indexing settings the stored documents were built with (e.g. the chunking signature)."""
+        row = self._conn().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_setting(self, key: str, value: str):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def apply(
+        self,
+        upserts: dict[int, dict],
+        deletes: list[int],
+        next_doc_id: int | None = None,
+        failures: dict[str, dict] | None = None,
+        cleared_failures: set[str] | None = None,
+    ):
+        """
+        Write a crawl's changes in one transaction. `failures` maps the paths
+        that failed to index to their metadata and "error"; the failures of
+        upserted paths and of `cleared_failures` are dropped.
+        """
+        cleared = set(cleared_failures or ()) | {m["path"] for m in upserts.values()}
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                if cleared:
+                    conn.executemany("DELETE FROM failures WHERE path = ?", [(path,) for path in cleared])
+                if failures:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO failures (path, last_modified, size, error) VALUES (?, ?, ?, ?)",
+                        [(path, m["last_modified"], m["size"], m["error"]) for path, m in failures.items()],
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in deletes])
+                if upserts:
+                    # A path may move to a new doc id: free it first
+                    conn.executemany(
+                        "DELETE FROM documents WHERE path = ? AND doc_id != ?",
+                        [(m["path"], doc_id) for doc_id, m in upserts.items()],
+                    )
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO documents (doc_id, {', '.join(_COLUMNS)}) VALUES (?, {', '.join('?' * len(_COLUMNS))})",
+                        [(doc_id, *(m.get(c) for c in _COLUMNS)) for doc_id, m in upserts.items()],
+                    )
+                if next_doc_id is not None:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_doc_id', ?)", (next_doc_id,))
+
+    def clear(self):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM documents")
+                conn.execute("DELETE FROM failures")
+
+    def migrate_json(self, json_path: str) -> bool:
+        """
+        Import a legacy `(index, vfs_by_docId, vfs_by_path)` JSON file into an
+        empty store; the file is kept as `<json_path>.bak`.
+        """
+        if not os.path.exists(json_path) or len(self) > 0:
+            return False
+
+        with open(json_path, "r") as f:
+            index, vfs_by_docId, _ = json.load(f)
+        self.apply({int(doc_id): metadata for doc_id, metadata in vfs_by_docId.items()}, [], index)
+        os.replace(json_path, f"{json_path}.bak")
+        print(f"Migrated {len(vfs_by_docId)} documents from '{json_path}' to '{self.path}'")
+        return True
+
+
+class DocsView(Mapping):
+    """Read-only `doc_id (str) -> metadata` mapping backed by the store."""
+
+    def __init__(self, store: VfsStore):
+        self.store = store
+
+    def __getitem__(self, doc_id) -> dict:
+        try:
+            metadata = self.store.get(int(doc_id))
+        except (TypeError, ValueError):
+            metadata = None
+        if metadata is None:
+            raise KeyError(doc_id)
+        return metadata
+
+    def __iter__(self) -> Iterator[str]:
+        return (str(doc_id) for doc_id in self.store.doc_ids())
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+class PathsView(Mapping):
+    """Read-only `path -> doc_id (str)` mapping backed by the store."""
+
+    def __init__(self, store: VfsStore):
+        self.store = store
+
+    def __getitem__(self, path: str) -> str:
+        doc_id = self.store.doc_id_of(path)
+        if doc_id is None:
+            raise KeyError(path)
+        return str(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return (path for path, _ in self.store.paths())
+
+    def __len__(self) -> int:
+        return len(self.store)
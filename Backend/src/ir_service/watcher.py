@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+
+from src.ir_service.config import (
+    WATCH_ENABLED,
+    WATCH_DEBOUNCE,
+    WATCH_MIN_INTERVAL,
+    WATCH_MAX_BATCH
+)
+from src.ir_service.file_crawler import (
+    DOCUMENT_DIR,
+    DEFAULT_WHITELIST,
+    normalize_path,
+    sync_paths
+)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class DebouncedQueue:
+    """
+    Paths waiting to be re-indexed, keyed by the time of their last event.
+
+    A path is only handed out once it has been quiet for `debounce` seconds,
+    so the burst of events an editor produces on save (truncate, write,
+    rename of a temp file, ...) collapses into a single re-index.
+    """
+
+    def __init__(self, debounce: float = WATCH_DEBOUNCE):
+        self.debounce = debounce
+        self._pending: dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def put(self, path: str):
+        with self._cond:
+            self._pending[normalize_path(path)] = time.monotonic()
+            self._cond.notify()
+
+    def take(self, max_items: int, stop: threading.Event) -> list[str]:
+        """Block until some paths have settled (or `stop` is set) and return at most `max_items` of them."""
+        with self._cond:
+            while not stop.is_set():
+                now = time.monotonic()
+                ready = [p for p, t in self._pending.items() if now - t >= self.debounce]
+                if ready:
+                    ready = ready[:max_items]
+                    for path in ready:
+                        del self._pending[path]
+                    return ready
+
+                # Sleep until the oldest pending path settles
+                timeout = None
+                if self._pending:
+                    timeout = max(self.debounce - (now - min(self._pending.values())), 0.01)
+                self._cond.wait(timeout)
+            return []
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, queue: DebouncedQueue, whitelist: set[str]):
+        self.queue = queue
+        self.whitelist = whitelist
+
+    def _wanted(self, path: str, is_directory: bool) -> bool:
+        return is_directory or os.path.splitext(path)[1] in self.whitelist
+
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "modified", "deleted", "moved"):
+            return
+        # A directory's own "modified" event only means its listing changed;
+        # the entries involved get events of their own
+        if event.is_directory and event.event_type == "modified":
+            return
+
+        if self._wanted(event.src_path, event.is_directory):
+            self.queue.put(event.src_path)
+        dest_path = getattr(event, "dest_path", "")
+        if dest_path and self._wanted(dest_path, event.is_directory):
+            self.queue.put(dest_path)
+
+
+class FileWatcher:
+    """
+    Keeps the index up to date while the server runs.
+
+    Filesystem events (inotify / FSEvents / ReadDirectoryChangesW through
+    watchdog) are debounced into a queue; a background thread re-indexes the
+    settled paths with `sync_paths`, at most `max_batch` files per run and
+    at most one run every `min_interval` seconds so indexing does not compete
+    with searches for the CPU.
+    """
+
+    def __init__(
+        self,
+        root: str = DOCUMENT_DIR,
+        whitelist: set[str] = None,
+        debounce: float = WATCH_DEBOUNCE,
+        min_interval: float = WATCH_MIN_INTERVAL,
+        max_batch: int = WATCH_MAX_BATCH,
+    ):
+        self.root = root
+        self.whitelist = whitelist if whitelist is not None else DEFAULT_WHITELIST
+        self.min_interval = min_interval
+        self.max_batch = max_batch
+
+        self.queue = DebouncedQueue(debounce)
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def start(self):
+        self._observer = Observer()
+        self._observer.schedule(_EventHandler(self.queue, self.whitelist), self.root, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+
+        self._thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+        self._thread.start()
+        print(f"Watching '{self.root}' for changes")
+
+    def stop(self):
+        self._stop.set()
+        self.queue.wake()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            paths = self.queue.take(self.max_batch, self._stop)
+            if not paths:
+                continue
+
+            started = time.monotonic()
+            try:
+                stats = sync_paths(paths, self.whitelist)
+                print(f"Watcher re-indexed {len(paths)} path(s): {stats}")
+            except Exception as e:
+                print(f"Warning: Watcher failed to index {paths}: {e}")
+
+            # Rate limit: leave the CPU to searches between runs
+            self._stop.wait(max(0.0, self.min_interval - (time.monotonic() - started)))
+
+
+def start_watcher(root: str = DOCUMENT_DIR) -> FileWatcher | None:
+    """Start watching `root`, or return None if disabled or watchdog is not installed."""
+    if not WATCH_ENABLED:
+        return None
+    if Observer is None:
+        print("Warning: watchdog is not installed, new files are only indexed on /refresh")
+        return None
+    if not os.path.isdir(root):
+        print(f"Warning: '{root}' does not exist, not watching it")
+        return None
+
+    watcher = FileWatcher(root)
+    watcher.start()
+    return watcher
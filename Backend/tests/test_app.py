@@ -0,0 +1,59 @@
+import io
+import numpy as np
+import pytest
+
+from src.app import app
+from src.ir_service import embeddings
+from src.ir_service.index_layout import offset
+from src.ir_service.index_store import IndexWriter
+from src.ir_service.query_cache import QueryEmbeddingCache, text_key
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client over a small index in `tmp_path`, with the query "hello" already embedded."""
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3, 512)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    writer = IndexWriter(shards=1)
+    writer.add(vectors, np.arange(3) * offset)
+    writer.commit()
+    # Served from a fresh query cache (the global one is restored afterwards), so no CLIP model is needed
+    monkeypatch.setattr(embeddings, "query_cache", QueryEmbeddingCache())
+    monkeypatch.setattr(embeddings, "encoder_signature", lambda: "torch")
+    embeddings.query_cache.put(f"torch/{text_key('hello')}", vectors[:1])
+    return app.test_client()
+
+
+@pytest.mark.parametrize("k", [0, -3])
+def test_search_batch_rejects_k_below_one(client, k):
+    response = client.post("/search/batch", json={"queries": ["hello"], "k": k})
+    assert response.status_code == 400
+
+
+def test_search_batch_reports_unreadable_images_per_query(client):
+    response = client.post("/search/batch", json={"queries": ["hello", "hello"], "k": 2})
+    assert response.status_code == 200
+
+    response = client.post(
+        "/search/batch",
+        data={"queries": ["hello"], "k": "2", "images": [(io.BytesIO(b"not an image"), "x.png")]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    text_result, image_result = response.get_json()
+    assert "error" not in text_result
+    assert "Unreadable image" in image_result["error"]
+
+
+def test_search_batch_never_reads_query_strings_as_server_files(client, tmp_path):
+    from PIL import Image
+    Image.new("RGB", (8, 8)).save(tmp_path / "secret.png")
+    # Only the text embedding is cached: reading the file would need the model
+    embeddings.query_cache.put(f"torch/{text_key('secret.png')}", np.ones((1, 512), dtype=np.float32) / np.sqrt(512))
+
+    response = client.post("/search/batch", json={"queries": ["secret.png"], "k": 2})
+    assert response.status_code == 200
+    assert "error" not in response.get_json()[0]
@@ -0,0 +1,61 @@
+import io
+
+import fitz
+from docx import Document
+from PIL import Image
+
+from src.ir_service.document_parser import parse_tasks, parse_document
+
+
+def _png(color: tuple[int, int, int]) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _image_tasks(tasks: list) -> list:
+    return [task for task in tasks if task is not None and task[0] == "images"]
+
+
+def test_pdf_images_are_split_into_bounded_tasks_and_extracted_once(tmp_path):
+    file_path = str(tmp_path / "logos.pdf")
+    logo = _png((255, 0, 0))
+    with fitz.open() as doc:
+        for i in range(5):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Page {i}.")
+            # The same logo on every page, plus one picture per page
+            page.insert_image(fitz.Rect(0, 0, 64, 64), stream=logo)
+            page.insert_image(fitz.Rect(100, 100, 164, 164), stream=_png((0, 40 * i, 0)))
+        doc.save(file_path)
+
+    tasks = parse_tasks(file_path, task_pages=2, batch_size=2)
+    assert [task for task in tasks if task[0] == "pages"] == [("pages", 0, 2), ("pages", 2, 4), ("pages", 4, 5)]
+    image_tasks = _image_tasks(tasks)
+    assert all(len(task[1]) <= 2 for task in image_tasks)
+
+    hashes = []
+    for task in tasks:
+        parsed = parse_document(file_path, 0, task=task)
+        assert not (parsed["sentences"] and parsed["images"])
+        hashes.extend(parsed["image_hashes"])
+    assert len(hashes) == len(set(hashes)) == 6
+
+
+def test_docx_images_are_parsed_as_separate_tasks(tmp_path):
+    file_path = str(tmp_path / "report.docx")
+    doc = Document()
+    doc.add_paragraph("A report with pictures.")
+    for i in range(3):
+        doc.add_picture(io.BytesIO(_png((0, 0, 80 * i))))
+    doc.add_picture(io.BytesIO(_png((0, 0, 0))))
+    doc.save(file_path)
+
+    tasks = parse_tasks(file_path, batch_size=2)
+    assert tasks[0] == ("text",)
+    assert [len(task[1]) for task in _image_tasks(tasks)] == [2, 1]
+
+    text = parse_document(file_path, 0, task=tasks[0])
+    assert text["num_sentences"] == 1 and not text["images"]
+    images = [parse_document(file_path, 0, task=task)["images"] for task in tasks[1:]]
+    assert [len(batch) for batch in images] == [2, 1]
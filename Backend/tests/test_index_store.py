@@ -0,0 +1,148 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.ir_service.index_layout import offset, read_manifest, read_centroid_ranges
+from src.ir_service.index_store import IndexWriter, get_search_indexes, get_search_snapshot, publish_doc_limit
+from src.ir_service.index_tools import is_exact, export_vectors, train_index
+from src.ir_service.vector_store import ExactVectorStore, exact_store_base
+
+DIM = 32
+
+
+def _vectors(rng: np.random.Generator, n: int) -> np.ndarray:
+    emb = rng.standard_normal((n, DIM)).astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def _add_docs(writer: IndexWriter, rng: np.random.Generator, doc_ids: range, per_doc: int):
+    for doc_id in doc_ids:
+        writer.add(_vectors(rng, per_doc), doc_id * offset + np.arange(per_doc))
+
+
+@pytest.mark.parametrize("factory, storage", [("IVF64,Flat", "float32"), ("Flat", "pq8")])
+def test_small_index_stays_exact_until_it_can_be_trained(tmp_path, factory, storage):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(0)
+
+    writer = IndexWriter(index_path, dim=DIM, shards=1, factory=factory, storage=storage)
+    _add_docs(writer, rng, range(4), 10)
+    writer.commit()
+
+    text = get_search_indexes(index_path)["text"]
+    assert text.ntotal == 40
+    assert is_exact(text)
+    _, ids = text.search(_vectors(rng, 1), 5)
+    assert (ids >= 0).all()
+
+    # Crossing the training minimum (64 lists / 256 PQ centroids) builds the configured layout
+    writer = IndexWriter(index_path, dim=DIM, shards=1, factory=factory, storage=storage)
+    _add_docs(writer, rng, range(4, 30), 10)
+    writer.commit()
+
+    text = get_search_indexes(index_path)["text"]
+    assert text.ntotal == 300
+    assert not is_exact(text)
+    assert text.is_trained
+    _, ids = text.search(_vectors(rng, 1), 5)
+    assert (ids >= 0).all()
+
+
+def test_deleted_documents_stay_tombstones_when_others_are_reindexed(tmp_path):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(0)
+    writer = IndexWriter(index_path, dim=DIM, shards=1)
+    _add_docs(writer, rng, range(3), 4)
+    writer.commit()
+
+    # Delete doc 0, re-index doc 1 in the same session
+    writer = IndexWriter(index_path, dim=DIM, shards=1)
+    writer.remove_docs([0, 1])
+    _add_docs(writer, rng, range(1, 2), 2)
+    writer.commit()
+
+    assert read_manifest(index_path)["tombstones"] == [0]
+    stored_docs = faiss.vector_to_array(writer.partitions["text"].index.id_map) // offset
+    assert sorted(stored_docs.tolist()) == [0, 0, 0, 0, 1, 1, 2, 2, 2, 2]
+
+
+def test_new_documents_are_hidden_until_their_doc_limit_is_published(tmp_path):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(0)
+
+    # A crawl adds docs 0-2; the VFS has not listed them yet
+    writer = IndexWriter(index_path, dim=DIM, shards=1)
+    writer.hide_docs_from(0)
+    _add_docs(writer, rng, range(3), 2)
+    writer.commit()
+    assert get_search_snapshot(index_path)[1].tolist() == [0, 1, 2]
+
+    publish_doc_limit(index_path, 3)
+    assert get_search_snapshot(index_path)[1].tolist() == []
+
+    # The next crawl's VFS commit fails: doc 3 stays hidden...
+    writer = IndexWriter(index_path, dim=DIM, shards=1)
+    writer.hide_docs_from(3)
+    _add_docs(writer, rng, range(3, 4), 2)
+    writer.commit()
+    assert get_search_snapshot(index_path)[1].tolist() == [3]
+
+    # ...and its vectors are replaced when the doc id is handed out again
+    writer = IndexWriter(index_path, dim=DIM, shards=1)
+    writer.hide_docs_from(3)
+    _add_docs(writer, rng, range(3, 4), 1)
+    writer.commit()
+    publish_doc_limit(index_path, 4)
+
+    indexes, hidden = get_search_snapshot(index_path)
+    assert hidden.tolist() == []
+    stored_docs = faiss.vector_to_array(indexes["text"].id_map) // offset
+    assert sorted(stored_docs.tolist()) == [0, 0, 1, 1, 2, 2, 3]
+
+
+def test_centroids_are_published_with_their_vector_ranges(tmp_path):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(2)
+    image_id = int(0.9 * offset)
+
+    writer = IndexWriter(index_path, dim=DIM, shards=2)
+    writer.add(_vectors(rng, 3), np.array([0, 1, 2]))
+    # Numbered with gaps (e.g. parse tasks): the range is stored, not inferred
+    writer.add(_vectors(rng, 3), offset + np.array([4, 5, 9]))
+    writer.add(_vectors(rng, 2), offset + image_id + np.array([2, 3]))
+    writer.commit()
+
+    ranges = read_centroid_ranges(index_path, read_manifest(index_path))
+    assert ranges.tolist() == [[2, 0, 2], [offset + 9, offset + 4, offset + 9], [offset + image_id + 3, offset + image_id + 2, offset + image_id + 3]]
+
+    writer = IndexWriter(index_path, dim=DIM, shards=2)
+    writer.remove_docs([1])
+    writer.compact()
+    writer.commit()
+    assert read_centroid_ranges(index_path, read_manifest(index_path)).tolist() == [[2, 0, 2]]
+
+
+def test_retraining_compressed_storage_uses_the_exact_vectors(tmp_path):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(3)
+    vectors = _vectors(rng, 300)
+    ids = np.arange(300) // 10 * offset + np.arange(300) % 10
+
+    writer = IndexWriter(index_path, dim=DIM, shards=1, storage="pq8")
+    writer.add(vectors, ids)
+    writer.commit()
+    generation = read_manifest(index_path)["generation"]
+
+    # Without a float32 copy the decoded codes would become the new "exact" vectors
+    with pytest.raises(ValueError):
+        train_index(index_path, "Flat", storage="sq8")
+    assert read_manifest(index_path)["generation"] == generation
+
+    ExactVectorStore(exact_store_base(index_path), DIM).append(ids, vectors)
+    train_index(index_path, "Flat", storage="sq8")
+    stored, found = ExactVectorStore(exact_store_base(index_path), DIM).lookup(ids)
+    assert found.all() and np.array_equal(stored, vectors)
+
+    train_index(index_path, "Flat", storage="float32")
+    exported_ids, exported = export_vectors(get_search_indexes(index_path)["text"])
+    assert np.array_equal(exported[np.argsort(exported_ids)], vectors)
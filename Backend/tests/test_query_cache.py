@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.ir_service import embeddings, encoders
+from src.ir_service.content_store import ContentStore
+from src.ir_service.query_cache import QueryEmbeddingCache
+
+
+class _FakeEncoder:
+    def __init__(self, signature: str, seed: int):
+        self.signature = signature
+        self.seed = seed
+        self.calls = 0
+
+    def encode_text(self, sentences: list[str]) -> np.ndarray:
+        self.calls += 1
+        return np.random.default_rng(self.seed).standard_normal((len(sentences), 512)).astype(np.float32)
+
+
+def test_cached_query_embeddings_are_kept_per_encoder(monkeypatch):
+    monkeypatch.setattr(embeddings, "query_cache", QueryEmbeddingCache())
+
+    torch_encoder = _FakeEncoder("torch", 0)
+    monkeypatch.setattr(encoders, "_encoder", torch_encoder)
+    first, _ = embeddings.encode_query("Cricket  in Pakistan")
+    again, _ = embeddings.encode_query("cricket in pakistan")
+    assert torch_encoder.calls == 1
+    assert np.array_equal(first, again)
+
+    # e.g. ONNX loading after a run that fell back to PyTorch
+    onnx_encoder = _FakeEncoder("onnx-int8", 1)
+    monkeypatch.setattr(encoders, "_encoder", onnx_encoder)
+    other, _ = embeddings.encode_query("cricket in pakistan")
+    assert onnx_encoder.calls == 1
+    assert not np.array_equal(first, other)
+
+
+def test_content_store_is_namespaced_by_encoder(tmp_path):
+    root = str(tmp_path)
+    assert ContentStore(root, "torch").root == str(tmp_path / "ViT-B-32")
+    assert ContentStore(root, "onnx-int8").root == str(tmp_path / "ViT-B-32-onnx-int8")
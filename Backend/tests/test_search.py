@@ -0,0 +1,88 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.ir_service import embeddings
+from src.ir_service.index_layout import offset
+from src.ir_service.index_store import IndexWriter, get_search_indexes
+from src.ir_service.index_tools import accepts_search_parameters
+
+DIM = 32
+DOCS = 120
+PER_DOC = 3
+
+
+@pytest.fixture
+def pq_index(tmp_path) -> tuple[str, np.ndarray]:
+    """A trained pq8 index of DOCS documents, and each document's vectors."""
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((DOCS, PER_DOC, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=2, keepdims=True)
+
+    writer = IndexWriter(index_path, dim=DIM, shards=1, storage="pq8")
+    for doc_id in range(DOCS):
+        writer.add(vectors[doc_id], doc_id * offset + np.arange(PER_DOC))
+    writer.commit()
+    return index_path, vectors
+
+
+def test_two_stage_search_on_pq_storage(pq_index):
+    index_path, vectors = pq_index
+    text = get_search_indexes(index_path)["text"]
+    assert isinstance(faiss.downcast_index(text.index), faiss.IndexPQ)
+    assert not accepts_search_parameters(text)
+
+    queries = np.ascontiguousarray(vectors[[7, 42], 0])
+    is_image = np.zeros(len(queries), dtype=bool)
+    two_stage = embeddings._search_documents_batch(queries, is_image, index_path, 5, candidates=20)
+    single_stage = embeddings._search_documents_batch(queries, is_image, index_path, 5, candidates=0)
+
+    for doc_id, found, reference in zip([7, 42], two_stage, single_stage):
+        assert len(found) == 5
+        assert found[0][0] == doc_id
+        assert reference[0][0] == doc_id
+
+
+def test_document_filter_on_pq_storage(pq_index):
+    # Hybrid search narrows the vector search to the keyword hits the same way
+    index_path, vectors = pq_index
+    doc_filter = np.array([3, 42, 77, 100], dtype=np.int64)
+    queries = np.ascontiguousarray(vectors[[42, 5], 1])
+    is_image = np.zeros(len(queries), dtype=bool)
+
+    results = embeddings._search_documents_batch(
+        queries, is_image, index_path, len(doc_filter), doc_filter=doc_filter
+    )
+    assert results[0][0][0] == 42
+    for found in results:
+        assert sorted(doc_id for doc_id, _ in found) == sorted(doc_filter.tolist())
+
+
+def test_document_filter_on_flat_storage_scores_the_candidates_directly(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "faiss_index.idx")
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((DOCS, PER_DOC, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=2, keepdims=True)
+    writer = IndexWriter(index_path, dim=DIM, shards=1, storage="float32")
+    for doc_id in range(DOCS):
+        writer.add(vectors[doc_id], doc_id * offset + np.arange(PER_DOC))
+    writer.commit()
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("the flat partition was searched")
+
+    doc_filter = np.array([3, 42, 77, 100], dtype=np.int64)
+    queries = np.ascontiguousarray(vectors[[42, 5], 1])
+    is_image = np.zeros(len(queries), dtype=bool)
+    full = embeddings._search_documents_batch(queries, is_image, index_path, DOCS, candidates=0)
+
+    monkeypatch.setattr(embeddings, "_search", no_scan)
+    results = embeddings._search_documents_batch(
+        queries, is_image, index_path, len(doc_filter), doc_filter=doc_filter
+    )
+    assert results[0][0][0] == 42
+    for found, reference in zip(results, full):
+        expected = [(doc_id, score) for doc_id, score in reference if doc_id in doc_filter]
+        assert [doc_id for doc_id, _ in found] == [doc_id for doc_id, _ in expected]
+        assert np.allclose([score for _, score in found], [score for _, score in expected], atol=1e-5)
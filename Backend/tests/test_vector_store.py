@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.ir_service.vector_store import ExactVectorStore
+
+DIM = 8
+
+
+def _check(store: ExactVectorStore, latest: dict[int, np.ndarray]):
+    ids = np.array(sorted(latest) + [10**9], dtype=np.int64)
+    vectors, found = store.lookup(ids)
+    assert found.tolist() == [True] * len(latest) + [False]
+    assert np.array_equal(vectors[:-1], np.stack([latest[i] for i in sorted(latest)]))
+
+
+def test_appends_are_merged_into_the_lookup_table(tmp_path):
+    store = ExactVectorStore(str(tmp_path / "faiss_index.exact"), dim=DIM)
+    rng = np.random.default_rng(0)
+    latest: dict[int, np.ndarray] = {}
+
+    # Each append rewrites some IDs (also more than once in one batch); the last row wins
+    for _ in range(6):
+        ids = rng.integers(0, 50, size=20)
+        emb = rng.standard_normal((len(ids), DIM)).astype(np.float32)
+        store.append(ids, emb)
+        latest.update(zip(ids.tolist(), emb))
+        _check(store, latest)
+
+    live = sorted(latest)[::2]
+    store.compact(np.array(live))
+    latest = {i: latest[i] for i in live}
+    _check(store, latest)
+
+    store.append(np.array([live[0], 99]), np.ones((2, DIM), dtype=np.float32))
+    latest[live[0]] = latest[99] = np.ones(DIM, dtype=np.float32)
+    _check(store, latest)
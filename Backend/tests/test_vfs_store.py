@@ -0,0 +1,31 @@
+from src.ir_service.vfs_store import VfsStore
+
+
+def _metadata(path: str, last_modified: float = 1.0, size: int = 10) -> dict:
+    return {
+        "filename": path.rsplit("/", 1)[-1],
+        "path": path,
+        "last_modified": last_modified,
+        "size": size,
+        "extension": ".pdf",
+        "content_hash": None,
+    }
+
+
+def test_failures_are_recorded_with_the_crawl_and_cleared_on_success(tmp_path):
+    store = VfsStore(str(tmp_path / "vfs.db"))
+    store.apply({0: _metadata("/data/a.pdf")}, [], 2, failures={"/data/b.pdf": {**_metadata("/data/b.pdf", 2.0, 9), "error": "broken"}})
+
+    assert store.failure_of("/data/b.pdf") == {"last_modified": 2.0, "size": 9, "error": "broken"}
+    assert store.failure_of("/data/a.pdf") is None
+    assert store.failed_paths("/data/") == ["/data/b.pdf"]
+    assert store.failed_paths("/other/") == []
+
+    # Indexed once it changed
+    store.apply({1: _metadata("/data/b.pdf", 3.0)}, [], 2)
+    assert store.failure_of("/data/b.pdf") is None
+
+    store.apply({}, [], failures={"/data/c.pdf": {**_metadata("/data/c.pdf"), "error": "broken"}})
+    store.apply({}, [], cleared_failures={"/data/c.pdf"})
+    assert store.failed_paths() == []
+    assert store.next_doc_id() == 2
@@ -75,7 +75,22 @@ const SearchInterface = () => {
       }
       
       const data = await response.json();
-      setRefreshMessage(data.message || 'Index refreshed successfully');
+
+      // The refresh runs in the background: poll its job until it finishes
+      let job = data;
+      while (job.job_id && (job.status === 'accepted' || job.status === 'queued' || job.status === 'running')) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(`http://localhost:5000/refresh/${job.job_id}`);
+        if (!statusResponse.ok) {
+          throw new Error('Refresh failed. Please try again.');
+        }
+        job = await statusResponse.json();
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Refresh failed. Please try again.');
+      }
+
+      setRefreshMessage(job.status === 'done' ? 'Index refreshed successfully' : (data.message || 'Index refreshed successfully'));
       // Clear previous results when refreshing
       setResults({});
       